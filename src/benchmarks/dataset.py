@@ -0,0 +1,215 @@
+"""生成大规模模拟数据：学生、教师、课程、选课、成绩和作业
+
+同样的参数和随机种子总是生成同样的数据。表结构与应用启动时一致
+（users 表 + mypy.migrations 的全部迁移），生成的文件放到一个目录中并命名为
+edu_system.db，再用 EDU_DATABASE_DIR 指向该目录即可启动应用，所有用户的
+密码都是 PASSWORD。
+
+批量写入在一个事务中用 executemany 完成。所有触发器（容量检查、计数、
+变更日志、版本号）在导入期间临时删除，导入后重新计算
+enrollment_count/assignment_count 并恢复触发器，因此变更日志是空的，
+客户端第一次同步时完整加载。
+
+用法（在 src 目录下）:
+    python -m benchmarks.dataset --out /tmp/edu_large.db --students 100000 --teachers 5000 --courses 3000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mypy.migrations import migrate
+
+PASSWORD = '123456'
+TERM_START = datetime(2024, 3, 1)
+
+TERMS = ('大一', '大二', '大三', '大四')
+WEEKDAYS = ('星期一', '星期二', '星期三', '星期四', '星期五')
+PERIODS = ('8:30-10:10', '10:30-12:10', '14:00-15:40', '16:00-17:40', '19:00-20:40')
+SLOTS = [f'{day} {period}' for day in WEEKDAYS for period in PERIODS]
+
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤'
+GIVEN = '伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英华玉萍红娥玲芬燕彬鹏辉斌宇浩凯健俊帆帅旭宁婷雪琳晨欣怡子涵梓轩博文思远佳琪雨萱'
+SUBJECTS = ('高等数学', '线性代数', '概率论', '大学物理', '程序设计', '数据结构', '操作系统', '计算机网络',
+            '数据库', '编译原理', '软件工程', '人工智能', '机器学习', '离散数学', '大学英语', '体育',
+            '电路分析', '信号与系统', '数字逻辑', '计算机组成原理', '算法设计', '信息安全', '图形学', '分布式系统')
+LEVELS = ('', 'A', 'B', '(一)', '(二)', '实验', '进阶', '专题')
+
+# 用户表由应用的 init_db 创建，不在迁移中
+USERS_DDL = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        role TEXT DEFAULT 'teacher'
+    )
+'''
+
+def build_schema(conn):
+    conn.execute(USERS_DDL)
+    conn.commit()
+    migrate(conn)
+
+def unique_names(rng, count):
+    """生成 count 个不重复的姓名（登录时按姓名对应学生/教师记录）"""
+    names, seen = [], set()
+    while len(names) < count:
+        base = rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN) for _ in range(rng.randint(1, 2)))
+        name, suffix = base, len(names)
+        while name in seen:
+            name = f'{base}{suffix}'
+            suffix += count
+        seen.add(name)
+        names.append(name)
+    return names
+
+def course_rows(rng, count):
+    rows = []
+    for i in range(count):
+        subject = SUBJECTS[i % len(SUBJECTS)]
+        name = f'{subject}{LEVELS[i // len(SUBJECTS) % len(LEVELS)]}'
+        if i >= len(SUBJECTS) * len(LEVELS):
+            name = f'{name}-{i // (len(SUBJECTS) * len(LEVELS))}'
+        usual = rng.choice((10, 20, 30))
+        midterm = rng.choice((20, 30))
+        times = '|'.join(sorted(rng.sample(SLOTS, rng.choice((1, 1, 2, 2, 3)))))
+        capacity = rng.choice((None, 60, 120, 200))
+        rows.append((i + 1, name, TERMS[i % len(TERMS)], rng.choice((1, 2, 2, 3, 3, 4)),
+                     usual, midterm, 100 - usual - midterm, times, capacity))
+    return rows
+
+def pick_courses(rng, candidates, per_student, course_slots, seats):
+    """为一个学生挑选不冲突、未满员的课程"""
+    chosen, taken = [], set()
+    for course_id in rng.sample(candidates, min(len(candidates), per_student * 3)):
+        if len(chosen) >= per_student:
+            break
+        slots = course_slots[course_id]
+        if taken & slots or seats[course_id] == 0:
+            continue
+        chosen.append(course_id)
+        taken |= slots
+        seats[course_id] -= 1
+    return chosen
+
+def suspend_triggers(conn):
+    """删除全部触发器，返回建触发器的语句以便恢复"""
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    return [sql for _, sql in triggers]
+
+def generate(path, students=100000, teachers=5000, courses=3000, courses_per_student=8,
+             assignments_per_course=5, graded_ratio=0.7, seed=1):
+    """在 path 生成数据库（已存在的文件会被覆盖），返回各表行数"""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    build_schema(conn)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+
+    counts = {}
+    conn.execute('BEGIN')
+    triggers = suspend_triggers(conn)
+
+    course_list = course_rows(rng, courses)
+    conn.executemany(
+        'INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score, times, capacity) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', course_list)
+    counts['courses'] = len(course_list)
+
+    # 教师和学生共用 users 表，姓名一起生成以保证不重复
+    names = unique_names(rng, teachers + students)
+    teacher_names, student_names = names[:teachers], names[teachers:]
+    conn.executemany('INSERT INTO teachers (id, name, teacher_id) VALUES (?, ?, ?)',
+                     ((i + 1, name, f'T{i + 1:05d}') for i, name in enumerate(teacher_names)))
+    counts['teachers'] = teachers
+
+    # 每门课程一到两位任课教师
+    teaching = set()
+    for course_id in range(1, courses + 1):
+        for _ in range(rng.choice((1, 1, 1, 2))):
+            teaching.add((rng.randint(1, teachers), course_id))
+    conn.executemany('INSERT INTO teacher_courses (teacher_id, course_id) VALUES (?, ?)', sorted(teaching))
+    counts['teacher_courses'] = len(teaching)
+
+    # 入学年份决定学生所在年级，只选本年级的课程
+    years = [2024 - i % len(TERMS) for i in range(students)]
+    conn.executemany('INSERT INTO students (id, name, student_id, enrollment_year) VALUES (?, ?, ?, ?)',
+                     ((i + 1, name, f'S{years[i]}{i + 1:06d}', years[i]) for i, name in enumerate(student_names)))
+    counts['students'] = students
+
+    course_slots = {row[0]: set(row[7].split('|')) for row in course_list}
+    seats = {row[0]: row[8] if row[8] is not None else -1 for row in course_list}
+    by_term = {term: [row[0] for row in course_list if row[2] == term] for term in TERMS}
+    enrollments, grades = [], []
+    for i in range(students):
+        term = TERMS[2024 - years[i]]
+        for course_id in pick_courses(rng, by_term[term], courses_per_student, course_slots, seats):
+            enrollments.append((i + 1, course_id))
+            if rng.random() < graded_ratio:
+                grades.append((i + 1, course_id, rng.randint(50, 100), rng.randint(40, 100), rng.randint(30, 100)))
+    conn.executemany('INSERT INTO student_courses (student_id, course_id) VALUES (?, ?)', enrollments)
+    conn.executemany('INSERT INTO grades (student_id, course_id, usual_grade, midterm_grade, final_grade) '
+                     'VALUES (?, ?, ?, ?, ?)', grades)
+    counts['student_courses'] = len(enrollments)
+    counts['grades'] = len(grades)
+
+    def assignment_rows():
+        for course_id in range(1, courses + 1):
+            for n in range(1, assignments_per_course + 1):
+                created = TERM_START + timedelta(days=rng.randint(0, 120), hours=rng.randint(8, 22))
+                yield (course_id, f'第{n}次作业', f'完成第{n}章课后习题，按时提交。',
+                       created.strftime('%Y-%m-%d %H:%M:%S'))
+    conn.executemany('INSERT INTO assignments (course_id, title, content, create_time) VALUES (?, ?, ?, ?)',
+                     assignment_rows())
+    counts['assignments'] = courses * assignments_per_course
+
+    users = [('admin', PASSWORD, 'admin')]
+    users.extend((name, PASSWORD, 'teacher') for name in teacher_names)
+    users.extend((name, PASSWORD, 'student') for name in student_names)
+    conn.executemany('INSERT INTO users (username, password, role) VALUES (?, ?, ?)', users)
+    conn.execute("INSERT INTO admins (name, admin_id) VALUES ('admin', 'A00001')")
+    counts['users'] = len(users)
+
+    # 计数直接由生成的数据得出，不必逐门课程扫描 student_courses
+    enrolled = Counter(course_id for _, course_id in enrollments)
+    conn.executemany('UPDATE courses SET enrollment_count = ?, assignment_count = ? WHERE id = ?',
+                     ((enrolled[c], assignments_per_course, c) for c in range(1, courses + 1)))
+    for sql in triggers:
+        conn.execute(sql)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', required=True, help='生成的数据库文件')
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--teachers', type=int, default=5000)
+    parser.add_argument('--courses', type=int, default=3000)
+    parser.add_argument('--courses-per-student', type=int, default=8)
+    parser.add_argument('--assignments-per-course', type=int, default=5)
+    parser.add_argument('--graded-ratio', type=float, default=0.7, help='已录入成绩的选课比例')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate(args.out, args.students, args.teachers, args.courses, args.courses_per_student,
+                      args.assignments_per_course, args.graded_ratio, args.seed)
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    print(json.dumps(counts, ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""数据层微基准：mypy.db_operations 各函数的单次调用开销
+
+覆盖 execute_query / execute_insert / add_record / update_record / get_records，
+包括单行与批量写入、每次新建连接与复用连接、查询缓存命中、行工厂
+（sqlite3.Row、紧凑行对象、元组）、日志模式(DELETE/WAL)以及有无索引的对比。
+数据由 benchmarks.dataset 用固定随机种子生成，请求参数也由固定种子产生；
+每个用例重复多轮，取每次调用耗时的最小值和中位数，结果可与之前的JSON比较。
+
+用法（在 src 目录下）:
+    python -m benchmarks.db_primitives --students 20000 --json after.json
+    python -m benchmarks.db_primitives --only insert --baseline before.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.dataset import generate
+from benchmarks.load_test import git_revision
+
+def timed(fn, calls, rounds):
+    """返回每轮的单次调用耗时（微秒）"""
+    results = []
+    gc.disable()
+    try:
+        fn(0)  # 预热
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for i in range(calls):
+                fn(i)
+            results.append((time.perf_counter() - started) / calls * 1e6)
+    finally:
+        gc.enable()
+    return results
+
+def build_cases(db, path, seed, courses, students):
+    """返回 [(用例名, 准备函数, 调用函数)]；db 为 mypy.db_operations 模块"""
+    rng = random.Random(seed)
+    student_ids = [rng.randint(1, students) for _ in range(4096)]
+    course_ids = [rng.randint(1, courses) for _ in range(4096)]
+    held = sqlite3.connect(path)
+    held_row = sqlite3.connect(path)
+    held_row.row_factory = sqlite3.Row
+
+    grades_index = 'CREATE INDEX idx_grades_course ON grades (course_id)'
+
+    def state(journal='DELETE', indexed=True, cached=False):
+        """用例的完整前置状态：日志模式、成绩表课程索引、查询缓存
+
+        每个用例都显式设置，不依赖前面的用例，--only 单独运行的结果与完整运行一致。
+        """
+        def setup():
+            conn = sqlite3.connect(path)
+            conn.execute(f'PRAGMA journal_mode = {journal}')
+            conn.execute('DROP INDEX IF EXISTS idx_grades_course')
+            if indexed:
+                conn.execute(grades_index)
+            conn.commit()
+            conn.close()
+            db.query_cache.clear()
+            db.query_cache.enabled = cached
+        return setup
+
+    one_student = 'SELECT * FROM students WHERE id = ?'
+    by_course = 'SELECT student_id, usual_grade FROM grades WHERE course_id = ?'
+    new_assignment = 'INSERT INTO assignments (course_id, title, content) VALUES (?, ?, ?)'
+
+    def bulk_insert(rows):
+        def run(i):
+            conn = db.get_db_connection()
+            try:
+                conn.executemany(new_assignment, [(course_ids[(i + n) % 4096], '批量', '') for n in range(rows)])
+                conn.commit()
+            finally:
+                conn.close()
+        return run
+
+    add_assignment = lambda i: db.add_record('assignments', {'course_id': course_ids[i % 4096], 'title': '单行', 'content': ''})
+    update_grade = lambda i: db.update_record('grades', {'usual_grade': i % 100}, {'student_id': student_ids[i % 4096],
+                                                                                  'course_id': course_ids[i % 4096]})
+    insert_assignment = lambda i: db.execute_insert(new_assignment, (course_ids[i % 4096], '单行', ''))
+
+    return [
+        # 读：单行
+        ('query.one_row.cold', state(), lambda i: db.execute_query(one_student, (student_ids[i % 4096],), fetch_all=False)),
+        ('query.one_row.cached', state(cached=True), lambda i: db.execute_query(one_student, (student_ids[i % 64],), fetch_all=False)),
+        ('query.one_row.warm_connection', state(),
+         lambda i: held_row.execute(one_student, (student_ids[i % 4096],)).fetchone()),
+        ('connection.open_close', state(), lambda i: db.get_db_connection().close()),
+        # 读：整表与行工厂
+        ('query.courses.sqlite_row', state(), lambda i: db.execute_query('SELECT * FROM courses')),
+        ('query.courses.typed', state(), lambda i: db.execute_query('SELECT * FROM courses', row_type='CoursesRow')),
+        ('query.courses.tuple_warm', state(), lambda i: held.execute('SELECT * FROM courses').fetchall()),
+        ('get_records.courses', state(), lambda i: db.get_records('courses')),
+        ('get_records.courses.typed', state(), lambda i: db.get_records('courses', typed=True)),
+        ('get_records.student_by_id', state(), lambda i: db.get_records('students', {'id': student_ids[i % 4096]})),
+        # 索引
+        ('query.grades_by_course.indexed', state(),
+         lambda i: db.execute_query(by_course, (course_ids[i % 4096],), use_cache=False)),
+        ('query.grades_by_course.no_index', state(indexed=False),
+         lambda i: db.execute_query(by_course, (course_ids[i % 4096],), use_cache=False)),
+        # 写：单行与批量（DELETE 日志模式，即应用默认）
+        ('insert.single.delete_journal', state(), insert_assignment),
+        ('add_record.single.delete_journal', state(), add_assignment),
+        ('update_record.single.delete_journal', state(), update_grade),
+        ('insert.bulk100.delete_journal', state(), bulk_insert(100)),
+        # 写：WAL 日志模式
+        ('insert.single.wal', state(journal='WAL'), insert_assignment),
+        ('add_record.single.wal', state(journal='WAL'), add_assignment),
+        ('update_record.single.wal', state(journal='WAL'), update_grade),
+        ('insert.bulk100.wal', state(journal='WAL'), bulk_insert(100)),
+    ]
+
+def compare(baseline, current):
+    for name, now in current['cases'].items():
+        before = baseline['cases'].get(name)
+        if before:
+            change = now['median_us'] / before['median_us'] - 1
+            print(f"{name:40} {before['median_us']:10.1f} -> {now['median_us']:10.1f} us ({change:+.0%})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--teachers', type=int, default=1000)
+    parser.add_argument('--courses', type=int, default=600)
+    parser.add_argument('--calls', type=int, default=200, help='每轮调用次数（整表查询自动减少）')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--only', help='只运行名称包含该字符串的用例')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='结果写入指定JSON文件')
+    parser.add_argument('--baseline', help='与之前的结果比较')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'edu_system.db')
+        generate(path, args.students, args.teachers, args.courses, seed=args.seed)
+        # db_operations 在导入时按 EDU_DATABASE_DIR 确定数据库路径
+        os.environ['EDU_DATABASE_DIR'] = tmp
+        from mypy import db_operations as db
+
+        cases = {}
+        for name, setup, fn in build_cases(db, path, args.seed, args.courses, args.students):
+            if args.only and args.only not in name:
+                continue
+            setup()
+            calls = max(args.calls // 20, 5) if '.courses' in name else args.calls
+            samples = timed(fn, calls, args.rounds)
+            cases[name] = {
+                'calls': calls * args.rounds,
+                'min_us': round(min(samples), 1),
+                'median_us': round(statistics.median(samples), 1),
+            }
+            print(f"{name:40} min {cases[name]['min_us']:10.1f} us   median {cases[name]['median_us']:10.1f} us")
+
+    result = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'dataset': {'students': args.students, 'teachers': args.teachers,
+                        'courses': args.courses, 'seed': args.seed},
+        },
+        'cases': cases,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(json.load(f), result)
+
+if __name__ == '__main__':
+    main()
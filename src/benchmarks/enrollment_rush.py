@@ -0,0 +1,135 @@
+"""选课高峰压力测试：大量并发选课请求下验证不会超额选课并测量吞吐量
+
+用法（在 src 目录下）:
+    python -m benchmarks.enrollment_rush --students 3000 --courses 20 --capacity 50 --threads 32
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mypy.migrations import migrate
+from mypy.enrollment import reserve_seat, EnrollmentError
+
+def build_database(path, students, courses, capacity):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany('INSERT INTO students (name, student_id) VALUES (?, ?)',
+                     ((f'学生{i}', f'S{i:06d}') for i in range(students)))
+    # 每门课一个时间段，相邻课程共用时间段以产生时间冲突
+    conn.executemany(
+        'INSERT INTO courses (name, learn_time, credit, usual_score, midterm_score, final_score, times, capacity) '
+        'VALUES (?, ?, 2, 20, 20, 60, ?, ?)',
+        ((f'课程{i}', '大一', f'星期{i // 2 % 5 + 1} 08:00-09:40', capacity) for i in range(courses)))
+    conn.commit()
+    conn.close()
+
+def run(path, students, courses, attempts_per_student, threads, timeout):
+    jobs = [(f'S{s:06d}', random.randint(1, courses))
+            for s in range(students) for _ in range(attempts_per_student)]
+    random.shuffle(jobs)
+    outcomes = Counter()
+    latencies = []
+    lock = threading.Lock()
+    index = [0]
+    start_barrier = threading.Barrier(threads)
+
+    def worker():
+        conn = sqlite3.connect(path, timeout=timeout)
+        conn.row_factory = sqlite3.Row
+        local = Counter()
+        local_latencies = []
+        start_barrier.wait()
+        while True:
+            with lock:
+                if index[0] >= len(jobs):
+                    break
+                student_id, course_id = jobs[index[0]]
+                index[0] += 1
+            started = time.perf_counter()
+            try:
+                reserve_seat(conn, student_id, course_id)
+                local['enrolled'] += 1
+            except EnrollmentError as e:
+                local[e.message.split('：')[0]] += 1
+            except sqlite3.OperationalError as e:
+                local[f'error: {e}'] += 1
+            local_latencies.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            outcomes.update(local)
+            latencies.extend(local_latencies)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return len(jobs), elapsed, outcomes, sorted(latencies)
+
+def verify(path):
+    """检查没有课程超额，且计数与选课记录一致，返回违规课程列表"""
+    conn = sqlite3.connect(path)
+    rows = conn.execute('''
+        SELECT c.id, c.capacity, c.enrollment_count,
+            (SELECT COUNT(*) FROM student_courses sc WHERE sc.course_id = c.id)
+        FROM courses c
+    ''').fetchall()
+    conn.close()
+    return [r for r in rows if r[3] > r[1] or r[3] != r[2]]
+
+def percentile(values, p):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=3000)
+    parser.add_argument('--courses', type=int, default=20)
+    parser.add_argument('--capacity', type=int, default=50)
+    parser.add_argument('--attempts', type=int, default=2, help='每个学生的选课次数')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=30, help='等待写锁的秒数')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='结果写入指定JSON文件')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rush.db')
+        build_database(path, args.students, args.courses, args.capacity)
+        total, elapsed, outcomes, latencies = run(
+            path, args.students, args.courses, args.attempts, args.threads, args.timeout)
+        violations = verify(path)
+
+    result = {
+        'attempts': total,
+        'threads': args.threads,
+        'seconds': round(elapsed, 3),
+        'attempts_per_second': round(total / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'outcomes': dict(outcomes),
+        'overbooked_courses': len(violations)
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if violations:
+        print('发现超额或计数不一致的课程:', violations)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
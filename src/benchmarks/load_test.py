@@ -0,0 +1,391 @@
+"""接口压测：多个已登录会话并发访问 /api 接口，统计各接口的吞吐量和延迟分位数
+
+默认用 benchmarks.dataset 生成数据（或 --dataset 指定已有文件），复制到临时
+目录后通过 EDU_DATABASE_DIR 启动应用（本进程内的多线程服务器）；也可以用
+--url 压测已经运行的服务，此时 --dataset 需要指向该服务使用的数据库，用于
+挑选登录账号和请求参数。写接口会修改数据，不要对生产库使用 --url。
+
+每个客户端以一个角色登录，按权重随机选择该角色的场景。结果写入 JSON，
+compare 子命令比较两次结果，p95 变慢超过阈值时以状态码 1 退出。
+
+用法（在 src 目录下）:
+    python -m benchmarks.load_test run --students 20000 --clients 24 --duration 30 --json after.json
+    python -m benchmarks.load_test compare before.json after.json --threshold 0.2
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.dataset import generate, PASSWORD
+from benchmarks.enrollment_rush import percentile
+
+class Client:
+    """一个登录会话；scenario 通过 request() 发请求，通过属性保存会话状态"""
+
+    def __init__(self, base_url, role, user, rng):
+        self.base_url = base_url
+        self.role = role
+        self.rng = rng
+        self.__dict__.update(user)
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.created_assignment = None
+        self.dropped_course = None
+
+    def request(self, method, path, body=None):
+        """返回 (状态码, JSON或None)"""
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        try:
+            return status, json.loads(payload)
+        except ValueError:
+            return status, None
+
+    def login(self):
+        status, _ = self.request('POST', '/login', {
+            'username': self.name, 'password': PASSWORD, 'role': self.role})
+        if status != 200:
+            raise RuntimeError(f'{self.role} {self.name} 登录失败: {status}')
+
+    def course(self):
+        return self.rng.choice(self.courses)
+
+def _fill(c, route):
+    """把路由模板中的参数替换为客户端的数据，course_id 随机取客户端的课程"""
+    return re.sub(r'<(\w+)>', lambda m: str(c.course() if m.group(1) == 'course_id' else getattr(c, m.group(1))), route)
+
+def _toggle_enrollment(c):
+    """退掉一门已选课程，下一次再选回来，数据量保持不变"""
+    route = '/api/student-courses'
+    if c.dropped_course is None:
+        c.dropped_course = c.course()
+        return 'DELETE', route, route, {'student_id': c.student_id, 'course_id': c.dropped_course}
+    course_id, c.dropped_course = c.dropped_course, None
+    return 'POST', route, route, {'student_id': c.student_id, 'course_id': course_id}
+
+def _toggle_assignment(c):
+    """发布作业，下一次删除（发布成功后 run() 记下作业ID）"""
+    if c.created_assignment is None:
+        return 'POST', '/api/assignments', '/api/assignments', {
+            'course_id': c.course(), 'title': '压测作业', 'content': '压测'}
+    assignment_id, c.created_assignment = c.created_assignment, None
+    return 'DELETE', '/api/assignments/<assignment_id>', f'/api/assignments/{assignment_id}', None
+
+def _save_grade(c):
+    student_id, course_id = c.rng.choice(c.roster)
+    grades = [{'course_id': course_id, 'usual_grade': c.rng.randint(60, 100),
+               'midterm_grade': c.rng.randint(60, 100), 'final_grade': c.rng.randint(60, 100)}]
+    return 'POST', '/api/grades', '/api/grades', {'student_id': student_id, 'grades': grades}
+
+def _batch(c):
+    requests = [{'method': 'GET', 'path': path} for path in (
+        '/api/current-user', f'/api/courses/{c.course()}/students', f'/api/courses/{c.course()}/assignments')]
+    return 'POST', '/api/batch', '/api/batch', {'requests': requests}
+
+# 各角色的场景：(权重, 'GET', 路由模板[, 查询字符串]) 或 (权重, 函数)；
+# 函数返回 (方法, 路由模板, 路径, 请求体)。统计按 "方法 路由模板" 汇总。
+SCENARIOS = {
+    'student': [
+        (3, 'GET', '/api/students/<student_id>/courses'),
+        (3, 'GET', '/api/students/<student_id>/grades'),
+        (3, 'GET', '/api/students/<student_id>/assignment-feed'),
+        (2, 'GET', '/api/courses/<course_id>/assignments'),
+        (1, 'GET', '/api/students/<student_id>/profile'),
+        (1, 'GET', '/api/waitlist/<course_id>/position'),
+        (1, 'GET', '/api/current-user'),
+        (1, 'GET', '/api/courses'),
+        (2, _toggle_enrollment),
+    ],
+    'teacher': [
+        (2, 'GET', '/api/teacher-courses/current'),
+        (3, 'GET', '/api/teacher/dashboard'),
+        (1, 'GET', '/api/teachers/<teacher_id>/courses'),
+        (3, 'GET', '/api/courses/<course_id>/students'),
+        (2, 'GET', '/api/courses/<course_id>/assignments'),
+        (1, 'GET', '/api/teachers/<teacher_id>/profile'),
+        (1, 'GET', '/api/exports/<kind>', 'course_id=<course_id>'),
+        (1, 'GET', '/api/course-grades'),
+        (3, _save_grade),
+        (2, _toggle_assignment),
+    ],
+    'admin': [
+        (2, 'GET', '/api/courses'),
+        (1, 'GET', '/api/teachers'),
+        (1, 'GET', '/api/students'),
+        (2, 'GET', '/api/changes', 'since=0&limit=200'),
+        (1, 'GET', '/api/db/metrics'),
+        (1, 'GET', '/api/archive/terms'),
+        (1, 'GET', '/api/snapshot'),
+        (1, 'GET', '/api/admins/<admin_id>/profile'),
+        (1, _batch),
+    ],
+}
+
+def next_request(c, scenario):
+    """按场景生成一个请求：(方法, 路由模板, 路径, 请求体)"""
+    if callable(scenario[1]):
+        return scenario[1](c)
+    method, route = scenario[1], scenario[2]
+    path = _fill(c, route)
+    if len(scenario) > 3:
+        path += '?' + _fill(c, scenario[3])
+    return method, route, path, None
+
+def _sample(conn, rng, query, count):
+    """从查询结果中按随机种子抽取 count 个ID，保证每次压测使用同样的账号"""
+    ids = [row[0] for row in conn.execute(query)]
+    return rng.sample(ids, min(count, len(ids)))
+
+def load_users(path, per_role, seed):
+    """从数据库中挑选每个角色的登录账号，并带上生成请求参数需要的数据"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    users = {'student': [], 'teacher': [], 'admin': []}
+    try:
+        all_courses = [r['id'] for r in conn.execute('SELECT id FROM courses ORDER BY id')]
+        student_ids = _sample(conn, rng, """
+            SELECT s.id FROM students s JOIN users u ON u.username = s.name AND u.role = 'student'
+            WHERE EXISTS (SELECT 1 FROM student_courses sc WHERE sc.student_id = s.id)
+            ORDER BY s.id
+        """, per_role)
+        for pk in student_ids:
+            s = conn.execute('SELECT name, student_id FROM students WHERE id = ?', (pk,)).fetchone()
+            courses = [r[0] for r in conn.execute(
+                'SELECT course_id FROM student_courses WHERE student_id = ? ORDER BY course_id', (pk,))]
+            users['student'].append({'name': s['name'], 'student_id': s['student_id'], 'courses': courses})
+
+        teacher_ids = _sample(conn, rng, """
+            SELECT t.id FROM teachers t JOIN users u ON u.username = t.name AND u.role = 'teacher'
+            WHERE EXISTS (SELECT 1 FROM teacher_courses tc JOIN student_courses sc ON sc.course_id = tc.course_id
+                          WHERE tc.teacher_id = t.id)
+            ORDER BY t.id
+        """, per_role)
+        for pk in teacher_ids:
+            t = conn.execute('SELECT name, teacher_id FROM teachers WHERE id = ?', (pk,)).fetchone()
+            courses = [r[0] for r in conn.execute(
+                'SELECT course_id FROM teacher_courses WHERE teacher_id = ? ORDER BY course_id', (pk,))]
+            roster = [(r[0], r[1]) for r in conn.execute("""
+                SELECT s.student_id, sc.course_id FROM teacher_courses tc
+                JOIN student_courses sc ON sc.course_id = tc.course_id
+                JOIN students s ON s.id = sc.student_id
+                WHERE tc.teacher_id = ? ORDER BY sc.course_id, sc.student_id LIMIT 200
+            """, (pk,))]
+            users['teacher'].append({'name': t['name'], 'teacher_id': t['teacher_id'], 'kind': 'roster',
+                                     'courses': courses, 'roster': roster})
+
+        admin = conn.execute("SELECT name, admin_id FROM admins WHERE name IN "
+                             "(SELECT username FROM users WHERE role = 'admin')").fetchone()
+        if admin:
+            users['admin'].append({'name': admin['name'], 'admin_id': admin['admin_id'], 'courses': all_courses})
+    finally:
+        conn.close()
+    return users
+
+def run(base_url, users, clients, duration, seed):
+    """clients 个客户端按角色轮流分配，运行 duration 秒，返回 {场景: [(延迟, 状态码)]}"""
+    roles = [role for role in ('student', 'teacher', 'admin') if users[role]]
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    workers = []
+    for n in range(clients):
+        role = roles[n % len(roles)]
+        pool = users[role]
+        client = Client(base_url, role, pool[n // len(roles) % len(pool)], random.Random(seed + n))
+        client.login()
+        workers.append(client)
+
+    deadline = time.perf_counter() + duration
+
+    def drive(client):
+        scenarios = SCENARIOS[client.role]
+        weights = [s[0] for s in scenarios]
+        local = defaultdict(list)
+        while time.perf_counter() < deadline:
+            method, route, path, body = next_request(client, client.rng.choices(scenarios, weights)[0])
+            started = time.perf_counter()
+            status, payload = client.request(method, path, body)
+            local[f'{method} {route}'].append((time.perf_counter() - started, status))
+            if route == '/api/assignments' and status == 200:
+                client.created_assignment = payload['data']['id']
+        with lock:
+            for name, values in local.items():
+                samples[name].extend(values)
+
+    threads = [threading.Thread(target=drive, args=(client,)) for client in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+def summarize(samples, elapsed):
+    routes = {}
+    for name, values in sorted(samples.items()):
+        latencies = sorted(v[0] for v in values)
+        routes[name] = {
+            'requests': len(values),
+            'requests_per_second': round(len(values) / elapsed, 1),
+            'client_errors': sum(1 for v in values if 400 <= v[1] < 500),
+            'server_errors': sum(1 for v in values if v[1] >= 500),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    total = sum(r['requests'] for r in routes.values())
+    return {'requests': total, 'requests_per_second': round(total / elapsed, 1), 'routes': routes}
+
+def uncovered_routes(app):
+    """应用中没有压测场景的 /api 接口（删除实体、归档等破坏性接口不压测）"""
+    covered = set()
+    for scenarios in SCENARIOS.values():
+        for scenario in scenarios:
+            if callable(scenario[1]):
+                continue
+            covered.add(f'{scenario[1]} {scenario[2]}')
+    # 读写切换的场景各覆盖两个接口
+    covered.update(('POST /api/student-courses', 'DELETE /api/student-courses', 'POST /api/grades',
+                    'POST /api/assignments', 'DELETE /api/assignments/<assignment_id>', 'POST /api/batch'))
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if not rule.rule.startswith('/api'):
+            continue
+        route = re.sub(r'<\w+:', '<', rule.rule)
+        missing.extend(f'{method} {route}' for method in sorted(rule.methods - {'HEAD', 'OPTIONS'})
+                       if f'{method} {route}' not in covered)
+    return sorted(missing)
+
+def serve(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current, threshold):
+    """按场景比较 p95，返回变慢超过阈值的场景列表"""
+    regressions = []
+    for name, now in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if not before or not before['p95_ms']:
+            continue
+        change = now['p95_ms'] / before['p95_ms'] - 1
+        flag = '  <-- 变慢' if change > threshold else ''
+        print(f"{name:55} p95 {before['p95_ms']:8.2f} -> {now['p95_ms']:8.2f} ms ({change:+.0%}){flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+def command_run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'edu_system.db')
+        if args.dataset:
+            shutil.copyfile(args.dataset, path)
+        else:
+            generate(path, args.students, args.teachers, args.courses, seed=args.seed)
+        users = load_users(args.dataset if args.url else path, args.sessions, args.seed)
+
+        server = None
+        base_url = args.url
+        missing = []
+        if not base_url:
+            # 应用在导入时按 EDU_DATABASE_DIR 打开数据库
+            os.environ['EDU_DATABASE_DIR'] = tmp
+            from edu_sys_main import app
+            server = serve(app)
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            missing = uncovered_routes(app)
+        started = time.perf_counter()
+        try:
+            samples = run(base_url, users, args.clients, args.duration, args.seed)
+        finally:
+            if server:
+                server.shutdown()
+        elapsed = time.perf_counter() - started
+
+    result = summarize(samples, elapsed)
+    result['meta'] = {
+        'revision': git_revision(),
+        'clients': args.clients,
+        'sessions_per_role': args.sessions,
+        'duration': args.duration,
+        'dataset': args.dataset or {'students': args.students, 'teachers': args.teachers,
+                                    'courses': args.courses, 'seed': args.seed},
+        'uncovered_routes': missing
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            if compare(json.load(f), result, args.threshold):
+                sys.exit(1)
+
+def command_compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    if compare(baseline, current, args.threshold):
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='执行压测')
+    run_parser.add_argument('--dataset', help='已有的数据库文件（会复制后使用）')
+    run_parser.add_argument('--url', help='压测已运行的服务，如 http://127.0.0.1:5000')
+    run_parser.add_argument('--students', type=int, default=20000)
+    run_parser.add_argument('--teachers', type=int, default=1000)
+    run_parser.add_argument('--courses', type=int, default=600)
+    run_parser.add_argument('--clients', type=int, default=24, help='并发客户端数')
+    run_parser.add_argument('--sessions', type=int, default=8, help='每个角色登录的账号数')
+    run_parser.add_argument('--duration', type=float, default=30, help='压测秒数')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--json', help='结果写入指定JSON文件')
+    run_parser.add_argument('--baseline', help='与之前的结果比较')
+    run_parser.add_argument('--threshold', type=float, default=0.2, help='p95 允许变慢的比例')
+    run_parser.set_defaults(handler=command_run)
+
+    compare_parser = commands.add_parser('compare', help='比较两次压测结果')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='p95 允许变慢的比例')
+    compare_parser.set_defaults(handler=command_compare)
+
+    args = parser.parse_args()
+    if args.command == 'run' and args.url and not args.dataset:
+        parser.error('--url 需要同时指定 --dataset')
+    args.handler(args)
+
+if __name__ == '__main__':
+    main()
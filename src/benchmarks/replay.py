@@ -0,0 +1,232 @@
+"""回放录制的请求：在数据库副本上按原来的顺序和间隔重放，并对比录制时和回放时的延迟与错误
+
+请求由 mypy.recorder 录制（启动服务时设置 EDU_RECORD=1）。回放前用备份API把
+--dataset 复制到临时目录，把副本中所有账号的密码改为 benchmarks.dataset.PASSWORD，
+然后按记录中的角色和身份编号登录对应的账号；未登录的请求不带会话。
+--dataset 应该是录制开始时的数据库副本（如当时的备份），这样回放时新建记录的
+自增编号才能和录制时一致，后续引用这些编号的请求才会得到同样的结果。
+
+--speed 用来压缩时间：10 表示按录制间隔的 1/10 发送，0 表示不等待。同一会话的
+请求按录制顺序依次发送，会话按身份分配到 --workers 个发送线程。
+统计按 "方法 路由模板" 汇总。录制时的耗时是服务端的处理时间，回放的耗时是
+客户端测得的时间（含 HTTP 开销）；状态码与录制时不同的请求单独计数。
+比较两个版本时，在两个版本上分别回放，再用 compare 子命令比较两次回放的结果。
+
+用法（在 src 目录下）:
+    python -m benchmarks.replay run ../database/recordings --dataset backup.db --speed 10 --json new.json
+    python -m benchmarks.replay compare old.json new.json --threshold 0.2
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.dataset import PASSWORD
+from benchmarks.load_test import Client, summarize, compare, serve, git_revision
+
+# 角色 -> (表, 身份编号列)，按编号找到登录用的姓名
+ACCOUNT_TABLES = {
+    'student': ('students', 'student_id'),
+    'teacher': ('teachers', 'teacher_id'),
+    'admin': ('admins', 'admin_id'),
+}
+
+def log_files(paths):
+    """展开目录中的录制文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.jsonl.gz'))))
+        else:
+            files.append(path)
+    return files
+
+def prepare_database(dataset, path, sessions):
+    """复制数据库并统一账号密码，返回 {(角色, 身份编号): 姓名}"""
+    source = sqlite3.connect(f'file:{dataset}?mode=ro', uri=True)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+        target.execute('UPDATE users SET password = ?', (PASSWORD,))
+        target.commit()
+        accounts = {}
+        for role, actor in sessions:
+            if role not in ACCOUNT_TABLES or actor is None:
+                continue
+            table, column = ACCOUNT_TABLES[role]
+            row = target.execute(f'SELECT name FROM {table} WHERE {column} = ?', (actor,)).fetchone()
+            if row:
+                accounts[(role, actor)] = row[0]
+    finally:
+        source.close()
+        target.close()
+    return accounts
+
+def session_client(base_url, role, name):
+    """录制中一个会话对应的客户端；账号不存在或登录失败时返回None"""
+    if role is None:
+        return Client(base_url, None, {}, None)
+    if name is None:
+        return None
+    client = Client(base_url, role, {'name': name}, None)
+    try:
+        client.login()
+    except RuntimeError as e:
+        print(e)
+        return None
+    return client
+
+def replay(base_url, records, accounts, speed=1.0, workers=32):
+    """按录制的间隔发送请求
+
+    返回 ({场景: [(延迟, 状态码, 录制时的状态码)]}, 跳过的请求数, 耗时秒数)。
+    """
+    queues = [[] for _ in range(workers)]
+    for record in records:
+        # crc32 而不是 hash()，每次回放会话分到同一个线程
+        queues[zlib.crc32(f'{record[4]}:{record[5]}'.encode()) % workers].append(record)
+    first = records[0][0] if records else 0
+    samples = defaultdict(list)
+    skipped = [0]
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def drive(queue):
+        clients, local, skip = {}, defaultdict(list), 0
+        for arrived, method, route, path, role, actor, body, status, _ in queue:
+            if speed:
+                delay = started + (arrived - first) / 1000 / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            key = (role, actor)
+            if key not in clients:
+                clients[key] = session_client(base_url, role, accounts.get(key))
+            client = clients[key]
+            if client is None:
+                skip += 1
+                continue
+            sent = time.perf_counter()
+            replayed, _ = client.request(method, path, body)
+            local[f'{method} {route or path}'].append((time.perf_counter() - sent, replayed, status))
+        with lock:
+            for name, values in local.items():
+                samples[name].extend(values)
+            skipped[0] += skip
+
+    threads = [threading.Thread(target=drive, args=(queue,)) for queue in queues if queue]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, skipped[0], time.perf_counter() - started
+
+def recorded_samples(records):
+    """录制时的 {场景: [(耗时, 状态码)]}"""
+    samples = defaultdict(list)
+    for _, method, route, path, _, _, _, status, duration in records:
+        samples[f'{method} {route or path}'].append((duration / 1000, status))
+    return samples
+
+def side_by_side(result):
+    recorded, replayed = result['recorded']['routes'], result['replayed']['routes']
+    print(f"{'场景':55} {'请求数':>6}   {'录制 p50/p95/p99 ms':>24}   {'回放 p50/p95/p99 ms':>24}   错误(录制->回放)  状态不同")
+    for name in sorted(set(recorded) | set(replayed)):
+        before, after = recorded.get(name), replayed.get(name)
+        latency = lambda r: f"{r['p50_ms']:.1f}/{r['p95_ms']:.1f}/{r['p99_ms']:.1f}" if r else '-'
+        errors = lambda r: r['client_errors'] + r['server_errors'] if r else 0
+        print(f"{name:55} {(before or after)['requests']:>6}   {latency(before):>24}   {latency(after):>24}"
+              f"   {errors(before):>6} -> {errors(after):<6}   {result['status_mismatches'].get(name, 0)}")
+
+def command_run(args):
+    files = log_files(args.logs)
+    with tempfile.TemporaryDirectory() as tmp:
+        # mypy 在导入时按 EDU_DATABASE_DIR 确定数据库路径，导入前设置；回放的请求不再录制
+        os.environ['EDU_DATABASE_DIR'] = tmp
+        os.environ['EDU_RECORD'] = '0'
+        from mypy.recorder import read_records
+        records = read_records(files)
+        if args.limit:
+            records = records[:args.limit]
+        if not records:
+            sys.exit('没有可回放的请求')
+        sessions = {(record[4], record[5]) for record in records}
+        accounts = prepare_database(args.dataset, os.path.join(tmp, 'edu_system.db'), sessions)
+        from edu_sys_main import app
+        server = serve(app)
+        try:
+            samples, skipped, elapsed = replay(f'http://127.0.0.1:{server.server_port}', records,
+                                               accounts, args.speed, args.workers)
+        finally:
+            server.shutdown()
+
+    span = max((records[-1][0] - records[0][0]) / 1000, 0.001)
+    mismatches = {name: sum(1 for _, replayed, status in values if replayed != status)
+                  for name, values in samples.items()}
+    result = {
+        'recorded': summarize(recorded_samples(records), span),
+        'replayed': summarize(samples, elapsed),
+        'status_mismatches': {name: n for name, n in sorted(mismatches.items()) if n},
+        'meta': {
+            'revision': git_revision(),
+            'logs': files,
+            'dataset': args.dataset,
+            'speed': args.speed,
+            'requests': len(records),
+            'skipped': skipped,
+            'recorded_seconds': round(span, 3),
+            'replay_seconds': round(elapsed, 3),
+        }
+    }
+    side_by_side(result)
+    print(json.dumps(result['meta'], ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            if compare(json.load(f)['replayed'], result['replayed'], args.threshold):
+                sys.exit(1)
+
+def command_compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    if compare(baseline['replayed'], current['replayed'], args.threshold):
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='回放录制的请求')
+    run_parser.add_argument('logs', nargs='+', help='录制文件或所在目录')
+    run_parser.add_argument('--dataset', required=True, help='录制开始时的数据库副本（会复制后使用）')
+    run_parser.add_argument('--speed', type=float, default=1.0, help='时间压缩倍数，0 表示不等待')
+    run_parser.add_argument('--workers', type=int, default=32, help='发送线程数')
+    run_parser.add_argument('--limit', type=int, help='只回放前若干个请求')
+    run_parser.add_argument('--json', help='结果写入指定JSON文件')
+    run_parser.add_argument('--baseline', help='与之前的回放结果比较')
+    run_parser.add_argument('--threshold', type=float, default=0.2, help='p95 允许变慢的比例')
+    run_parser.set_defaults(handler=command_run)
+
+    compare_parser = commands.add_parser('compare', help='比较两次回放结果')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='p95 允许变慢的比例')
+    compare_parser.set_defaults(handler=command_compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""比较 sqlite3.Row + dict(row) 与紧凑行对象的内存占用和序列化耗时
+
+用法（在 src 目录下）:
+    python -m benchmarks.row_memory --rows 50000
+"""
+import argparse
+import gc
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mypy.rows import Record, RowFactory
+
+def _default(o):
+    if isinstance(o, Record):
+        return o.to_dict()
+    raise TypeError(type(o))
+
+def build_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            learn_time TEXT NOT NULL,
+            credit REAL NOT NULL,
+            usual_score INTEGER NOT NULL,
+            midterm_score INTEGER NOT NULL,
+            final_score INTEGER NOT NULL,
+            times TEXT NOT NULL DEFAULT ''
+        )
+    ''')
+    conn.executemany(
+        'INSERT INTO courses (name, learn_time, credit, usual_score, midterm_score, final_score, times) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((f'课程{i}', '大二', 3.0, 20, 20, 60, '星期二 10:30-12:10|星期四 10:30-12:10')
+         for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+def measure(path, variant):
+    """返回 (峰值内存字节, 取数+序列化耗时秒)"""
+    conn = sqlite3.connect(path)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    if variant == 'dict':
+        # 原处理函数的做法：sqlite3.Row 列表再逐行复制成 dict
+        cursor.row_factory = sqlite3.Row
+        cursor.execute('SELECT * FROM courses')
+        rows = cursor.fetchall()
+        data = [dict(row) for row in rows]
+        body = json.dumps(data)
+    elif variant == 'dict_twice':
+        # 原 get_students：调试日志和响应各转换一次
+        cursor.row_factory = sqlite3.Row
+        cursor.execute('SELECT * FROM courses')
+        rows = cursor.fetchall()
+        logged = [dict(row) for row in rows]
+        data = [dict(row) for row in rows]
+        body = json.dumps(data)
+    else:
+        cursor.row_factory = RowFactory('CoursesRow')
+        cursor.execute('SELECT * FROM courses')
+        rows = cursor.fetchall()
+        body = json.dumps(rows, default=_default)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    conn.close()
+    return peak, elapsed, len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--json', help='结果写入指定JSON文件')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rows.db')
+        build_database(path, args.rows)
+        results = {}
+        for variant in ('dict_twice', 'dict', 'typed'):
+            peak, elapsed, size = measure(path, variant)
+            results[variant] = {
+                'peak_bytes': peak,
+                'bytes_per_row': peak / args.rows,
+                'seconds': elapsed,
+                'json_bytes': size
+            }
+
+    print(f"行数: {args.rows}")
+    print(f"{'方式':<12}{'峰值内存(MB)':>14}{'每行字节':>10}{'耗时(s)':>10}")
+    for variant, r in results.items():
+        print(f"{variant:<12}{r['peak_bytes'] / 1048576:>14.1f}{r['bytes_per_row']:>10.0f}{r['seconds']:>10.3f}")
+    saving = 1 - results['typed']['peak_bytes'] / results['dict']['peak_bytes']
+    print(f"紧凑行对象相比 dict(row) 峰值内存降低 {saving:.0%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'rows': args.rows, 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
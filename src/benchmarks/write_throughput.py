@@ -0,0 +1,104 @@
+"""写入吞吐量对比：每个请求独立连接提交 vs 单写线程合并提交
+
+模拟录入成绩：每个写任务对 grades 执行一次 INSERT OR REPLACE。
+用法（在 src 目录下）:
+    python -m benchmarks.write_throughput --writers 50 --writes 40
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mypy.migrations import migrate
+from mypy.writer import WriteQueue
+
+SAVE_GRADE = '''
+    INSERT OR REPLACE INTO grades (student_id, course_id, usual_grade, midterm_grade, final_grade)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+def build_database(path, students):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score) "
+                 "VALUES (1, '数据库', '大一', 3, 20, 30, 50)")
+    conn.executemany('INSERT INTO students (id, name, student_id) VALUES (?, ?, ?)',
+                     ((i, f'学生{i}', f'S{i:06d}') for i in range(students)))
+    conn.commit()
+    conn.close()
+
+def direct_writer(path, worker, writes, timeout, stats):
+    """原来的做法：每次写入打开连接、提交、关闭"""
+    for n in range(writes):
+        conn = sqlite3.connect(path, timeout=timeout)
+        try:
+            conn.execute(SAVE_GRADE, (worker * writes + n, 1, 80, 80, 80))
+            conn.commit()
+            stats['ok'] += 1
+        except sqlite3.OperationalError:
+            stats['locked'] += 1
+        finally:
+            conn.close()
+
+def queued_writer(write_queue, worker, writes, timeout, stats):
+    for n in range(writes):
+        params = (worker * writes + n, 1, 80, 80, 80)
+        write_queue.run(lambda conn: conn.execute(SAVE_GRADE, params))
+        stats['ok'] += 1
+
+def run(mode, path, writers, writes, timeout):
+    stats = {'ok': 0, 'locked': 0}
+    write_queue = WriteQueue(path, timeout=timeout) if mode == 'queued' else None
+    target = queued_writer if mode == 'queued' else direct_writer
+    first = write_queue if mode == 'queued' else path
+    threads = [threading.Thread(target=target, args=(first, i, writes, timeout, stats))
+               for i in range(writers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    result = {
+        'mode': mode,
+        'writes': stats['ok'],
+        'locked_errors': stats['locked'],
+        'seconds': round(elapsed, 3),
+        'writes_per_second': round(stats['ok'] / elapsed, 1)
+    }
+    if write_queue is not None:
+        result['transactions'] = write_queue.groups
+        result['average_group'] = write_queue.stats()['average_group']
+        write_queue.stop()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=50, help='并发写入线程数')
+    parser.add_argument('--writes', type=int, default=40, help='每个线程的写入次数')
+    parser.add_argument('--timeout', type=float, default=5, help='等待写锁的秒数')
+    parser.add_argument('--json', help='结果写入指定JSON文件')
+    args = parser.parse_args()
+
+    results = []
+    for mode in ('direct', 'queued'):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'writes.db')
+            build_database(path, args.writers * args.writes)
+            results.append(run(mode, path, args.writers, args.writes, args.timeout))
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    speedup = results[1]['writes_per_second'] / results[0]['writes_per_second']
+    print(f"合并提交吞吐量为独立提交的 {speedup:.1f} 倍")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,74 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory, Response
+from flask import copy_current_request_context
+from flask.ctx import RequestContext
+from flask.testing import EnvironBuilder
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
 from flask_cors import CORS
 import sqlite3
 import os
 import sys
 import time  # 添加时间模块导入
+import random
 from functools import wraps
+from urllib.parse import quote, urlsplit
 
 # 添加项目根目录到Python路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from mypy.config import DATABASE_PATH
+from mypy.config import (
+    DATABASE_PATH, BATCH_MAX_REQUESTS, CHANGES_PAGE_SIZE, FEED_PAGE_SIZE, FEED_MAX_PAGE_SIZE, METRICS_TOKEN,
+    METRICS_PUBLIC, PROFILE_SECRET, PROFILE_TOKEN_MAX_TTL
+)
 from mypy.db_operations import (
     get_db_connection, execute_query, execute_insert,
     execute_update, execute_delete, add_record,
-    update_record, delete_record, get_records
+    update_record, delete_record, get_records,
+    shared_connection, schema_catalog, query_cache
+)
+from mypy.migrations import migrate
+from mypy.rows import Record, use_typed_rows
+from mypy.exports import export_stream
+from mypy.snapshot import snapshot_manager
+from mypy.archive import (
+    archive_term, close_term, TermOpenError, history_sources, course_history_sources,
+    list_archived_terms
 )
+from mypy.enrollment import reserve_seat, EnrollmentError
+from mypy.waitlist import join_waitlist, leave_waitlist, waitlist_position, waitlist_worker
+from mypy.writer import run_write, write_queue, after_commit
+from mypy.authz import authz_index
+from mypy.resilience import DatabaseBusy, QueryTimeout, db_metrics, take_unavailable
+from mypy.changes import changes_since, current_version, change_log_pruner
+from mypy.versioning import row_etag, expected_version
+from mypy.dashboard import teacher_dashboard
+from mypy.feed import assignment_feed
+from mypy.metrics import metrics, sqlite_file_gauges
+from mypy.profiling import (
+    profiler, make_token, verify_token, token_subject, PROFILE_HEADER, PROFILE_MODES, TOKEN_MODES
+)
+from mypy.recorder import recorder, identity
 
 app = Flask(__name__, static_url_path='/static')
 
+# JSON序列化时直接支持紧凑行对象，处理函数无需先转换成dict列表
+class JSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+app.json = JSONProvider(app)
+
 # CORS配置
 CORS(app, supports_credentials=True, resources={
     r"/api/*": {
         "origins": ["http://localhost:5000", "http://127.0.0.1:5000"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type"],
+        "allow_headers": ["Content-Type", "If-None-Match", "If-Match"],
+        "expose_headers": ["ETag"],
         "supports_credentials": True
     }
 })
@@ -35,6 +79,119 @@ app.secret_key = 'your_secret_key'
 def get_db():
     return get_db_connection()
 
+# 报表和导出查询使用的连接：启用分析快照时读只读快照，否则读主库
+def get_analytics_db():
+    if snapshot_manager.enabled:
+        return snapshot_manager.connect()
+    return get_db()
+
+# 记录每个请求的耗时和状态码；最先注册的after_request最后执行，耗时包含其余处理。
+# 请求级的状态放在 request.environ 中：批量请求的子请求与外层请求共用同一个 g
+@app.before_request
+def start_request_timer():
+    request.environ['edu.request_started'] = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = request.environ.pop('edu.request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        metrics.record_request(request.method, route, response.status_code, time.perf_counter() - started)
+        metrics.start()
+    return response
+
+# 已有统计的组件在写入指标文件时一并上报
+def component_metrics():
+    cache = query_cache.stats()
+    authz = authz_index.stats()
+    writer = write_queue.stats()
+    result = [
+        ('edu_query_cache_requests_total', (('result', 'hit'),), cache['hits']),
+        ('edu_query_cache_requests_total', (('result', 'miss'),), cache['misses']),
+        ('edu_query_cache_evictions_total', (), cache['evictions']),
+        ('edu_query_cache_invalidations_total', (), cache['invalidations']),
+        ('edu_query_cache_entries', (), cache['entries']),
+        ('edu_query_cache_bytes', (), cache['bytes']),
+        ('edu_authz_index_requests_total', (('result', 'hit'),), authz['hits']),
+        ('edu_authz_index_requests_total', (('result', 'load'),), authz['loads']),
+        ('edu_authz_index_entries', (('kind', 'teacher'),), authz['teachers']),
+        ('edu_authz_index_entries', (('kind', 'student'),), authz['students']),
+        ('edu_writer_jobs_total', (), writer['jobs']),
+        ('edu_writer_groups_total', (), writer['groups']),
+        ('edu_writer_queued', (), writer['queued']),
+    ]
+    for event, operations in db_metrics.snapshot().items():
+        for operation, count in operations.items():
+            result.append(('edu_db_busy_events_total', (('event', event), ('operation', operation)), count))
+    return result
+
+metrics.add_collector(component_metrics)
+
+# 请求录制（见 mypy.recorder，EDU_RECORD=1 开启），批量请求的子请求不单独录制
+@app.before_request
+def start_request_record():
+    if recorder.should_record(request.path) and not request.environ.get('edu.batch_item'):
+        request.environ['edu.record'] = (time.time(), time.perf_counter(), identity(session))
+
+@app.after_request
+def record_request(response):
+    recording = request.environ.pop('edu.record', None)
+    if recording is not None:
+        arrived, started, (role, actor) = recording
+        recorder.record(arrived, request.method, request.url_rule.rule if request.url_rule else None,
+                        request.full_path.rstrip('?'), role, actor, request.get_json(silent=True),
+                        response.status_code, time.perf_counter() - started)
+    return response
+
+# 按需性能分析（见 mypy.profiling）：签名请求头、管理员的 _profile 参数或抽样
+def profile_secret():
+    return PROFILE_SECRET or app.secret_key
+
+def requested_profile():
+    """返回本请求的 (模式, 触发方式)，不需要分析时返回None"""
+    token = request.headers.get(PROFILE_HEADER)
+    if token:
+        subject = token_subject(session.get('role'), session.get('username'))
+        mode = verify_token(token, subject, profile_secret())
+        if mode:
+            return mode, 'header'
+    flag = request.args.get('_profile')
+    if flag in PROFILE_MODES and session.get('role') == 'admin':
+        return flag, 'query'
+    if (profiler.sample_rate and request.path.startswith('/api/')
+            and random.random() < profiler.sample_rate):
+        return 'cpu', 'sample'
+    return None
+
+@app.before_request
+def start_request_profile():
+    requested = requested_profile()
+    if requested:
+        run = profiler.begin(*requested)
+        if run is not None:
+            request.environ['edu.profile_run'] = run
+
+@app.after_request
+def finish_request_profile(response):
+    run = request.environ.pop('edu.profile_run', None)
+    if run is not None:
+        run_id = profiler.finish(run, {
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'role': session.get('role')
+        })
+        response.headers['X-Profile-Id'] = run_id
+    return response
+
+@app.teardown_request
+def discard_request_profile(error=None):
+    # 请求异常结束、没有经过after_request时也要停止分析
+    run = request.environ.pop('edu.profile_run', None)
+    if run is not None:
+        profiler.discard(run)
+
 # 添加CORS headers
 @app.after_request
 def after_request(response):
@@ -43,6 +200,43 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+# 为API的GET响应添加ETag，客户端携带If-None-Match且数据未变时返回304
+@app.after_request
+def add_api_etag(response):
+    if (request.method == 'GET' and request.path.startswith('/api/')
+            and response.status_code == 200 and response.is_json
+            and not response.is_streamed):
+        if not response.get_etag()[0]:
+            response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.make_conditional(request)
+    return response
+
+# 数据库忙（重试用尽）或语句超时：返回503，提示客户端稍后重试而不是500
+@app.errorhandler(DatabaseBusy)
+@app.errorhandler(QueryTimeout)
+def handle_database_unavailable(e):
+    print('数据库暂时不可用:', e)
+    message = '查询超时，请稍后重试' if isinstance(e, QueryTimeout) else '数据库繁忙，请稍后重试'
+    response = jsonify({'success': False, 'message': message})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.before_request
+def clear_database_unavailable():
+    take_unavailable()
+
+# 路由的 except Exception 吞掉上面两种异常后返回的500，同样改为503
+# （在CORS和ETag钩子之后注册，先于它们执行）
+@app.after_request
+def convert_database_unavailable(response):
+    if response.status_code == 500:
+        error = take_unavailable()
+        if error is not None:
+            return handle_database_unavailable(error)
+    return response
+
 # 登录检查装饰器
 def login_required(f):
     @wraps(f)
@@ -65,6 +259,34 @@ def role_required(allowed_roles):
         return decorated_function
     return decorator
 
+# 写操作路由装饰器：交给单写线程执行，与同时到达的其他写请求合并提交
+# 处理函数照常使用get_db()、commit()和rollback()；返回错误状态码(>=400)时
+# 本次请求的修改会被回滚
+def serialized_write(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        @copy_current_request_context
+        def job(conn):
+            return app.make_response(f(*args, **kwargs))
+        return run_write(job, failed=lambda response: response.status_code >= 400)
+    return decorated_function
+
+# 乐观并发：客户端在If-Match中带上读取时的ETag，修改前检查行版本
+def client_version(table, row_id):
+    return expected_version(request.if_match, table, row_id)
+
+def precondition_failed():
+    return jsonify({
+        'success': False,
+        'message': '数据已被其他人修改，请刷新后重试'
+    }), 412
+
+# 返回单行数据并附带由版本号生成的ETag
+def versioned_response(payload, table, row):
+    response = jsonify(payload)
+    response.set_etag(row_etag(table, row['id'], row['version']))
+    return response
+
 # 静态文件路由
 @app.route('/static/<path:filename>')
 def serve_static(filename):
@@ -143,11 +365,20 @@ def init_db():
         cursor.execute("ALTER TABLE students_temp RENAME TO students")
     
     conn.commit()
+    
+    # 执行结构迁移，之后表结构目录需要重新加载
+    migrate(conn)
+    schema_catalog.invalidate()
     conn.close()
 
 # 确保在应用启动时创建表
 init_db()
 
+# 登录时补建档案：只有这一步是写操作，交给写线程执行
+def create_profile(table, id_column, name, new_id):
+    run_write(lambda conn: conn.execute(
+        f'INSERT INTO {table} (name, {id_column}) VALUES (?, ?)', (name, new_id)))
+
 # 修改登录路由，简化学生信息关联
 @app.route('/login', methods=['POST'])
 def login():
@@ -183,11 +414,7 @@ def login():
                 new_student_id = f"S{username}{user['id']:04d}"
                 
                 try:
-                    cursor.execute('''
-                        INSERT INTO students (name, student_id) 
-                        VALUES (?, ?)
-                    ''', (username, new_student_id))
-                    conn.commit()
+                    create_profile('students', 'student_id', username, new_student_id)
                     session['student_id'] = new_student_id
                     print(f"为用户 {username} 创建学生记录成功，student_id: {new_student_id}")
                 except Exception as e:
@@ -205,11 +432,7 @@ def login():
                 new_teacher_id = f"T{username}{user['id']:04d}"
                 
                 try:
-                    cursor.execute('''
-                        INSERT INTO teachers (name, teacher_id) 
-                        VALUES (?, ?)
-                    ''', (username, new_teacher_id))
-                    conn.commit()
+                    create_profile('teachers', 'teacher_id', username, new_teacher_id)
                     session['teacher_id'] = new_teacher_id
                     print(f"为用户 {username} 创建教师记录成功，teacher_id: {new_teacher_id}")
                 except Exception as e:
@@ -227,18 +450,19 @@ def login():
                 new_admin_id = f"A{username}{user['id']:04d}"
                 
                 try:
-                    cursor.execute('''
-                        INSERT INTO admins (name, admin_id) 
-                        VALUES (?, ?)
-                    ''', (username, new_admin_id))
-                    conn.commit()
+                    create_profile('admins', 'admin_id', username, new_admin_id)
                     session['admin_id'] = new_admin_id
                     print(f"为用户 {username} 创建管理员记录成功，admin_id: {new_admin_id}")
                 except Exception as e:
                     print(f"创建管理员记录失败: {e}")
+        conn.close()
         
+        # 预先加载课程权限索引
+        authz_index.load(teacher_id=session.get('teacher_id') if role == 'teacher' else None,
+                         student_id=session.get('student_id') if role == 'student' else None)
         return jsonify({'success': True, 'message': '登录成功', 'role': role})
     
+    conn.close()
     return jsonify({'success': False, 'message': '用户名、密码或身份选择错误'})
 
 # 修改注册逻辑，处理学生记录时不指定enrollment_year
@@ -271,103 +495,102 @@ def register():
                     'message': '管理员验证码错误'
                 }), 400
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # 检查用户名是否已存在于相同角色
-        cursor.execute('SELECT 1 FROM users WHERE username = ? AND role = ?', (username, role))
-        if cursor.fetchone():
-            return jsonify({
-                'success': False,
-                'message': f'此用户名已被其他{role}用户使用'
-            }), 400
+        # 检查用户名和写入用户、档案作为一个写任务交给写线程，同名并发注册只有一个成功
+        def create_account(conn):
+            cursor = conn.cursor()
+
+            # 检查用户名是否已存在于相同角色
+            cursor.execute('SELECT 1 FROM users WHERE username = ? AND role = ?', (username, role))
+            if cursor.fetchone():
+                return False
 
-        # 添加新用户
-        cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
-                      (username, password, role))
+            # 添加新用户
+            cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
+                          (username, password, role))
         
-        # 获取新插入用户的ID
-        user_id = cursor.lastrowid
+            # 获取新插入用户的ID
+            user_id = cursor.lastrowid
         
-        # 根据角色在对应表中创建关联记录
-        if role == 'student':
-            # 创建学生ID，格式: S + 用户名 + 用户ID序号
-            student_id = f"S{username}{user_id:04d}"
+            # 根据角色在对应表中创建关联记录
+            if role == 'student':
+                # 创建学生ID，格式: S + 用户名 + 用户ID序号
+                student_id = f"S{username}{user_id:04d}"
             
-            # 检查学生ID是否已存在
-            cursor.execute('SELECT 1 FROM students WHERE student_id = ?', (student_id,))
-            if cursor.fetchone():
-                student_id = f"S{username}{user_id}_{int(time.time())}"  # 确保唯一性
+                # 检查学生ID是否已存在
+                cursor.execute('SELECT 1 FROM students WHERE student_id = ?', (student_id,))
+                if cursor.fetchone():
+                    student_id = f"S{username}{user_id}_{int(time.time())}"  # 确保唯一性
                 
-            try:
-                # 在students表中创建对应记录 - 不指定enrollment_year
-                cursor.execute('''
-                    INSERT INTO students (name, student_id) 
-                    VALUES (?, ?)
-                ''', (username, student_id))
+                try:
+                    # 在students表中创建对应记录 - 不指定enrollment_year
+                    cursor.execute('''
+                        INSERT INTO students (name, student_id) 
+                        VALUES (?, ?)
+                    ''', (username, student_id))
                 
-                print(f"为新注册用户 {username} 创建学生记录，student_id: {student_id}")
-            except Exception as e:
-                # 如果上述插入失败，可能是字段约束问题，尝试使用默认年份
-                print(f"创建学生记录失败: {e}")
-                current_year = time.localtime().tm_year
-                cursor.execute('''
-                    INSERT INTO students (name, student_id, enrollment_year) 
-                    VALUES (?, ?, ?)
-                ''', (username, student_id, current_year))
-                print(f"使用默认年份创建学生记录: {student_id}, 年份: {current_year}")
+                    print(f"为新注册用户 {username} 创建学生记录，student_id: {student_id}")
+                except Exception as e:
+                    # 如果上述插入失败，可能是字段约束问题，尝试使用默认年份
+                    print(f"创建学生记录失败: {e}")
+                    current_year = time.localtime().tm_year
+                    cursor.execute('''
+                        INSERT INTO students (name, student_id, enrollment_year) 
+                        VALUES (?, ?, ?)
+                    ''', (username, student_id, current_year))
+                    print(f"使用默认年份创建学生记录: {student_id}, 年份: {current_year}")
             
-        elif role == 'teacher':
-            # 创建教师ID，格式: T + 用户名 + 用户ID序号
-            teacher_id = f"T{username}{user_id:04d}"
+            elif role == 'teacher':
+                # 创建教师ID，格式: T + 用户名 + 用户ID序号
+                teacher_id = f"T{username}{user_id:04d}"
             
-            # 检查教师ID是否已存在
-            cursor.execute('SELECT 1 FROM teachers WHERE teacher_id = ?', (teacher_id,))
-            if cursor.fetchone():
-                teacher_id = f"T{username}{user_id}_{int(time.time())}"  # 确保唯一性
+                # 检查教师ID是否已存在
+                cursor.execute('SELECT 1 FROM teachers WHERE teacher_id = ?', (teacher_id,))
+                if cursor.fetchone():
+                    teacher_id = f"T{username}{user_id}_{int(time.time())}"  # 确保唯一性
                 
-            # 在teachers表中创建对应记录
-            cursor.execute('''
-                INSERT INTO teachers (name, teacher_id) 
-                VALUES (?, ?)
-            ''', (username, teacher_id))
+                # 在teachers表中创建对应记录
+                cursor.execute('''
+                    INSERT INTO teachers (name, teacher_id) 
+                    VALUES (?, ?)
+                ''', (username, teacher_id))
             
-            print(f"为新注册用户 {username} 创建教师记录，teacher_id: {teacher_id}")
+                print(f"为新注册用户 {username} 创建教师记录，teacher_id: {teacher_id}")
         
-        elif role == 'admin':
-            # 创建管理员ID，格式: A + 用户名 + 用户ID序号
-            admin_id = f"A{username}{user_id:04d}"
+            elif role == 'admin':
+                # 创建管理员ID，格式: A + 用户名 + 用户ID序号
+                admin_id = f"A{username}{user_id:04d}"
             
-            # 检查管理员ID是否已存在
-            cursor.execute('SELECT 1 FROM admins WHERE admin_id = ?', (admin_id,))
-            if cursor.fetchone():
-                admin_id = f"A{username}{user_id}_{int(time.time())}"  # 确保唯一性
+                # 检查管理员ID是否已存在
+                cursor.execute('SELECT 1 FROM admins WHERE admin_id = ?', (admin_id,))
+                if cursor.fetchone():
+                    admin_id = f"A{username}{user_id}_{int(time.time())}"  # 确保唯一性
                 
-            # 在admins表中创建对应记录
-            cursor.execute('''
-                INSERT INTO admins (name, admin_id) 
-                VALUES (?, ?)
-            ''', (username, admin_id))
+                # 在admins表中创建对应记录
+                cursor.execute('''
+                    INSERT INTO admins (name, admin_id) 
+                    VALUES (?, ?)
+                ''', (username, admin_id))
             
-            print(f"为新注册用户 {username} 创建管理员记录，admin_id: {admin_id}")
+                print(f"为新注册用户 {username} 创建管理员记录，admin_id: {admin_id}")
         
-        conn.commit()
+            return True
+
+        if not run_write(create_account):
+            return jsonify({
+                'success': False,
+                'message': f'此用户名已被其他{role}用户使用'
+            }), 400
         return jsonify({
             'success': True,
             'message': '注册成功'
         })
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         print('注册失败:', e)
         return jsonify({
             'success': False,
             'message': str(e)
         }), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/main')
 @login_required
@@ -464,7 +687,7 @@ def get_courses():
         conn = get_db()
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM courses ORDER BY name")
-        courses = [dict(row) for row in cursor.fetchall()]
+        courses = use_typed_rows(cursor, 'CoursesRow').fetchall()
         
         return jsonify({
             'success': True,
@@ -481,8 +704,18 @@ def get_courses():
     finally:
         conn.close()
 
+# 课程容量：空值表示不限人数
+def parse_capacity(value):
+    if value is None or value == '':
+        return None
+    capacity = int(value)
+    if capacity < 0:
+        raise ValueError('课程容量不能为负数')
+    return capacity
+
 @app.route('/api/courses', methods=['POST'])
 @login_required
+@serialized_write
 def add_course():
     try:
         data = request.get_json()
@@ -506,7 +739,9 @@ def add_course():
             'usual_score': int(data['usual_score']),
             'midterm_score': int(data['midterm_score']),
             'final_score': int(data['final_score']),
-            'times': data.get('times', '')
+            'times': data.get('times', ''),
+            'capacity': parse_capacity(data.get('capacity')),
+            'term': data.get('term') or None
         }
         
         new_id = add_record('courses', course_data)
@@ -532,6 +767,7 @@ def add_course():
 
 @app.route('/api/courses/<int:course_id>', methods=['PUT'])
 @login_required
+@serialized_write
 def update_course(course_id):
     try:
         data = request.get_json()
@@ -547,33 +783,53 @@ def update_course(course_id):
                 'message': '课程名已存在'
             }), 400
             
-        # 更新课程信息
-        sql = """UPDATE courses 
-                SET name=?, learn_time=?, credit=?, 
-                    usual_score=?, midterm_score=?, final_score=?, times=? 
-                WHERE id=?"""
-        cursor.execute(sql, (
+        # 更新课程信息（带If-Match时只在版本号一致时更新）
+        values = [
             data['name'],
             data['learn_time'],
             float(data['credit']),
             int(data['usual_score']),
             int(data['midterm_score']),
             int(data['final_score']),
-            data.get('times', ''),
-            course_id
-        ))
+            data.get('times', '')
+        ]
+        sql = """UPDATE courses 
+                SET name=?, learn_time=?, credit=?, 
+                    usual_score=?, midterm_score=?, final_score=?, times=?,
+                    version = version + 1"""
+        if 'capacity' in data:
+            sql += ", capacity=?"
+            values.append(parse_capacity(data['capacity']))
+        if 'term' in data:
+            sql += ", term=?"
+            values.append(data['term'] or None)
+        sql += " WHERE id=?"
+        values.append(course_id)
+        version = client_version('courses', course_id)
+        if version is not None:
+            sql += " AND version=?"
+            values.append(version)
+        cursor.execute(sql + " RETURNING *", values)
+        updated_course = cursor.fetchone()
+        if not updated_course:
+            cursor.execute("SELECT 1 FROM courses WHERE id = ?", (course_id,))
+            if cursor.fetchone():
+                return precondition_failed()
+            return jsonify({
+                'success': False,
+                'message': '找不到该课程'
+            }), 404
         
         conn.commit()
+        if 'capacity' in data:
+            # 提交后再通知，递补线程才能看到新的容量
+            after_commit(lambda: waitlist_worker.notify(course_id))
         
-        # 获取更新后的课程信息
-        cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-        updated_course = cursor.fetchone()
-        
-        return jsonify({
+        return versioned_response({
             'success': True,
             'message': '课程更新成功',
-            'data': dict(updated_course) if updated_course else None
-        })
+            'data': dict(updated_course)
+        }, 'courses', updated_course)
         
     except Exception as e:
         print('更新课程失败:', e)
@@ -586,6 +842,7 @@ def update_course(course_id):
 
 @app.route('/api/courses/<int:course_id>', methods=['DELETE'])
 @login_required
+@serialized_write
 def delete_course(course_id):
     try:
         conn = get_db()
@@ -607,6 +864,7 @@ def delete_course(course_id):
         cursor.execute('DELETE FROM courses WHERE id = ?', (course_id,))
         
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_course(course_id))
         return jsonify({
             'success': True,
             'message': '课程删除成功'
@@ -628,11 +886,11 @@ def delete_course(course_id):
 @login_required
 def get_students():
     try:
-        students = get_records('students')
-        print("获取到的学生数据:", [dict(student) for student in students])  # 添加调试日志
+        students = get_records('students', typed=True)
+        print("获取到的学生数据:", len(students), "条")  # 添加调试日志
         return jsonify({
             'success': True,
-            'data': [dict(student) for student in students],
+            'data': students,
             'message': '获取学生列表成功'
         })
     except Exception as e:
@@ -647,6 +905,7 @@ def get_students():
 @app.route('/api/students', methods=['POST'])
 @login_required
 @role_required(['admin'])  # 只允许管理员添加学生
+@serialized_write
 def add_student():
     try:
         data = request.get_json()
@@ -718,11 +977,11 @@ def add_student():
 @login_required
 def get_teachers():
     try:
-        teachers = get_records('teachers')
-        print("获取到的教师数据:", [dict(teacher) for teacher in teachers])  # 添加调试日志
+        teachers = get_records('teachers', typed=True)
+        print("获取到的教师数据:", len(teachers), "条")  # 添加调试日志
         return jsonify({
             'success': True,
-            'data': [dict(teacher) for teacher in teachers],
+            'data': teachers,
             'message': '获取教师列表成功'
         })
     except Exception as e:
@@ -736,6 +995,7 @@ def get_teachers():
 @app.route('/api/teachers', methods=['POST'])
 @login_required
 @role_required(['admin'])  # 只允许管理员添加教师
+@serialized_write
 def add_teacher():
     try:
         data = request.get_json()
@@ -806,16 +1066,17 @@ def get_student_courses(student_id):
         # 获取学生选择的课程
         conn = get_db()
         cursor = conn.cursor()
+        history = history_sources(conn)
         
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT c.* 
             FROM courses c
-            JOIN student_courses sc ON c.id = sc.course_id
+            JOIN {history['student_courses']} sc ON c.id = sc.course_id
             JOIN students s ON sc.student_id = s.id
             WHERE s.student_id = ?
         ''', (student_id,))
         
-        courses = [dict(row) for row in cursor.fetchall()]
+        courses = use_typed_rows(cursor, 'CoursesRow').fetchall()
         return jsonify({
             'success': True,
             'data': courses,
@@ -847,7 +1108,7 @@ def get_teacher_courses(teacher_id):
             WHERE t.teacher_id = ?
         ''', (teacher_id,))
         
-        courses = [dict(row) for row in cursor.fetchall()]
+        courses = use_typed_rows(cursor, 'CoursesRow').fetchall()
         return jsonify({
             'success': True,
             'data': courses,
@@ -888,7 +1149,7 @@ def get_current_teacher_courses():
             WHERE t.teacher_id = ?
         ''', (teacher_id,))
         
-        courses = [dict(row) for row in cursor.fetchall()]
+        courses = use_typed_rows(cursor, 'CoursesRow').fetchall()
         return jsonify({
             'success': True,
             'data': courses,
@@ -904,25 +1165,53 @@ def get_current_teacher_courses():
     finally:
         conn.close()
 
+# 教师看板：课程计数、最近作业和成绩录入进度
+@app.route('/api/teacher/dashboard', methods=['GET'])
+@login_required
+@role_required(['teacher', 'admin'])
+def get_teacher_dashboard():
+    """一次返回教师所有课程的选课人数、作业数、最近作业和成绩录入进度"""
+    conn = None
+    try:
+        if session.get('role') == 'teacher':
+            teacher_id = session.get('teacher_id')
+        else:
+            teacher_id = request.args.get('teacher_id')
+        if not teacher_id:
+            return jsonify({
+                'success': False,
+                'message': '未找到教师信息'
+            }), 404
+        recent = min(max(request.args.get('recent', 3, type=int), 0), 20)
+
+        conn = get_db()
+        courses = teacher_dashboard(conn, authz_index.teacher_courses(teacher_id), recent)
+        return jsonify({
+            'success': True,
+            'data': courses,
+            'message': '获取教师看板成功'
+        })
+    except Exception as e:
+        print('获取教师看板失败:', e)
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'data': []
+        }), 500
+    finally:
+        if conn:
+            conn.close()
+
 # 获取特定课程的学生列表
 @app.route('/api/courses/<int:course_id>/students', methods=['GET'])
 @login_required
 def get_course_students(course_id):
     """获取选了特定课程的所有学生"""
+    conn = None
     try:
         # 如果是教师，验证该课程是否是自己教授的
         if session.get('role') == 'teacher':
-            teacher_id = session.get('teacher_id')
-            conn = get_db()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT 1 FROM teacher_courses tc
-                JOIN teachers t ON tc.teacher_id = t.id
-                WHERE t.teacher_id = ? AND tc.course_id = ?
-            ''', (teacher_id, course_id))
-            
-            if not cursor.fetchone():
+            if not authz_index.teaches(session.get('teacher_id'), course_id):
                 return jsonify({
                     'success': False,
                     'message': '您没有权限查看该课程的学生'
@@ -930,15 +1219,16 @@ def get_course_students(course_id):
             
         conn = get_db()
         cursor = conn.cursor()
+        history = course_history_sources(conn, course_id)
         
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT s.* 
             FROM students s
-            JOIN student_courses sc ON s.id = sc.student_id
+            JOIN {history['student_courses']} sc ON s.id = sc.student_id
             WHERE sc.course_id = ?
         ''', (course_id,))
         
-        students = [dict(row) for row in cursor.fetchall()]
+        students = use_typed_rows(cursor, 'StudentsRow').fetchall()
         return jsonify({
             'success': True,
             'data': students,
@@ -952,11 +1242,13 @@ def get_course_students(course_id):
             'data': []
         }), 500
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 # 安排教师课程
 @app.route('/api/teacher-courses', methods=['POST'])
 @login_required
+@serialized_write
 def add_teacher_course():
     try:
         data = request.get_json()
@@ -986,6 +1278,7 @@ def add_teacher_course():
         ''', (data['course_id'], data['teacher_id']))
         
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_teacher(data['teacher_id']))
         return jsonify({
             'success': True,
             'message': '课程安排成功'
@@ -1003,8 +1296,10 @@ def add_teacher_course():
 # 学生选课路由增强
 @app.route('/api/student-courses', methods=['POST'])
 @login_required
+@serialized_write
 def add_student_course():
     """学生选课功能"""
+    conn = None
     try:
         data = request.get_json()
         student_id = data.get('student_id')
@@ -1019,77 +1314,18 @@ def add_student_course():
                 }), 403
         
         conn = get_db()
-        cursor = conn.cursor()
-
-        # 检查学生是否已选这门课
-        cursor.execute('''
-            SELECT 1 FROM student_courses
-            WHERE student_id = (
-                SELECT id FROM students WHERE student_id = ?
-            ) AND course_id = ?
-        ''', (student_id, course_id))
-        
-        if cursor.fetchone():
-            return jsonify({
-                'success': False,
-                'message': '您已经选择了这门课程'
-            }), 400
-        
-        # 获取学生内部ID
-        cursor.execute('SELECT id FROM students WHERE student_id = ?', (student_id,))
-        student = cursor.fetchone()
-        if not student:
-            return jsonify({
-                'success': False,
-                'message': '找不到学生信息'
-            }), 404
-        
-        # 获取要选的课程时间
-        cursor.execute('SELECT times FROM courses WHERE id = ?', (course_id,))
-        new_course = cursor.fetchone()
-        if not new_course:
-            return jsonify({
-                'success': False,
-                'message': '找不到课程信息'
-            }), 404
-        
-        # 获取学生已选课程时间
-        cursor.execute('''
-            SELECT c.times 
-            FROM courses c
-            JOIN student_courses sc ON c.id = sc.course_id
-            WHERE sc.student_id = ? AND c.times IS NOT NULL
-        ''', (student['id'],))
-        
-        existing_courses = cursor.fetchall()
-        
-        # 检查时间冲突
-        if new_course['times']:
-            new_times = new_course['times'].split('|')
-            
-            for course in existing_courses:
-                if course['times']:
-                    existing_times = course['times'].split('|')
-                    
-                    # 检查每个时间段是否有冲突
-                    for new_time in new_times:
-                        if new_time in existing_times:
-                            return jsonify({
-                                'success': False,
-                                'message': f'时间冲突：您在{new_time}已有其他课程'
-                            }), 400
-        
-        # 添加选课记录
-        cursor.execute('''
-            INSERT INTO student_courses (student_id, course_id)
-            VALUES (?, ?)
-        ''', (student['id'], course_id))
-        
-        conn.commit()
+        # 在一个 BEGIN IMMEDIATE 事务中检查容量、时间冲突并占用名额
+        reserve_seat(conn, student_id, course_id)
+        after_commit(lambda: authz_index.invalidate_student(student_id))
         return jsonify({
             'success': True,
             'message': '选课成功'
         })
+    except EnrollmentError as e:
+        return jsonify({
+            'success': False,
+            'message': e.message
+        }), e.status
     except Exception as e:
         if conn:
             conn.rollback()
@@ -1105,6 +1341,7 @@ def add_student_course():
 # 添加退课API
 @app.route('/api/student-courses', methods=['DELETE'])
 @login_required
+@serialized_write
 def drop_student_course():
     """学生退课功能"""
     try:
@@ -1145,6 +1382,9 @@ def drop_student_course():
             }), 404
         
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_student(student_id))
+        # 名额空出，提交后通知后台线程递补候补队列
+        after_commit(lambda: waitlist_worker.notify(course_id))
         return jsonify({
             'success': True,
             'message': '退课成功'
@@ -1161,41 +1401,132 @@ def drop_student_course():
         if conn:
             conn.close()
 
+# 候补队列：课程满员时加入候补，空出名额后由后台线程按顺序递补
+@app.route('/api/waitlist', methods=['POST'])
+@login_required
+@serialized_write
+def join_course_waitlist():
+    data = request.get_json(silent=True) or {}
+    student_id = data.get('student_id')
+    course_id = data.get('course_id')
+
+    if session.get('role') == 'student' and session.get('student_id') != student_id:
+        return jsonify({
+            'success': False,
+            'message': '您只能为自己加入候补'
+        }), 403
+
+    conn = get_db()
+    try:
+        position = join_waitlist(conn, student_id, course_id)
+        return jsonify({
+            'success': True,
+            'data': position,
+            'message': f"已加入候补队列，当前排在第{position['position']}位"
+        })
+    except EnrollmentError as e:
+        return jsonify({
+            'success': False,
+            'message': e.message
+        }), e.status
+    except Exception as e:
+        print('加入候补失败:', e)
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+    finally:
+        conn.close()
+
+@app.route('/api/waitlist', methods=['DELETE'])
+@login_required
+@serialized_write
+def leave_course_waitlist():
+    data = request.get_json(silent=True) or {}
+    student_id = data.get('student_id')
+
+    if session.get('role') == 'student' and session.get('student_id') != student_id:
+        return jsonify({
+            'success': False,
+            'message': '您只能退出自己的候补'
+        }), 403
+
+    conn = get_db()
+    try:
+        if not leave_waitlist(conn, student_id, data.get('course_id')):
+            return jsonify({
+                'success': False,
+                'message': '未找到候补记录'
+            }), 404
+        return jsonify({
+            'success': True,
+            'message': '已退出候补队列'
+        })
+    finally:
+        conn.close()
+
+# 查询候补位置（代替反复提交选课请求轮询空位）
+@app.route('/api/waitlist/<int:course_id>/position', methods=['GET'])
+@login_required
+def get_waitlist_position(course_id):
+    student_id = request.args.get('student_id') or session.get('student_id')
+    if session.get('role') == 'student' and session.get('student_id') != student_id:
+        return jsonify({
+            'success': False,
+            'message': '您只能查看自己的候补位置'
+        }), 403
+
+    conn = get_db()
+    try:
+        return jsonify({
+            'success': True,
+            'data': waitlist_position(conn, student_id, course_id),
+            'message': '获取候补位置成功'
+        })
+    except EnrollmentError as e:
+        return jsonify({
+            'success': False,
+            'message': e.message
+        }), e.status
+    finally:
+        conn.close()
+
 # 成绩相关路由
 @app.route('/api/course-grades', methods=['GET'])
 @login_required
 def get_course_grades():
+    conn = None
     try:
-        conn = get_db()
+        conn = get_analytics_db()
         cursor = conn.cursor()
+        history = history_sources(conn)
 
         # 获取所有课程及其学生成绩
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT c.*, s.name as student_name, s.student_id,
                 g.usual_grade, g.midterm_grade, g.final_grade
             FROM courses c
-            LEFT JOIN grades g ON c.id = g.course_id
+            LEFT JOIN {history['grades']} g ON c.id = g.course_id
             LEFT JOIN students s ON g.student_id = s.id
             ORDER BY c.id, s.name
         ''')
 
         courses = {}
         for row in cursor.fetchall():
-            row_dict = dict(row)
-            course_id = row_dict['id']
+            course_id = row['id']
             if course_id not in courses:
                 courses[course_id] = {
                     'id': course_id,
-                    'name': row_dict['name'],
+                    'name': row['name'],
                     'students': []
                 }
-            if row_dict['student_name']:
+            if row['student_name']:
                 courses[course_id]['students'].append({
-                    'name': row_dict['student_name'],
-                    'student_id': row_dict['student_id'],
-                    'usual_grade': row_dict['usual_grade'] or 0,
-                    'midterm_grade': row_dict['midterm_grade'] or 0,
-                    'final_grade': row_dict['final_grade'] or 0
+                    'name': row['student_name'],
+                    'student_id': row['student_id'],
+                    'usual_grade': row['usual_grade'] or 0,
+                    'midterm_grade': row['midterm_grade'] or 0,
+                    'final_grade': row['final_grade'] or 0
                 })
 
         return jsonify({
@@ -1210,10 +1541,14 @@ def get_course_grades():
             'message': str(e),
             'data': []
         }), 500
+    finally:
+        if conn:
+            conn.close()
 
 # 保存成绩
 @app.route('/api/course-grades', methods=['POST'])
 @login_required
+@serialized_write
 def save_course_grades():
     try:
         data = request.get_json()
@@ -1248,6 +1583,7 @@ def save_course_grades():
 # 删除相关路由
 @app.route('/api/students/<student_id>', methods=['DELETE'])
 @login_required
+@serialized_write
 def delete_student(student_id):
     try:
         conn = get_db()
@@ -1272,6 +1608,7 @@ def delete_student(student_id):
         cursor.execute('DELETE FROM students WHERE id = ?', (student_internal_id,))
 
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_student(student_id))
         return jsonify({
             'success': True,
             'message': '学生删除成功'
@@ -1289,6 +1626,7 @@ def delete_student(student_id):
 
 @app.route('/api/teachers/<teacher_id>', methods=['DELETE'])
 @login_required
+@serialized_write
 def delete_teacher(teacher_id):
     try:
         conn = get_db()
@@ -1310,6 +1648,7 @@ def delete_teacher(teacher_id):
         cursor.execute('DELETE FROM teachers WHERE id = ?', (teacher_internal_id,))
         
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_teacher(teacher_id))
         return jsonify({
             'success': True,
             'message': '教师删除成功'
@@ -1329,6 +1668,7 @@ def delete_teacher(teacher_id):
 # 作业相关路由
 @app.route('/api/assignments', methods=['POST'])
 @login_required
+@serialized_write
 def create_assignment():
     try:
         data = request.get_json()
@@ -1402,15 +1742,16 @@ def get_assignments_by_course(course_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        history = course_history_sources(conn, course_id)
         
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT id, course_id, title, content, create_time
-            FROM assignments 
+            FROM {history['assignments']} assignments
             WHERE course_id = ?
             ORDER BY create_time DESC
         ''', (course_id,))
         
-        assignments = [dict(row) for row in cursor.fetchall()]
+        assignments = use_typed_rows(cursor, 'AssignmentsRow').fetchall()
         return jsonify({
             'success': True,
             'data': assignments,
@@ -1427,31 +1768,78 @@ def get_assignments_by_course(course_id):
         if conn:
             conn.close()
 
+# 学生作业流：所选全部课程的作业按发布时间倒序，游标分页
+@app.route('/api/students/<student_id>/assignment-feed', methods=['GET'])
+@login_required
+def get_student_assignment_feed(student_id):
+    if session.get('role') == 'student' and session.get('student_id') != student_id:
+        return jsonify({
+            'success': False,
+            'message': '您只能查看自己的作业'
+        }), 403
+
+    conn = None
+    try:
+        limit = min(max(request.args.get('limit', FEED_PAGE_SIZE, type=int), 1), FEED_MAX_PAGE_SIZE)
+        conn = get_db()
+        page = assignment_feed(conn, student_id, request.args.get('cursor'), limit)
+        return jsonify({
+            'success': True,
+            'data': page,
+            'message': '获取作业流成功'
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        print('获取作业流失败:', e)
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+    finally:
+        if conn:
+            conn.close()
+
 @app.route('/api/assignments/<int:assignment_id>', methods=['PUT'])
 @login_required
+@serialized_write
 def modify_assignment(assignment_id):
     try:
         data = request.get_json()
         conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        sql = '''
             UPDATE assignments 
-            SET title = ?, content = ?
+            SET title = ?, content = ?, version = version + 1
             WHERE id = ?
-        ''', (data['title'], data['content'], assignment_id))
-        
-        if cursor.rowcount == 0:
+        '''
+        values = [data['title'], data['content'], assignment_id]
+        version = client_version('assignments', assignment_id)
+        if version is not None:
+            sql += ' AND version = ?'
+            values.append(version)
+        cursor.execute(sql + ' RETURNING *', values)
+        updated = cursor.fetchone()
+        
+        if not updated:
+            cursor.execute('SELECT 1 FROM assignments WHERE id = ?', (assignment_id,))
+            if cursor.fetchone():
+                return precondition_failed()
             return jsonify({
                 'success': False,
                 'message': '找不到该作业'
             }), 404
         
         conn.commit()
-        return jsonify({
+        return versioned_response({
             'success': True,
+            'data': dict(updated),
             'message': '作业更新成功'
-        })
+        }, 'assignments', updated)
     except Exception as e:
         conn.rollback()
         print('更新作业失败:', e)
@@ -1464,6 +1852,7 @@ def modify_assignment(assignment_id):
 
 @app.route('/api/assignments/<int:assignment_id>', methods=['DELETE'])
 @login_required
+@serialized_write
 def remove_assignment(assignment_id):
     try:
         conn = get_db()
@@ -1495,6 +1884,7 @@ def remove_assignment(assignment_id):
 # 更新学生信息
 @app.route('/api/students/<student_id>', methods=['PUT'])
 @login_required
+@serialized_write
 def update_student(student_id):
     try:
         data = request.get_json()
@@ -1527,6 +1917,7 @@ def update_student(student_id):
             }), 404
         
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_student(student_id))
         
         # 获取更新后的学生信息
         cursor.execute("SELECT * FROM students WHERE student_id = ?", (data['student_id'],))
@@ -1555,6 +1946,7 @@ def update_student(student_id):
 # 更新教师信息
 @app.route('/api/teachers/<teacher_id>', methods=['PUT'])
 @login_required
+@serialized_write
 def update_teacher(teacher_id):
     try:
         data = request.get_json()
@@ -1587,6 +1979,7 @@ def update_teacher(teacher_id):
             }), 404
         
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_teacher(teacher_id))
         
         # 获取更新后的教师信息
         cursor.execute("SELECT * FROM teachers WHERE teacher_id = ?", (data['teacher_id'],))
@@ -1628,18 +2021,19 @@ def get_student_grades(student_id):
     try:
         conn = get_db()
         cursor = conn.cursor()
+        history = history_sources(conn)
         
         # 获取学生选择的所有课程及其成绩
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT c.*, g.usual_grade, g.midterm_grade, g.final_grade
             FROM courses c
-            LEFT JOIN grades g ON c.id = g.course_id
-            JOIN student_courses sc ON c.id = sc.course_id
+            LEFT JOIN {history['grades']} g ON c.id = g.course_id
+            JOIN {history['student_courses']} sc ON c.id = sc.course_id
             JOIN students s ON sc.student_id = s.id
             WHERE s.student_id = ?
         ''', (student_id,))
         
-        courses = [dict(row) for row in cursor.fetchall()]
+        courses = use_typed_rows(cursor, 'CourseGradesRow').fetchall()
         return jsonify({
             'success': True,
             'data': courses,
@@ -1657,6 +2051,7 @@ def get_student_grades(student_id):
 
 @app.route('/api/grades', methods=['POST'])
 @login_required
+@serialized_write
 def save_grades():
     try:
         data = request.get_json()
@@ -1748,11 +2143,11 @@ def get_student_profile(student_id):
                 'message': '找不到该学生信息'
             }), 404
             
-        return jsonify({
+        return versioned_response({
             'success': True,
             'data': dict(student),
             'message': '获取学生个人资料成功'
-        })
+        }, 'students', student)
     except Exception as e:
         print('获取学生个人资料失败:', e)
         return jsonify({
@@ -1765,6 +2160,7 @@ def get_student_profile(student_id):
 # 更新学生个人资料API（包括密码修改）
 @app.route('/api/students/<student_id>/profile', methods=['PUT'])
 @login_required
+@serialized_write
 def update_student_profile(student_id):
     # 检查权限：只能修改自己的资料
     if session.get('role') == 'student' and session.get('student_id') != student_id:
@@ -1798,12 +2194,20 @@ def update_student_profile(student_id):
                     'message': '该学号已被其他学生使用'
                 }), 400
                 
-        # 更新学生信息
+        version = client_version('students', student['id'])
+        if version is not None and version != student['version']:
+            return precondition_failed()
+
+        # 更新学生信息，版本号不符说明读取后已被他人修改
         cursor.execute('''
             UPDATE students 
-            SET name = ?, student_id = ?, enrollment_year = ?
-            WHERE student_id = ?
-        ''', (data['name'], data['student_id'], data.get('enrollment_year'), student_id))
+            SET name = ?, student_id = ?, enrollment_year = ?, version = version + 1
+            WHERE id = ? AND version = ?
+            RETURNING *
+        ''', (data['name'], data['student_id'], data.get('enrollment_year'), student['id'], student['version']))
+        updated_student = cursor.fetchone()
+        if not updated_student:
+            return precondition_failed()
         
         # 如果提供了新密码，更新密码
         if 'new_password' in data and data['new_password']:
@@ -1818,16 +2222,13 @@ def update_student_profile(student_id):
             session['student_id'] = data['student_id']
             
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_student(student_id))
         
-        # 获取更新后的信息
-        cursor.execute('SELECT * FROM students WHERE student_id = ?', (data['student_id'],))
-        updated_student = cursor.fetchone()
-        
-        return jsonify({
+        return versioned_response({
             'success': True,
-            'data': dict(updated_student) if updated_student else None,
+            'data': dict(updated_student),
             'message': '学生个人资料更新成功'
-        })
+        }, 'students', updated_student)
     except Exception as e:
         print('更新学生个人资料失败:', e)
         if conn:
@@ -1865,11 +2266,11 @@ def get_teacher_profile(teacher_id):
                 'message': '找不到该教师信息'
             }), 404
             
-        return jsonify({
+        return versioned_response({
             'success': True,
             'data': dict(teacher),
             'message': '获取教师个人资料成功'
-        })
+        }, 'teachers', teacher)
     except Exception as e:
         print('获取教师个人资料失败:', e)
         return jsonify({
@@ -1882,6 +2283,7 @@ def get_teacher_profile(teacher_id):
 # 更新教师个人资料API（包括密码修改）
 @app.route('/api/teachers/<teacher_id>/profile', methods=['PUT'])
 @login_required
+@serialized_write
 def update_teacher_profile(teacher_id):
     # 检查权限：只能修改自己的资料
     if session.get('role') == 'teacher' and session.get('teacher_id') != teacher_id:
@@ -1915,12 +2317,20 @@ def update_teacher_profile(teacher_id):
                     'message': '该教师ID已被其他教师使用'
                 }), 400
                 
-        # 更新教师信息
+        version = client_version('teachers', teacher['id'])
+        if version is not None and version != teacher['version']:
+            return precondition_failed()
+
+        # 更新教师信息，版本号不符说明读取后已被他人修改
         cursor.execute('''
             UPDATE teachers 
-            SET name = ?, teacher_id = ?
-            WHERE teacher_id = ?
-        ''', (data['name'], data['teacher_id'], teacher_id))
+            SET name = ?, teacher_id = ?, version = version + 1
+            WHERE id = ? AND version = ?
+            RETURNING *
+        ''', (data['name'], data['teacher_id'], teacher['id'], teacher['version']))
+        updated_teacher = cursor.fetchone()
+        if not updated_teacher:
+            return precondition_failed()
         
         # 如果提供了新密码，更新密码
         if 'new_password' in data and data['new_password']:
@@ -1935,16 +2345,13 @@ def update_teacher_profile(teacher_id):
             session['teacher_id'] = data['teacher_id']
             
         conn.commit()
+        after_commit(lambda: authz_index.invalidate_teacher(teacher_id))
         
-        # 获取更新后的信息
-        cursor.execute('SELECT * FROM teachers WHERE teacher_id = ?', (data['teacher_id'],))
-        updated_teacher = cursor.fetchone()
-        
-        return jsonify({
+        return versioned_response({
             'success': True,
-            'data': dict(updated_teacher) if updated_teacher else None,
+            'data': dict(updated_teacher),
             'message': '教师个人资料更新成功'
-        })
+        }, 'teachers', updated_teacher)
     except Exception as e:
         print('更新教师个人资料失败:', e)
         if conn:
@@ -1982,11 +2389,11 @@ def get_admin_profile(admin_id):
                 'message': '找不到该管理员信息'
             }), 404
             
-        return jsonify({
+        return versioned_response({
             'success': True,
             'data': dict(admin),
             'message': '获取管理员个人资料成功'
-        })
+        }, 'admins', admin)
     except Exception as e:
         print('获取管理员个人资料失败:', e)
         return jsonify({
@@ -1999,6 +2406,7 @@ def get_admin_profile(admin_id):
 # 更新管理员个人资料API（包括密码修改）
 @app.route('/api/admins/<admin_id>/profile', methods=['PUT'])
 @login_required
+@serialized_write
 def update_admin_profile(admin_id):
     # 检查权限：只能修改自己的资料
     if session.get('role') == 'admin' and session.get('admin_id') != admin_id:
@@ -2032,12 +2440,20 @@ def update_admin_profile(admin_id):
                     'message': '该管理员ID已被其他管理员使用'
                 }), 400
                 
-        # 更新管理员信息
+        version = client_version('admins', admin['id'])
+        if version is not None and version != admin['version']:
+            return precondition_failed()
+
+        # 更新管理员信息，版本号不符说明读取后已被他人修改
         cursor.execute('''
             UPDATE admins 
-            SET name = ?, admin_id = ?
-            WHERE admin_id = ?
-        ''', (data['name'], data['admin_id'], admin_id))
+            SET name = ?, admin_id = ?, version = version + 1
+            WHERE id = ? AND version = ?
+            RETURNING *
+        ''', (data['name'], data['admin_id'], admin['id'], admin['version']))
+        updated_admin = cursor.fetchone()
+        if not updated_admin:
+            return precondition_failed()
         
         # 如果提供了新密码，更新密码
         if 'new_password' in data and data['new_password']:
@@ -2053,15 +2469,11 @@ def update_admin_profile(admin_id):
             
         conn.commit()
         
-        # 获取更新后的信息
-        cursor.execute('SELECT * FROM admins WHERE admin_id = ?', (data['admin_id'],))
-        updated_admin = cursor.fetchone()
-        
-        return jsonify({
+        return versioned_response({
             'success': True,
-            'data': dict(updated_admin) if updated_admin else None,
+            'data': dict(updated_admin),
             'message': '管理员个人资料更新成功'
-        })
+        }, 'admins', updated_admin)
     except Exception as e:
         print('更新管理员个人资料失败:', e)
         if conn:
@@ -2074,5 +2486,368 @@ def update_admin_profile(admin_id):
         if conn:
             conn.close()
 
+# 导出相关路由：成绩册、花名册、选课名单（流式输出CSV/XLSX）
+@app.route('/api/exports/<kind>', methods=['GET'])
+@login_required
+@role_required(['admin', 'teacher'])
+def export_data(kind):
+    """流式导出数据
+
+    kind: grades(成绩册，含按课程占比计算的总评)、roster(花名册)、enrollments(选课名单)
+    查询参数: format=csv|xlsx，course_id 按课程导出，term 按学期(courses.term)导出
+    教师必须指定 course_id，且只能导出自己教授的课程
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    course_id = request.args.get('course_id', type=int)
+    term = request.args.get('term') or None
+
+    if session.get('role') == 'teacher':
+        if course_id is None:
+            return jsonify({
+                'success': False,
+                'message': '教师导出时必须指定课程'
+            }), 400
+        if not authz_index.teaches(session.get('teacher_id'), course_id):
+            return jsonify({
+                'success': False,
+                'message': '您没有权限导出该课程的数据'
+            }), 403
+
+    conn = get_analytics_db()
+    try:
+        filename, mimetype, chunks = export_stream(conn, kind, fmt, course_id, term)
+    except ValueError as e:
+        conn.close()
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except (DatabaseBusy, QueryTimeout):
+        # 附加归档时数据库忙或超时：关闭连接后交给503处理
+        conn.close()
+        raise
+    except Exception as e:
+        conn.close()
+        print(f"准备导出失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'导出失败: {str(e)}'
+        }), 500
+
+    return Response(chunks, mimetype=mimetype, headers={
+        'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}",
+        'Cache-Control': 'no-store'
+    })
+
+# 数据库重试、超时计数和写线程统计
+@app.route('/api/db/metrics', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_db_metrics():
+    return jsonify({
+        'success': True,
+        'data': {
+            'resilience': db_metrics.snapshot(),
+            'writer': write_queue.stats(),
+            'authz_index': authz_index.stats()
+        },
+        'message': '获取数据库统计成功'
+    })
+
+# Prometheus 抓取入口：汇总所有工作进程的指标；设置了 EDU_METRICS_TOKEN 时
+# 需要携带 Authorization: Bearer <令牌>，否则只允许管理员会话；EDU_METRICS_PUBLIC=1 时不校验
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if not METRICS_PUBLIC:
+        if METRICS_TOKEN:
+            if request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+                return jsonify({'success': False, 'message': '指标令牌无效'}), 401
+        elif session.get('role') != 'admin':
+            return jsonify({'success': False, 'message': '您没有权限访问此功能'}), 403
+    body = metrics.exposition(sqlite_file_gauges(DATABASE_PATH))
+    return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# 性能分析结果列表（新的在前）
+@app.route('/api/profiling/runs', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def list_profile_runs():
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    return jsonify({
+        'success': True,
+        'data': {'runs': profiler.list(limit), 'sample_rate': profiler.sample_rate},
+        'message': '获取性能分析结果成功'
+    })
+
+# 下载分析结果：kind 为 prof（cProfile 统计文件）或 mem（内存分配变化）
+@app.route('/api/profiling/runs/<run_id>/<kind>', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def download_profile_run(run_id, kind):
+    found = profiler.file(run_id, kind)
+    if found is None:
+        return jsonify({'success': False, 'message': '分析结果不存在'}), 404
+    directory, filename = found
+    return send_from_directory(directory, filename, as_attachment=True)
+
+# 生成分析令牌：放在请求头 X-Edu-Profile 中，有效期内只分析指定用户（role + username）的请求
+@app.route('/api/profiling/token', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def create_profile_token():
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode', 'cpu')
+    if mode not in TOKEN_MODES:
+        return jsonify({'success': False, 'message': '令牌只支持 cpu 模式，mem 模式请用 _profile=mem'}), 400
+    if not data.get('username') or not data.get('role'):
+        return jsonify({'success': False, 'message': '请指定令牌对应的用户名和身份'}), 400
+    try:
+        ttl = min(max(int(data.get('ttl', 300)), 1), PROFILE_TOKEN_MAX_TTL)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'ttl 必须是秒数'}), 400
+    subject = token_subject(data['role'], data['username'])
+    return jsonify({
+        'success': True,
+        'data': {'header': PROFILE_HEADER, 'value': make_token(mode, ttl, subject, profile_secret()), 'ttl': ttl},
+        'message': '生成分析令牌成功'
+    })
+
+# 分析快照状态：快照年龄、最近一次刷新耗时等
+@app.route('/api/snapshot', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_snapshot_status():
+    return jsonify({
+        'success': True,
+        'data': snapshot_manager.status(),
+        'message': '获取快照状态成功'
+    })
+
+# 立即刷新分析快照
+@app.route('/api/snapshot/refresh', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def refresh_snapshot():
+    try:
+        snapshot_manager.refresh()
+        return jsonify({
+            'success': True,
+            'data': snapshot_manager.status(),
+            'message': '快照刷新成功'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+# 增量同步：返回版本since之后的变更（不传since时只返回当前版本号）
+# tables为逗号分隔的表名，只返回这些表的变更
+@app.route('/api/changes', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_changes():
+    conn = None
+    try:
+        since = request.args.get('since', type=int)
+        limit = min(max(request.args.get('limit', CHANGES_PAGE_SIZE, type=int), 1), CHANGES_PAGE_SIZE)
+        tables = [t for t in request.args.get('tables', '').split(',') if t]
+        conn = get_db()
+        if since is None:
+            data = {'version': current_version(conn), 'changes': []}
+        else:
+            data = changes_since(conn, max(since, 0), limit, tables)
+        return jsonify({
+            'success': True,
+            'data': data,
+            'message': '获取变更成功'
+        })
+    except Exception as e:
+        print('获取变更失败:', e)
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+# 归档相关路由：把已结束学期的选课、成绩和作业移到学期归档文件
+@app.route('/api/archive/terms', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def get_archived_terms():
+    conn = get_db()
+    try:
+        return jsonify({
+            'success': True,
+            'data': list_archived_terms(conn),
+            'message': '获取归档学期成功'
+        })
+    finally:
+        conn.close()
+
+# 标记学期已结课，结课后才能归档
+@app.route('/api/terms/<term>/close', methods=['POST'])
+@login_required
+@role_required(['admin'])
+@serialized_write
+def close_course_term(term):
+    try:
+        data = close_term(get_db(), term)
+        return jsonify({
+            'success': True,
+            'data': data,
+            'message': f'学期{term}已结课'
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 404
+    except Exception as e:
+        print('标记学期结课失败:', e)
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+# 归档需要在事务外ATTACH归档文件并自己管理事务，作为独占任务交给写线程执行
+@app.route('/api/archive/terms', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def archive_closed_term():
+    data = request.get_json(silent=True) or {}
+    term = data.get('term')
+    if not term:
+        return jsonify({
+            'success': False,
+            'message': '缺少学期'
+        }), 400
+
+    try:
+        counts = write_queue.run_exclusive(lambda conn: archive_term(conn, term))
+        # 归档移走了该学期的选课记录
+        authz_index.invalidate_student()
+        return jsonify({
+            'success': True,
+            'data': counts,
+            'message': f'学期{term}归档成功'
+        })
+    except TermOpenError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 409
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 404
+    except Exception as e:
+        print('归档学期失败:', e)
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+# 批量请求API：在同一个连接上依次执行多个子请求
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def batch_requests():
+    """批量执行子请求
+
+    请求体: {"requests": [{"method": "GET", "path": "/api/courses", "body": {...},
+             "headers": {...}}, ...], "transaction": false}
+    子请求按顺序在内部分发，共用当前会话和同一个数据库连接；路径和方法必须
+    对应一个 /api 路由（不能是 /api/batch 本身）。
+    transaction为False时每个子请求单独提交，返回错误状态码(>=400)的子请求
+    的修改被回滚（与 serialized_write 一致）；为True时所有子请求处于同一事务，
+    任一子请求失败则全部回滚，其后的子请求不再执行(状态码424)。
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('requests')
+    transactional = bool(data.get('transaction', False))
+
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            'success': False,
+            'message': '缺少子请求列表'
+        }), 400
+    if len(items) > BATCH_MAX_REQUESTS:
+        return jsonify({
+            'success': False,
+            'message': f'子请求数量不能超过{BATCH_MAX_REQUESTS}个'
+        }), 400
+    adapter = app.url_map.bind('localhost')
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            return jsonify({
+                'success': False,
+                'message': '子请求缺少路径'
+            }), 400
+        method = str(item.get('method', 'GET')).upper()
+        try:
+            rule, _ = adapter.match(urlsplit(item['path']).path, method, return_rule=True)
+        except HTTPException:
+            rule = None
+        if rule is None or not rule.rule.startswith('/api/') or rule.endpoint == 'batch_requests':
+            return jsonify({
+                'success': False,
+                'message': f"无效的子请求: {method} {item['path']}"
+            }), 400
+
+    results = []
+    failed = False
+    # 两种模式下处理函数的 commit() 都不直接生效，由这里按子请求的结果提交或回滚
+    with shared_connection(transactional=True) as conn:
+        for item in items:
+            if failed:
+                results.append({'status': 424, 'body': None, 'etag': None})
+                continue
+
+            headers = {k: v for k, v in (item.get('headers') or {}).items()
+                       if k.lower() != 'cookie'}
+            builder = EnvironBuilder(
+                app, item['path'],
+                method=item.get('method', 'GET').upper(),
+                json=item.get('body'),
+                headers=headers
+            )
+            try:
+                environ = builder.get_environ()
+            finally:
+                builder.close()
+            environ['edu.batch_item'] = True
+            # 复用外层请求的session，避免每个子请求重新解析cookie
+            ctx = RequestContext(app, environ, session=session._get_current_object())
+            with ctx:
+                try:
+                    response = app.full_dispatch_request()
+                except Exception as e:
+                    print('批量子请求执行失败:', e)
+                    response = jsonify({'success': False, 'message': str(e)})
+                    response.status_code = 500
+
+            results.append({
+                'status': response.status_code,
+                'body': response.get_json(silent=True),
+                'etag': response.headers.get('ETag')
+            })
+
+            if transactional:
+                failed = response.status_code >= 400
+            else:
+                conn.finish(commit=response.status_code < 400)
+
+        if transactional:
+            conn.finish(commit=not failed)
+
+    return jsonify({
+        'success': not failed,
+        'data': results,
+        'message': '批量请求执行完成' if not failed else '子请求失败，事务已回滚'
+    })
+
 if __name__ == '__main__':
+    if snapshot_manager.enabled:
+        snapshot_manager.start()
+    change_log_pruner.start()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""按学期归档历史数据
+
+已结课学期（terms.closed_at 不为空，课程按 courses.term 归属学期）的选课、
+成绩和作业记录移动到独立的学期数据库文件，主库只保留未结课学期的数据。
+查询历史数据时按需 ATTACH 归档文件，并用 UNION ALL 把主库和归档中的同名表
+拼成一个数据源，处理函数的SQL只需把表名换成 history_sources() 返回的数据源
+即可。同一主键在主库和归档中都有时以主库为准。
+
+归档文件只保存下面列出的字段；这些表以后增加字段时，需要同步修改
+ARCHIVE_TABLES，否则新字段在历史数据中不可见。
+"""
+import os
+import re
+
+from .config import ARCHIVE_DIR
+
+# 表名 -> (字段列表, 归档文件中的建表语句)
+ARCHIVE_TABLES = {
+    'student_courses': (
+        ('student_id', 'course_id'),
+        '''CREATE TABLE IF NOT EXISTS {schema}.student_courses (
+            student_id INTEGER,
+            course_id INTEGER,
+            PRIMARY KEY (student_id, course_id)
+        )'''
+    ),
+    'grades': (
+        ('student_id', 'course_id', 'usual_grade', 'midterm_grade', 'final_grade'),
+        '''CREATE TABLE IF NOT EXISTS {schema}.grades (
+            student_id INTEGER,
+            course_id INTEGER,
+            usual_grade REAL DEFAULT 0,
+            midterm_grade REAL DEFAULT 0,
+            final_grade REAL DEFAULT 0,
+            PRIMARY KEY (student_id, course_id)
+        )'''
+    ),
+    'assignments': (
+        ('id', 'course_id', 'title', 'content', 'create_time'),
+        '''CREATE TABLE IF NOT EXISTS {schema}.assignments (
+            id INTEGER PRIMARY KEY,
+            course_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            create_time TIMESTAMP
+        )'''
+    ),
+}
+
+# 表名 -> 主键字段，合并主库与归档时用于去重
+ARCHIVE_KEYS = {
+    'student_courses': ('student_id', 'course_id'),
+    'grades': ('student_id', 'course_id'),
+    'assignments': ('id',),
+}
+
+class TermOpenError(ValueError):
+    """学期尚未结课，不能归档"""
+
+def archive_filename(term):
+    """学期对应的归档文件名，如 大二 -> term_大二.db"""
+    return 'term_' + re.sub(r'[^\w-]', '_', term) + '.db'
+
+def close_term(conn, term):
+    """标记学期已结课（已结课的保持原结课时间），学期下没有课程时抛出ValueError"""
+    if not conn.execute('SELECT 1 FROM courses WHERE term = ? LIMIT 1', (term,)).fetchone():
+        raise ValueError(f'学期不存在: {term}')
+    conn.execute('''
+        INSERT INTO terms (term, closed_at) VALUES (?, CURRENT_TIMESTAMP)
+        ON CONFLICT(term) DO UPDATE SET closed_at = COALESCE(closed_at, excluded.closed_at)
+    ''', (term,))
+    row = conn.execute('SELECT term, closed_at FROM terms WHERE term = ?', (term,)).fetchone()
+    return {'term': row[0], 'closed_at': row[1]}
+
+def archive_term(conn, term):
+    """把已结课学期的选课、成绩和作业移动到该学期的归档文件
+
+    复制和删除在同一个事务中完成（主库与归档文件一起提交或回滚）。删除期间
+    terms.archiving 为1，计数和变更日志触发器不处理被移走的行。
+    重复归档同一学期时追加到已有文件。返回各表移动的行数。
+    学期不存在时抛出ValueError，未结课时抛出TermOpenError。
+    """
+    if conn.in_transaction:
+        raise RuntimeError('归档不能在未提交的事务中执行')
+    if not conn.execute('SELECT 1 FROM courses WHERE term = ? LIMIT 1', (term,)).fetchone():
+        raise ValueError(f'学期不存在: {term}')
+    row = conn.execute('SELECT closed_at FROM terms WHERE term = ?', (term,)).fetchone()
+    if row is None or row[0] is None:
+        raise TermOpenError(f'学期尚未结课，不能归档: {term}')
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    filename = archive_filename(term)
+    conn.execute('ATTACH DATABASE ? AS archive_target', (os.path.join(ARCHIVE_DIR, filename),))
+    try:
+        for table, (columns, ddl) in ARCHIVE_TABLES.items():
+            conn.execute(ddl.format(schema='archive_target'))
+        conn.execute('CREATE INDEX IF NOT EXISTS archive_target.idx_student_courses_course '
+                     'ON student_courses (course_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS archive_target.idx_assignments_course '
+                     'ON assignments (course_id)')
+
+        counts = {}
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('UPDATE main.terms SET archiving = 1 WHERE term = ?', (term,))
+            for table, (columns, ddl) in ARCHIVE_TABLES.items():
+                fields = ', '.join(columns)
+                condition = 'course_id IN (SELECT id FROM main.courses WHERE term = ?)'
+                cursor = conn.execute(
+                    f'INSERT OR REPLACE INTO archive_target.{table} ({fields}) '
+                    f'SELECT {fields} FROM main.{table} WHERE {condition}', (term,))
+                counts[table] = cursor.rowcount
+                conn.execute(f'DELETE FROM main.{table} WHERE {condition}', (term,))
+            conn.execute('''
+                INSERT INTO main.archived_terms (term, path, student_courses, grades, assignments)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(term) DO UPDATE SET
+                    archived_at = CURRENT_TIMESTAMP,
+                    student_courses = student_courses + excluded.student_courses,
+                    grades = grades + excluded.grades,
+                    assignments = assignments + excluded.assignments
+            ''', (term, filename, counts['student_courses'], counts['grades'], counts['assignments']))
+            conn.execute('UPDATE main.terms SET archiving = 0 WHERE term = ?', (term,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute('DETACH DATABASE archive_target')
+    print(f"学期 {term} 已归档:", counts)
+    return counts
+
+def history_sources(conn, terms=None):
+    """返回可归档表的数据源：{表名: SQL片段}
+
+    没有相关归档时直接返回表名；否则按需ATTACH归档文件，返回主库与
+    归档表 UNION ALL 的子查询，归档中与主库主键相同的行不重复返回。
+    terms 限定只附加这些学期的归档，None 表示附加全部归档。
+    """
+    sources = {table: table for table in ARCHIVE_TABLES}
+    query = 'SELECT rowid, path FROM archived_terms'
+    params = ()
+    if terms is not None:
+        terms = [t for t in terms if t]
+        if not terms:
+            return sources
+        query += f" WHERE term IN ({', '.join('?' * len(terms))})"
+        params = tuple(terms)
+    archives = conn.execute(query + ' ORDER BY term', params).fetchall()
+    if not archives:
+        return sources
+    if conn.in_transaction:
+        # ATTACH不能在事务中执行（如事务模式的批量请求），此时只能查询主库
+        print('当前连接处于事务中，历史查询未包含归档数据')
+        return sources
+
+    attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+    schemas = []
+    for rowid, path in archives:
+        schema = f'archive_{rowid}'
+        if schema not in attached:
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (os.path.join(ARCHIVE_DIR, path),))
+        schemas.append(schema)
+
+    for table, (columns, ddl) in ARCHIVE_TABLES.items():
+        fields = ', '.join(columns)
+        archived = ', '.join(f'a.{column}' for column in columns)
+        same_key = ' AND '.join(f'm.{key} = a.{key}' for key in ARCHIVE_KEYS[table])
+        parts = [f'SELECT {fields} FROM main.{table}']
+        parts += [f'SELECT {archived} FROM {schema}.{table} a '
+                  f'WHERE NOT EXISTS (SELECT 1 FROM main.{table} m WHERE {same_key})'
+                  for schema in schemas]
+        sources[table] = '(' + ' UNION ALL '.join(parts) + ')'
+    return sources
+
+def list_archived_terms(conn):
+    cursor = conn.execute('SELECT * FROM archived_terms ORDER BY term')
+    return [dict(row) for row in cursor.fetchall()]
+
+def course_history_sources(conn, course_id):
+    """单门课程的数据源：只附加该课程所在学期的归档"""
+    row = conn.execute('SELECT term FROM courses WHERE id = ?', (course_id,)).fetchone()
+    return history_sources(conn, [row[0]] if row else [])
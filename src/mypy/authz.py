@@ -0,0 +1,122 @@
+"""课程权限索引
+
+教师编号 -> 所授课程ID集合、学号 -> 所选课程ID集合 的内存索引。权限检查
+只需一次集合查找，不必每个请求都联表查询 teacher_courses/student_courses。
+登录时预先加载，未加载的条目在第一次检查时加载；修改授课或选课关系的
+路由在提交后使对应条目失效。其他进程的修改由有效期(AUTHZ_INDEX_TTL)兜底。
+"""
+import threading
+import time
+
+from .config import AUTHZ_INDEX_TTL
+from .db_operations import get_db_connection
+
+_TEACHER_COURSES = '''
+    SELECT tc.course_id FROM teacher_courses tc
+    JOIN teachers t ON t.id = tc.teacher_id
+    WHERE t.teacher_id = ?
+'''
+
+_STUDENT_COURSES = '''
+    SELECT sc.course_id FROM student_courses sc
+    JOIN students s ON s.id = sc.student_id
+    WHERE s.student_id = ?
+'''
+
+class _Mapping:
+    """编号 -> (课程集合, 加载时间)；generation 在失效时递增，
+    失效前开始的加载结果不再写入，避免把旧数据放回索引"""
+
+    def __init__(self, query):
+        self.query = query
+        self.entries = {}
+        self.generation = 0
+
+class AuthzIndex:
+    """teaches()/enrolled() 检查教师或学生与课程的关系，connect 返回新连接"""
+
+    def __init__(self, connect, ttl=AUTHZ_INDEX_TTL):
+        self._connect = connect
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._teachers = _Mapping(_TEACHER_COURSES)
+        self._students = _Mapping(_STUDENT_COURSES)
+        self.hits = 0
+        self.loads = 0
+
+    def _get(self, mapping, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = mapping.entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            generation = mapping.generation
+        conn = self._connect()
+        try:
+            courses = frozenset(row[0] for row in conn.execute(mapping.query, (key,)))
+        finally:
+            conn.close()
+        with self._lock:
+            self.loads += 1
+            if mapping.generation == generation:
+                mapping.entries[key] = (courses, now)
+        return courses
+
+    def _invalidate(self, mapping, key=None, course_id=None):
+        with self._lock:
+            mapping.generation += 1
+            if key is None and course_id is None:
+                mapping.entries.clear()
+            elif key is not None:
+                mapping.entries.pop(key, None)
+            else:
+                for k in [k for k, (courses, _) in mapping.entries.items() if course_id in courses]:
+                    del mapping.entries[k]
+
+    def teacher_courses(self, teacher_id):
+        return self._get(self._teachers, teacher_id)
+
+    def student_courses(self, student_id):
+        return self._get(self._students, student_id)
+
+    def teaches(self, teacher_id, course_id):
+        return teacher_id is not None and course_id in self.teacher_courses(teacher_id)
+
+    def enrolled(self, student_id, course_id):
+        return student_id is not None and course_id in self.student_courses(student_id)
+
+    def load(self, teacher_id=None, student_id=None):
+        """登录时预先加载（忽略未过期的条目）"""
+        if teacher_id is not None:
+            self.teacher_courses(teacher_id)
+        if student_id is not None:
+            self.student_courses(student_id)
+
+    def invalidate_teacher(self, teacher_id=None):
+        """使教师条目失效，teacher_id为None时清空全部教师条目"""
+        self._invalidate(self._teachers, teacher_id)
+
+    def invalidate_student(self, student_id=None):
+        """使学生条目失效，student_id为None时清空全部学生条目"""
+        self._invalidate(self._students, student_id)
+
+    def invalidate_course(self, course_id):
+        """课程被删除：使包含该课程的条目失效"""
+        self._invalidate(self._teachers, course_id=course_id)
+        self._invalidate(self._students, course_id=course_id)
+
+    def clear(self):
+        self.invalidate_teacher()
+        self.invalidate_student()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'teachers': len(self._teachers.entries),
+                'students': len(self._students.entries),
+                'hits': self.hits,
+                'loads': self.loads
+            }
+
+authz_index = AuthzIndex(lambda: get_db_connection())
@@ -0,0 +1,154 @@
+"""增量同步：读取变更日志
+
+变更日志(changes表)由触发器维护，见迁移 5。changes_since() 返回某个
+版本之后的变更，同一行的多次变更合并为一条：行仍存在时为 upsert 并
+附带当前数据，已删除时为 delete。客户端应用后记住返回的 version，
+下次从这里继续；reset 为 True 时本地数据已无法增量更新，需要重新加载。
+
+旧的日志由 change_log_pruner 定期清理（超过 CHANGES_KEEP_VERSIONS 个版本
+或 CHANGES_KEEP_DAYS 天），since 早于保留范围时返回 reset。
+"""
+import json
+import threading
+
+from .config import (
+    CHANGES_PAGE_SIZE, CHANGES_KEEP_VERSIONS, CHANGES_KEEP_DAYS, CHANGES_PRUNE_INTERVAL
+)
+from .writer import run_write
+
+# 按主键批量读取当前行时每条语句的最多行数
+_LOOKUP_CHUNK = 200
+
+def current_version(conn):
+    """最新的变更版本号，没有任何变更时为0"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+    return row[0] if row else 0
+
+def _fetch_rows(conn, table, keys):
+    """按主键读取当前行，返回 {row_key: 行数据dict}"""
+    columns = list(json.loads(keys[0]))
+    found = {}
+    for start in range(0, len(keys), _LOOKUP_CHUNK):
+        chunk = keys[start:start + _LOOKUP_CHUNK]
+        values = [json.loads(key) for key in chunk]
+        params = [v[c] for v in values for c in columns]
+        if len(columns) == 1:
+            where = f'"{columns[0]}" IN ({", ".join("?" * len(chunk))})'
+        else:
+            row_values = ', '.join('(' + ', '.join('?' * len(columns)) + ')' for _ in chunk)
+            where = f'({", ".join(columns)}) IN (VALUES {row_values})'
+        cursor = conn.execute(f'SELECT * FROM "{table}" WHERE {where}', params)
+        names = [d[0] for d in cursor.description]
+        for row in cursor.fetchall():
+            data = dict(zip(names, row))
+            found[json.dumps({c: data[c] for c in columns}, separators=(',', ':'))] = data
+    return found
+
+def changes_since(conn, since, limit=CHANGES_PAGE_SIZE, tables=None):
+    """返回版本since之后的变更
+
+    结果: {version, current_version, has_more, reset, changes}，
+    changes 中每项为 {table, op('upsert'/'delete'), key, data}。
+    tables 非空时只返回这些表的变更。
+    """
+    # 先读当前版本：之后提交的变更会出现在下面的查询里或留到下一次同步
+    current = current_version(conn)
+    result = {'version': since, 'current_version': current,
+              'has_more': False, 'reset': False, 'changes': []}
+    oldest = conn.execute('SELECT MIN(version) FROM changes').fetchone()[0]
+    # 保留的最早版本；日志被全部清理时为下一个版本
+    retained = oldest if oldest is not None else current + 1
+    if since > current or since < retained - 1:
+        # 数据库被替换或旧日志已清理
+        result.update(version=current, reset=True)
+        return result
+
+    sql = 'SELECT version, table_name, op, row_key FROM changes WHERE version > ?'
+    params = [since]
+    if tables:
+        sql += f' AND table_name IN ({", ".join("?" * len(tables))})'
+        params.extend(tables)
+    sql += ' ORDER BY version LIMIT ?'
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    result['has_more'] = len(rows) > limit
+    rows = rows[:limit]
+
+    # 同一行只保留最后一次变更，顺序按最后变更的版本
+    latest = {}
+    for version, table, op, key in rows:
+        latest.pop((table, key), None)
+        latest[(table, key)] = op
+    pending = {}
+    for (table, key), op in latest.items():
+        if op != 'delete':
+            pending.setdefault(table, []).append(key)
+    current_rows = {table: _fetch_rows(conn, table, keys) for table, keys in pending.items()}
+
+    changes = result['changes']
+    for (table, key), op in latest.items():
+        # 行已不存在说明之后又被删除，直接按删除处理
+        data = current_rows.get(table, {}).get(key) if op != 'delete' else None
+        changes.append({
+            'table': table,
+            'op': 'upsert' if data is not None else 'delete',
+            'key': json.loads(key),
+            'data': data
+        })
+
+    if result['has_more']:
+        result['version'] = rows[-1][0]
+    else:
+        result['version'] = max(current, rows[-1][0]) if rows else max(current, since)
+    return result
+
+def prune_changes(conn, keep_versions=CHANGES_KEEP_VERSIONS, keep_days=CHANGES_KEEP_DAYS):
+    """删除超过保留范围的变更日志，返回删除的行数"""
+    clauses, params = [], []
+    if keep_versions:
+        clauses.append('version <= ?')
+        params.append(current_version(conn) - keep_versions)
+    if keep_days:
+        clauses.append("changed_at < datetime('now', ?)")
+        params.append(f'-{keep_days} days')
+    if not clauses:
+        return 0
+    return conn.execute(f'DELETE FROM changes WHERE {" OR ".join(clauses)}', params).rowcount
+
+class ChangeLogPruner:
+    """后台定期清理变更日志，删除操作交给单写线程执行"""
+
+    def __init__(self, interval=CHANGES_PRUNE_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self.pruned = 0
+
+    def run_once(self):
+        deleted = run_write(prune_changes)
+        self.pruned += deleted
+        return deleted
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print('清理变更日志失败:', e)
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=run, name='changes-prune', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+change_log_pruner = ChangeLogPruner()
@@ -3,8 +3,8 @@ import os
 # 获取当前脚本所在的目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# 确保数据库目录存在
-DATABASE_DIR = os.path.join(os.path.dirname(BASE_DIR), 'database')
+# 确保数据库目录存在（环境变量 EDU_DATABASE_DIR 可指定其他目录，如压测时的数据副本）
+DATABASE_DIR = os.environ.get('EDU_DATABASE_DIR') or os.path.join(os.path.dirname(BASE_DIR), 'database')
 if not os.path.exists(DATABASE_DIR):
     os.makedirs(DATABASE_DIR)
 
@@ -17,3 +17,96 @@ DATABASE_CONFIG = {
     'check_same_thread': False  # 允许多线程访问
 }
 
+
+# 批量请求(/api/batch)单次允许的最大子请求数
+BATCH_MAX_REQUESTS = 50
+
+# 查询结果缓存（默认关闭，设置环境变量 EDU_QUERY_CACHE=1 开启）
+# 缓存在每个进程内各自维护，写操作只使本进程的缓存失效，多进程部署时不要开启
+QUERY_CACHE_ENABLED = os.environ.get('EDU_QUERY_CACHE', '0') == '1'
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get('EDU_QUERY_CACHE_MAX_ENTRIES', '1024'))
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('EDU_QUERY_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# 流式导出每批读取/写出的行数
+EXPORT_CHUNK_SIZE = int(os.environ.get('EDU_EXPORT_CHUNK_SIZE', '500'))
+
+# 只读分析快照（默认关闭，设置环境变量 EDU_SNAPSHOT=1 后报表和导出读取快照）
+SNAPSHOT_ENABLED = os.environ.get('EDU_SNAPSHOT', '0') == '1'
+SNAPSHOT_PATH = os.path.join(DATABASE_DIR, 'edu_system_snapshot.db')
+# 快照允许的最大陈旧时间（秒），超过后读取前先同步刷新
+SNAPSHOT_MAX_AGE = float(os.environ.get('EDU_SNAPSHOT_MAX_AGE', '300'))
+# 在线备份每步复制的页数及步间休眠（秒），步间释放主库的锁
+SNAPSHOT_PAGES_PER_STEP = int(os.environ.get('EDU_SNAPSHOT_PAGES_PER_STEP', '256'))
+SNAPSHOT_STEP_SLEEP = float(os.environ.get('EDU_SNAPSHOT_STEP_SLEEP', '0.005'))
+
+# 已结束学期的选课、成绩和作业归档到此目录下的独立数据库文件
+ARCHIVE_DIR = os.path.join(DATABASE_DIR, 'archive')
+
+# 候补递补线程空闲时巡检有空位课程的间隔（秒）
+WAITLIST_SWEEP_INTERVAL = float(os.environ.get('EDU_WAITLIST_SWEEP_INTERVAL', '30'))
+
+# 单写线程：写操作路由在写线程上执行并合并提交（设置 EDU_WRITER=0 关闭，
+# 关闭后每个写请求在自己的线程里用独立连接和 BEGIN IMMEDIATE 事务执行）
+WRITER_ENABLED = os.environ.get('EDU_WRITER', '1') == '1'
+# 合并提交的等待窗口（秒）和每个事务最多合并的写任务数
+WRITER_GROUP_WINDOW = float(os.environ.get('EDU_WRITER_GROUP_WINDOW', '0.002'))
+WRITER_MAX_GROUP = int(os.environ.get('EDU_WRITER_MAX_GROUP', '64'))
+
+# 数据库忙(database is locked)时的处理：连接等待锁的秒数、自动重试次数及
+# 重试间隔（指数退避加随机抖动，单位秒）
+DB_BUSY_TIMEOUT = float(os.environ.get('EDU_DB_BUSY_TIMEOUT', '1'))
+DB_BUSY_RETRIES = int(os.environ.get('EDU_DB_BUSY_RETRIES', '4'))
+DB_RETRY_BASE_DELAY = float(os.environ.get('EDU_DB_RETRY_BASE_DELAY', '0.02'))
+DB_RETRY_MAX_DELAY = float(os.environ.get('EDU_DB_RETRY_MAX_DELAY', '0.5'))
+# 单条语句的执行时间预算（秒，0 表示不限制），超时的语句被中断
+DB_STATEMENT_BUDGET = float(os.environ.get('EDU_DB_STATEMENT_BUDGET', '10'))
+# 每执行多少条虚拟机指令检查一次时间预算
+DB_PROGRESS_STEPS = int(os.environ.get('EDU_DB_PROGRESS_STEPS', '10000'))
+
+# 增量同步(/api/changes)每次最多返回的变更记录数
+CHANGES_PAGE_SIZE = int(os.environ.get('EDU_CHANGES_PAGE_SIZE', '1000'))
+# 变更日志保留最近多少个版本、多少天（0 表示不按该条件清理），每隔多少秒清理一次；
+# since 早于保留范围的客户端会收到 reset，需要重新加载
+CHANGES_KEEP_VERSIONS = int(os.environ.get('EDU_CHANGES_KEEP_VERSIONS', '100000'))
+CHANGES_KEEP_DAYS = float(os.environ.get('EDU_CHANGES_KEEP_DAYS', '30'))
+CHANGES_PRUNE_INTERVAL = float(os.environ.get('EDU_CHANGES_PRUNE_INTERVAL', '3600'))
+
+# 权限索引（教师/学生 -> 课程集合）的有效期（秒）；本进程内的修改会立即
+# 失效对应条目，有效期用于兜底其他进程的修改
+AUTHZ_INDEX_TTL = float(os.environ.get('EDU_AUTHZ_INDEX_TTL', '60'))
+
+# 学生作业流每页的默认条数和最大条数
+FEED_PAGE_SIZE = int(os.environ.get('EDU_FEED_PAGE_SIZE', '20'))
+FEED_MAX_PAGE_SIZE = 100
+
+# 生产服务器(serve.py)：监听地址、工作进程数、每个进程的线程数、
+# 每个进程处理多少请求后退出重启（0 表示不重启）、平滑退出的最长等待秒数
+SERVER_BIND = os.environ.get('EDU_SERVER_BIND', '0.0.0.0:5000')
+SERVER_WORKERS = int(os.environ.get('EDU_SERVER_WORKERS', str(os.cpu_count() or 1)))
+SERVER_THREADS = int(os.environ.get('EDU_SERVER_THREADS', '8'))
+SERVER_MAX_REQUESTS = int(os.environ.get('EDU_SERVER_MAX_REQUESTS', '0'))
+SERVER_GRACEFUL_TIMEOUT = float(os.environ.get('EDU_SERVER_GRACEFUL_TIMEOUT', '30'))
+
+# 运行指标(/metrics)：是否通过指标文件汇总多个进程（serve.py 的工作进程总是开启）、
+# 指标文件目录、写入间隔（秒），抓取时要求的 Bearer 令牌（为空时只允许管理员会话），
+# 以及是否允许不经校验抓取
+METRICS_SHARED = os.environ.get('EDU_METRICS_SHARED', '0') == '1'
+METRICS_DIR = os.environ.get('EDU_METRICS_DIR') or os.path.join(DATABASE_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('EDU_METRICS_FLUSH_INTERVAL', '1'))
+METRICS_TOKEN = os.environ.get('EDU_METRICS_TOKEN', '')
+METRICS_PUBLIC = os.environ.get('EDU_METRICS_PUBLIC', '0') == '1'
+
+# 按需性能分析：结果目录、最多保留的次数（超出后删除最早的）、对 /api 请求
+# 随机抽样分析的比例（0 表示不抽样），以及签名请求头用的密钥（为空时用应用的 secret_key）
+PROFILE_DIR = os.environ.get('EDU_PROFILE_DIR') or os.path.join(DATABASE_DIR, 'profiles')
+PROFILE_KEEP = int(os.environ.get('EDU_PROFILE_KEEP', '200'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('EDU_PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SECRET = os.environ.get('EDU_PROFILE_SECRET', '')
+# 请求头分析令牌的最长有效期（秒）
+PROFILE_TOKEN_MAX_TTL = int(os.environ.get('EDU_PROFILE_TOKEN_MAX_TTL', '900'))
+
+# 请求录制（供 benchmarks.replay 回放）：设置 EDU_RECORD=1 开启，录制文件写入
+# RECORD_DIR，每个进程一个文件，每隔 RECORD_FLUSH_INTERVAL 秒追加一次
+RECORD_ENABLED = os.environ.get('EDU_RECORD', '0') == '1'
+RECORD_DIR = os.environ.get('EDU_RECORD_DIR') or os.path.join(DATABASE_DIR, 'recordings')
+RECORD_FLUSH_INTERVAL = float(os.environ.get('EDU_RECORD_FLUSH_INTERVAL', '1'))
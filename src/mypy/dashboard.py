@@ -0,0 +1,46 @@
+"""教师看板
+
+一条查询返回教师所有课程的选课人数、作业数（courses 上由触发器维护的
+计数列）、已录入成绩人数和最近发布的作业，页面不必再逐门课程请求学生
+和作业列表。课程范围来自权限索引(mypy.authz)。
+"""
+import json
+
+def teacher_dashboard(conn, course_ids, recent=3):
+    """返回课程看板列表，按课程名排序
+
+    每门课程包含 courses 表的全部字段，以及 graded_count(已录入成绩的选课
+    人数)、grade_completeness(录入比例，无人选课时为None)、
+    recent_assignments(最近 recent 条作业)。
+    """
+    course_ids = sorted(course_ids)
+    if not course_ids:
+        return []
+    placeholders = ', '.join('?' * len(course_ids))
+    cursor = conn.execute(f'''
+        WITH recent AS (
+            SELECT course_id, id, title, create_time,
+                ROW_NUMBER() OVER (PARTITION BY course_id ORDER BY create_time DESC, id DESC) AS rn
+            FROM assignments
+            WHERE course_id IN ({placeholders})
+        )
+        SELECT c.*,
+            (SELECT COUNT(*) FROM grades g
+             JOIN student_courses sc ON sc.student_id = g.student_id AND sc.course_id = g.course_id
+             WHERE g.course_id = c.id) AS graded_count,
+            (SELECT json_group_array(json_object('id', r.id, 'title', r.title, 'create_time', r.create_time))
+             FROM (SELECT * FROM recent WHERE course_id = c.id AND rn <= ? ORDER BY rn) r
+            ) AS recent_assignments
+        FROM courses c
+        WHERE c.id IN ({placeholders})
+        ORDER BY c.name
+    ''', (*course_ids, recent, *course_ids))
+    names = [d[0] for d in cursor.description]
+    courses = []
+    for row in cursor.fetchall():
+        course = dict(zip(names, row))
+        course['recent_assignments'] = json.loads(course['recent_assignments'] or '[]')
+        enrolled = course['enrollment_count']
+        course['grade_completeness'] = round(course['graded_count'] / enrolled, 3) if enrolled else None
+        courses.append(course)
+    return courses
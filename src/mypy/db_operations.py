@@ -1,17 +1,309 @@
 import sqlite3
-from .config import DATABASE_PATH
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from .config import (
+    DATABASE_PATH, QUERY_CACHE_ENABLED,
+    QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_BYTES,
+    DB_BUSY_TIMEOUT, DB_STATEMENT_BUDGET, DB_PROGRESS_STEPS
+)
+from .query_cache import QueryCache, tables_in, is_select
+from .schema_catalog import SchemaCatalog
+from .rows import RowFactory, table_row_name
+from .resilience import QueryTimeout, retry_busy, db_metrics, note_unavailable
+from .metrics import metrics, statement_kind
 import time
 
+# 线程本地状态：批量请求期间绑定的共享连接
+_local = threading.local()
+
+# 进程内查询结果缓存
+query_cache = QueryCache(
+    max_entries=QUERY_CACHE_MAX_ENTRIES,
+    max_bytes=QUERY_CACHE_MAX_BYTES,
+    enabled=QUERY_CACHE_ENABLED
+)
+
+# 表结构目录：每个结构版本只加载一次表结构
+schema_catalog = SchemaCatalog(lambda: get_db_connection())
+
+_WRITE_ACTIONS = (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE)
+# 记住写过哪些表的语句条数，要大于sqlite3模块的语句缓存（默认128条）
+_STATEMENT_TABLES_SIZE = 512
+
+class Cursor(sqlite3.Cursor):
+    """执行语句时启动时间预算，数据库忙时按连接的规则重试"""
+
+    def execute(self, sql, parameters=()):
+        return self.connection._run_statement(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # 参数为迭代器时已被部分消费，不能重试
+        retryable = isinstance(seq_of_parameters, (list, tuple))
+        return self.connection._run_statement(super().executemany, sql, seq_of_parameters,
+                                              retryable=retryable)
+
+    def fetchone(self):
+        return self.connection._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self.connection._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self.connection._fetch(super().fetchall)
+
+class Connection(sqlite3.Connection):
+    """数据库连接
+
+    启用查询缓存时，通过授权回调记录当前事务写过的表，提交后使这些表的
+    缓存失效并清空记录，回滚时直接清空，因此直接用游标执行的写操作也能
+    正确失效。授权回调只在准备语句时触发，被sqlite3模块缓存的语句再次
+    执行时不会触发，所以按SQL记住每条语句写的表，执行时从这里补上。
+
+    每条语句受 statement_budget 秒的时间预算限制（None或0不限制），超时
+    抛出QueryTimeout；不在事务中的语句和COMMIT遇到数据库忙时自动退避
+    重试（见mypy.resilience）。语句、取结果和提交的耗时及打开的连接数
+    记录在 mypy.metrics。
+    """
+
+    statement_budget = DB_STATEMENT_BUDGET
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.written_tables = set()
+        self._preparing = set()
+        self._statement_tables = OrderedDict()
+        self._deadline = None
+        self._timed_out = False
+        self._open = True
+        metrics.add('edu_db_connections_opened_total')
+        metrics.add('edu_db_connections_open')
+        if query_cache.enabled:
+            self.set_authorizer(self._track_writes)
+        if DB_PROGRESS_STEPS > 0:
+            self.set_progress_handler(self._check_budget, DB_PROGRESS_STEPS)
+
+    def _track_writes(self, action, arg1, arg2, dbname, source):
+        if action in _WRITE_ACTIONS and arg1:
+            self._preparing.add(arg1)
+        return sqlite3.SQLITE_OK
+
+    def _note_written(self, sql):
+        """把语句写的表记入当前事务"""
+        if self._preparing:
+            # 本次执行重新准备了语句
+            tables = self._statement_tables[sql] = frozenset(self._preparing)
+            self._preparing = set()
+            if len(self._statement_tables) > _STATEMENT_TABLES_SIZE:
+                self._statement_tables.popitem(last=False)
+        else:
+            tables = self._statement_tables.get(sql)
+            if not tables:
+                return
+        self._statement_tables.move_to_end(sql)
+        self.written_tables.update(tables)
+
+    def _check_budget(self):
+        # 进度回调返回非0值时SQLite中断当前语句
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self._timed_out = True
+            return 1
+        return 0
+
+    def _start_budget(self):
+        self._timed_out = False
+        budget = self.statement_budget
+        self._deadline = time.monotonic() + budget if budget else None
+
+    def _timeout_error(self, error):
+        """语句因超出时间预算被中断时返回对应的QueryTimeout，否则返回None"""
+        if not self._timed_out:
+            return None
+        self._timed_out = False
+        db_metrics.record('timeout', 'statement')
+        return note_unavailable(QueryTimeout(f'语句执行超过{self.statement_budget}秒，已中断'))
+
+    def _discard_transaction(self):
+        # 失败语句隐式开启的事务中还没有任何修改，直接回滚
+        if self.in_transaction:
+            sqlite3.Connection.rollback(self)
+
+    def _released(self):
+        if getattr(self, '_open', False):
+            self._open = False
+            metrics.add('edu_db_connections_open', -1)
+
+    def close(self):
+        self._released()
+        super().close()
+
+    def __del__(self):
+        # 没有显式关闭的连接被回收时同样计入
+        self._released()
+
+    def _run_statement(self, call, *args, retryable=True):
+        started = time.perf_counter()
+        try:
+            return self._run_with_retry(call, *args, retryable=retryable)
+        finally:
+            metrics.record_statement(statement_kind(args[0]), time.perf_counter() - started)
+            # 失败的语句也记入，多失效一次没有影响
+            self._note_written(args[0])
+
+    def _run_with_retry(self, call, *args, retryable=True):
+        def attempt():
+            self._start_budget()
+            try:
+                return call(*args)
+            except sqlite3.OperationalError as e:
+                timeout = self._timeout_error(e)
+                if timeout is not None:
+                    raise timeout from e
+                raise
+        # 事务中途的语句失败后重试可能与其他连接互相等待，只重试事务外的语句
+        if not retryable or self.in_transaction:
+            return attempt()
+        return retry_busy(attempt, 'statement', reset=self._discard_transaction)
+
+    def _fetch(self, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        except sqlite3.OperationalError as e:
+            timeout = self._timeout_error(e)
+            if timeout is not None:
+                raise timeout from e
+            raise
+        finally:
+            metrics.record_statement('FETCH', time.perf_counter() - started)
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or Cursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        self._start_budget()
+        try:
+            return super().executescript(script)
+        finally:
+            # 脚本中的语句不经过语句缓存，直接记入
+            self.written_tables.update(self._preparing)
+            self._preparing = set()
+
+    def commit(self):
+        # COMMIT遇到数据库忙可以安全重试，事务保持不变
+        started = time.perf_counter()
+        try:
+            retry_busy(lambda: sqlite3.Connection.commit(self), 'commit')
+        finally:
+            metrics.record_statement('COMMIT', time.perf_counter() - started)
+        if self.written_tables:
+            query_cache.invalidate(*self.written_tables)
+            self.written_tables.clear()
+
+    def rollback(self):
+        super().rollback()
+        self.written_tables.clear()
+
+class SharedConnection(Connection):
+    """批量请求期间共享的连接
+
+    处理函数调用close()不会真正关闭连接；事务模式(deferred=True)下
+    commit()/rollback()也不生效，由批量请求统一提交或回滚。
+    job_callbacks 不为None时收集提交后回调（见 writer.after_commit）。
+    """
+    deferred = False
+    job_callbacks = None
+
+    def close(self):
+        pass
+
+    def commit(self):
+        if not self.deferred:
+            super().commit()
+
+    def rollback(self):
+        if not self.deferred:
+            super().rollback()
+
+    def finish(self, commit):
+        """结束共享连接上的事务，commit为False时回滚全部修改"""
+        callbacks = self.job_callbacks or []
+        if self.job_callbacks is not None:
+            self.job_callbacks = []
+        if commit:
+            Connection.commit(self)
+            for callback in callbacks:
+                callback()
+        else:
+            super().rollback()
+
+    def really_close(self):
+        super().close()
+
 def get_db_connection():
-    """创建数据库连接"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    """创建数据库连接，若当前线程绑定了共享连接则直接返回它"""
+    shared = getattr(_local, 'shared_conn', None)
+    if shared is not None:
+        return shared
+    conn = sqlite3.connect(DATABASE_PATH, factory=Connection, timeout=DB_BUSY_TIMEOUT)
     conn.row_factory = sqlite3.Row  # 设置行工厂，使结果可以通过列名访问
     return conn
 
-def execute_query(query, params=(), fetch_all=True):
-    """执行查询并返回结果"""
+def bound_connection():
+    """返回当前线程绑定的共享连接，没有时返回None"""
+    return getattr(_local, 'shared_conn', None)
+
+def bind_connection(conn):
+    """把连接绑定为当前线程的共享连接（conn为None时解除绑定）"""
+    _local.shared_conn = conn
+
+@contextmanager
+def shared_connection(transactional=False):
+    """在当前线程内共享同一个数据库连接
+
+    期间所有get_db_connection()调用都返回该连接；transactional为True时
+    所有写操作处于同一事务中，由调用方通过finish()决定提交还是回滚。
+    """
+    if getattr(_local, 'shared_conn', None) is not None:
+        raise RuntimeError('当前线程已绑定共享连接')
+    conn = sqlite3.connect(DATABASE_PATH, factory=SharedConnection, timeout=DB_BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    conn.deferred = transactional
+    conn.job_callbacks = [] if transactional else None
+    _local.shared_conn = conn
+    try:
+        yield conn
+    finally:
+        _local.shared_conn = None
+        conn.really_close()
+
+def execute_query(query, params=(), fetch_all=True, use_cache=True, row_type=None):
+    """执行查询并返回结果
+
+    启用查询缓存时SELECT结果会被缓存，use_cache=False可跳过缓存直接查询。
+    批量请求共享连接期间不使用缓存，以免缓存到未提交的数据。
+    row_type为行类型名时返回紧凑行对象(mypy.rows)而不是sqlite3.Row。
+    """
+    cacheable = (use_cache and query_cache.enabled and is_select(query)
+                 and getattr(_local, 'shared_conn', None) is None)
+    if cacheable:
+        key = query_cache.make_key(query, params, (fetch_all, row_type))
+        hit, result = query_cache.get(key)
+        if hit:
+            return result
+        tables = tables_in(query)
+        token = query_cache.generation(tables)
+
     conn = get_db_connection()
     cursor = conn.cursor()
+    if row_type:
+        cursor.row_factory = RowFactory(row_type)
     try:
         cursor.execute(query, params)
         if fetch_all:
@@ -19,13 +311,16 @@ def execute_query(query, params=(), fetch_all=True):
         else:
             result = cursor.fetchone()
         conn.commit()
-        return result
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         conn.close()
 
+    if cacheable:
+        query_cache.put(key, tables, result, token)
+    return result
+
 def execute_insert(query, params=()):
     """执行插入操作并返回新记录的ID"""
     conn = get_db_connection()
@@ -68,18 +363,11 @@ def add_record(table, data_dict):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        # 获取表结构信息
-        cursor.execute(f"PRAGMA table_info({table})")
-        table_info = cursor.fetchall()
-        
-        # 查找必需字段（具有NOT NULL约束且没有默认值的字段）
-        required_fields = []
-        for field in table_info:
-            if field['notnull'] == 1 and field['dflt_value'] is None and field['name'] != 'id':
-                required_fields.append(field['name'])
-        
+        # 从表结构目录获取表结构信息（必需字段：NOT NULL且无默认值）
+        info = schema_catalog.table(table, conn, data_dict.keys())
+
         # 检查是否所有必需字段都在data_dict中
-        missing_fields = [f for f in required_fields if f not in data_dict]
+        missing_fields = [f for f in info.required if f not in data_dict]
         if missing_fields:
             # 特殊情况处理: enrollment_year
             if 'enrollment_year' in missing_fields and table == 'students':
@@ -90,13 +378,18 @@ def add_record(table, data_dict):
             if missing_fields:
                 raise ValueError(f"缺少必要字段: {', '.join(missing_fields)}")
         
-        # 构建SQL语句
-        fields = ', '.join(data_dict.keys())
-        placeholders = ', '.join(['?'] * len(data_dict))
-        sql = f"INSERT INTO {table} ({fields}) VALUES ({placeholders})"
+        # 按字段组合复用缓存的INSERT语句
+        sql = schema_catalog.insert_sql(table, tuple(data_dict.keys()))
         
         # 执行插入
-        cursor.execute(sql, list(data_dict.values()))
+        try:
+            cursor.execute(sql, list(data_dict.values()))
+        except sqlite3.OperationalError:
+            # 表结构可能已被其他进程修改，重新加载后重试一次
+            if not schema_catalog.refresh_if_changed(conn):
+                raise
+            conn.close()
+            return add_record(table, data_dict)
         conn.commit()
         return cursor.lastrowid
     except Exception as e:
@@ -106,8 +399,14 @@ def add_record(table, data_dict):
     finally:
         conn.close()
 
+def _check_columns(table, *column_groups):
+    """用表结构目录校验表名和字段名"""
+    columns = [c for group in column_groups for c in group]
+    schema_catalog.table(table, columns=columns)
+
 def update_record(table, data, condition):
     """通用更新记录函数"""
+    _check_columns(table, data.keys(), condition.keys())
     set_clause = ', '.join([f"{k} = ?" for k in data.keys()])
     where_clause = ' AND '.join([f"{k} = ?" for k in condition.keys()])
     query = f"UPDATE {table} SET {set_clause} WHERE {where_clause}"
@@ -120,13 +419,15 @@ def delete_record(table, condition):
     query = f"DELETE FROM {table} WHERE {where_clause}"
     return execute_delete(query, tuple(condition.values()))
 
-def get_records(table, condition=None):
-    """通用获取记录函数"""
+def get_records(table, condition=None, use_cache=True, typed=False):
+    """通用获取记录函数，typed为True时返回该表的紧凑行对象"""
+    _check_columns(table, condition.keys() if condition else ())
     query = f"SELECT * FROM {table}"
     params = ()
     if condition:
         where_clause = ' AND '.join([f"{k} = ?" for k in condition.keys()])
         query += f" WHERE {where_clause}"
         params = tuple(condition.values())
-    return execute_query(query, params)
+    return execute_query(query, params, use_cache=use_cache,
+                         row_type=table_row_name(table) if typed else None)
 
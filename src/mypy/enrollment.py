@@ -0,0 +1,88 @@
+"""选课：在一个 BEGIN IMMEDIATE 事务中原子地占用课程名额
+
+BEGIN IMMEDIATE 在事务开始时就取得写锁，检查学生、容量、时间冲突和
+插入选课记录之间不会有其他写入插进来，因此不会超额选课。等待写锁
+的时间由连接的 timeout 控制。已选人数由 student_courses 上的触发器
+维护，容量触发器在数据库层面再兜底一次。
+"""
+import sqlite3
+
+class EnrollmentError(Exception):
+    """选课失败，status 为对应的HTTP状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def find_time_conflict(conn, student_pk, times):
+    """返回与学生已选课程冲突的上课时间段，没有冲突时返回None"""
+    if not times:
+        return None
+    new_times = set(times.split('|'))
+    cursor = conn.execute('''
+        SELECT c.times
+        FROM courses c
+        JOIN student_courses sc ON c.id = sc.course_id
+        WHERE sc.student_id = ? AND c.times IS NOT NULL
+    ''', (student_pk,))
+    for (existing,) in cursor:
+        if not existing:
+            continue
+        for slot in existing.split('|'):
+            if slot in new_times:
+                return slot
+    return None
+
+def enroll(conn, student_pk, course, check_capacity=True):
+    """在当前事务中为学生（内部ID）选课，course 为课程行
+
+    调用方负责开启事务；检查不通过时抛出 EnrollmentError。
+    """
+    already = conn.execute(
+        'SELECT 1 FROM student_courses WHERE student_id = ? AND course_id = ?',
+        (student_pk, course['id'])).fetchone()
+    if already:
+        raise EnrollmentError('您已经选择了这门课程')
+
+    if check_capacity and course['capacity'] is not None \
+            and course['enrollment_count'] >= course['capacity']:
+        raise EnrollmentError('课程已满', 409)
+
+    conflict = find_time_conflict(conn, student_pk, course['times'])
+    if conflict:
+        raise EnrollmentError(f'时间冲突：您在{conflict}已有其他课程')
+
+    try:
+        conn.execute('INSERT INTO student_courses (student_id, course_id) VALUES (?, ?)',
+                     (student_pk, course['id']))
+    except sqlite3.IntegrityError as e:
+        if 'course is full' in str(e):
+            raise EnrollmentError('课程已满', 409) from None
+        raise
+
+def reserve_seat(conn, student_id, course_id):
+    """学生（学号）选课：占用名额并写入选课记录，成功时提交
+
+    连接已处于事务中（如事务模式的批量请求）时直接加入该事务，
+    否则开启 BEGIN IMMEDIATE 事务。失败时回滚并抛出 EnrollmentError。
+    """
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        student = conn.execute('SELECT id FROM students WHERE student_id = ?',
+                               (student_id,)).fetchone()
+        if not student:
+            raise EnrollmentError('找不到学生信息', 404)
+
+        course = conn.execute(
+            'SELECT id, times, capacity, enrollment_count FROM courses WHERE id = ?',
+            (course_id,)).fetchone()
+        if not course:
+            raise EnrollmentError('找不到课程信息', 404)
+
+        enroll(conn, student[0], course)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
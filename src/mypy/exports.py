@@ -0,0 +1,265 @@
+"""成绩册、花名册和选课名单的流式导出
+
+查询结果用 fetchmany 分批读取，每行写出后立即交给响应，内存占用只与
+批大小有关，与导出的行数无关。支持 CSV 和 XLSX 两种格式；XLSX 由
+zipfile 直接写出工作表XML（内联字符串，不需要共享字符串表）。
+"""
+import csv
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+from .config import EXPORT_CHUNK_SIZE
+from .archive import history_sources, course_history_sources
+
+GRADEBOOK_HEADER = ['课程ID', '课程名称', '学期', '学分', '学号', '姓名',
+                    '平时成绩', '期中成绩', '期末成绩', '总评']
+ROSTER_HEADER = ['学号', '姓名', '入学年份']
+ENROLLMENT_HEADER = ['学号', '姓名', '课程ID', '课程名称', '学期', '学分', '上课时间']
+
+def weighted_total(row):
+    """按课程的平时/期中/期末占比计算总评，与学生成绩页面的计算方式一致"""
+    total = ((row['usual_grade'] or 0) * row['usual_score']
+             + (row['midterm_grade'] or 0) * row['midterm_score']
+             + (row['final_grade'] or 0) * row['final_score']) / 100
+    return round(total, 2)
+
+def _filters(course_id=None, term=None):
+    clauses, params = [], []
+    if course_id is not None:
+        clauses.append('c.id = ?')
+        params.append(course_id)
+    if term:
+        clauses.append('c.term = ?')
+        params.append(term)
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+    return where, params
+
+def gradebook_query(sources, course_id=None, term=None):
+    """成绩册：课程的所有选课学生及成绩，未录入的成绩为空"""
+    where, params = _filters(course_id, term)
+    sql = f'''
+        SELECT c.id AS course_id, c.name AS course_name, c.term, c.credit,
+            c.usual_score, c.midterm_score, c.final_score,
+            s.student_id, s.name AS student_name,
+            g.usual_grade, g.midterm_grade, g.final_grade
+        FROM {sources['student_courses']} sc
+        JOIN courses c ON sc.course_id = c.id
+        JOIN students s ON sc.student_id = s.id
+        LEFT JOIN {sources['grades']} g ON g.student_id = sc.student_id AND g.course_id = sc.course_id
+        {where}
+        ORDER BY c.id, s.student_id
+    '''
+    return sql, params
+
+def gradebook_row(row):
+    return [row['course_id'], row['course_name'], row['term'], row['credit'],
+            row['student_id'], row['student_name'],
+            row['usual_grade'], row['midterm_grade'], row['final_grade'],
+            weighted_total(row)]
+
+def roster_query(sources, course_id=None, term=None):
+    """花名册：指定课程（或学期）的学生，不指定时为全部学生"""
+    if course_id is None and not term:
+        return ('SELECT student_id, name, enrollment_year FROM students '
+                'ORDER BY student_id'), []
+    where, params = _filters(course_id, term)
+    sql = f'''
+        SELECT DISTINCT s.student_id, s.name, s.enrollment_year
+        FROM students s
+        JOIN {sources['student_courses']} sc ON sc.student_id = s.id
+        JOIN courses c ON sc.course_id = c.id
+        {where}
+        ORDER BY s.student_id
+    '''
+    return sql, params
+
+def roster_row(row):
+    return [row['student_id'], row['name'], row['enrollment_year']]
+
+def enrollment_query(sources, course_id=None, term=None):
+    """选课名单：每条选课记录一行"""
+    where, params = _filters(course_id, term)
+    sql = f'''
+        SELECT s.student_id, s.name AS student_name, c.id AS course_id,
+            c.name AS course_name, c.term, c.credit, c.times
+        FROM {sources['student_courses']} sc
+        JOIN courses c ON sc.course_id = c.id
+        JOIN students s ON sc.student_id = s.id
+        {where}
+        ORDER BY c.id, s.student_id
+    '''
+    return sql, params
+
+def enrollment_row(row):
+    return [row['student_id'], row['student_name'], row['course_id'],
+            row['course_name'], row['term'], row['credit'], row['times']]
+
+# 导出类型 -> (文件名前缀, 表头, 查询构造函数, 行转换函数)
+EXPORTS = {
+    'grades': ('gradebook', GRADEBOOK_HEADER, gradebook_query, gradebook_row),
+    'roster': ('roster', ROSTER_HEADER, roster_query, roster_row),
+    'enrollments': ('enrollments', ENROLLMENT_HEADER, enrollment_query, enrollment_row),
+}
+
+def iter_rows(cursor, sql, params, chunk_size=EXPORT_CHUNK_SIZE):
+    """执行查询并按批读取结果行"""
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+def stream_csv(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """逐批生成CSV字节块（带BOM，Excel可直接打开中文）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+class _ChunkBuffer:
+    """zipfile的输出目标：只追加、不可定位，由生成器取走已写出的数据"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'),
+}
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if value is None:
+            cells.append('<c/>')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            cells.append(f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+    return '<row>' + ''.join(cells) + '</row>'
+
+def stream_xlsx(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """逐批生成XLSX字节块
+
+    输出目标不可定位时zipfile使用数据描述符记录压缩后的大小，
+    因此工作表可以边压缩边输出，不需要先在内存中生成完整文件。
+    """
+    out = _ChunkBuffer()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_STATIC.items():
+            zf.writestr(name, content)
+        yield out.drain()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>')
+            sheet.write(_xlsx_row(header).encode('utf-8'))
+            pending = 0
+            for row in rows:
+                sheet.write(_xlsx_row(row).encode('utf-8'))
+                pending += 1
+                if pending >= chunk_size:
+                    pending = 0
+                    data = out.drain()
+                    if data:
+                        yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield out.drain()
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', stream_csv),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', stream_xlsx),
+}
+
+def export_stream(conn, kind, fmt='csv', course_id=None, term=None):
+    """生成指定导出的 (文件名, MIME类型, 字节块生成器)
+
+    生成器读完数据后关闭conn，因此conn必须专供本次导出使用。
+    导出类型或格式无效时抛出ValueError。
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f'不支持的导出类型: {kind}')
+    if fmt not in FORMATS:
+        raise ValueError(f'不支持的导出格式: {fmt}')
+    prefix, header, build_query, to_values = EXPORTS[kind]
+    mimetype, writer = FORMATS[fmt]
+    # 已归档学期的数据同样可以导出：只附加查询涉及的学期归档
+    if term:
+        sources = history_sources(conn, [term])
+    elif course_id is not None:
+        sources = course_history_sources(conn, course_id)
+    else:
+        sources = history_sources(conn)
+    sql, params = build_query(sources, course_id, term)
+    if hasattr(conn, 'statement_budget'):
+        # 流式导出按客户端的读取速度取数据，不受单条语句时间预算限制
+        conn.statement_budget = None
+
+    def generate():
+        try:
+            cursor = conn.cursor()
+            rows = (to_values(row) for row in iter_rows(cursor, sql, params))
+            yield from writer(header, rows)
+        finally:
+            conn.close()
+
+    parts = [prefix]
+    if course_id is not None:
+        parts.append(f'course{course_id}')
+    if term:
+        parts.append(term)
+    return '_'.join(parts) + '.' + fmt, mimetype, generate()
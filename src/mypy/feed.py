@@ -0,0 +1,57 @@
+"""学生作业流
+
+把学生所选全部课程的作业按发布时间倒序合并成一个列表，用键集分页：
+游标记录上一页最后一条的 (create_time, id)，下一页只取比它更早的作业，
+翻到后面也不需要 OFFSET 扫描前面的行。每门课程的作业通过
+(course_id, create_time) 索引按时间顺序读取。只包含当前学期（主库）的作业。
+"""
+import base64
+import json
+
+from .config import FEED_PAGE_SIZE
+
+def encode_cursor(create_time, assignment_id):
+    raw = json.dumps([create_time, assignment_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """解析分页游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        create_time, assignment_id = json.loads(raw)
+    except Exception:
+        raise ValueError('无效的分页游标')
+    if not isinstance(assignment_id, int):
+        raise ValueError('无效的分页游标')
+    return create_time, assignment_id
+
+def assignment_feed(conn, student_id, cursor=None, limit=FEED_PAGE_SIZE):
+    """返回 {'items', 'next_cursor'}，没有更多作业时 next_cursor 为None
+
+    student_id 为学号；cursor 为上一页返回的 next_cursor。
+    """
+    condition = ''
+    params = [student_id]
+    if cursor:
+        condition = 'AND (a.create_time, a.id) < (?, ?)'
+        params.extend(decode_cursor(cursor))
+    # 多取一条判断是否还有下一页
+    params.append(limit + 1)
+    rows = conn.execute(f'''
+        SELECT a.id, a.course_id, c.name AS course_name, a.title, a.content, a.create_time
+        FROM students s
+        JOIN student_courses sc ON sc.student_id = s.id
+        JOIN assignments a ON a.course_id = sc.course_id
+        JOIN courses c ON c.id = a.course_id
+        WHERE s.student_id = ? {condition}
+        ORDER BY a.create_time DESC, a.id DESC
+        LIMIT ?
+    ''', params).fetchall()
+
+    names = ('id', 'course_id', 'course_name', 'title', 'content', 'create_time')
+    items = [dict(zip(names, row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last['create_time'], last['id'])
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,361 @@
+"""运行指标：请求耗时、状态码、数据库语句、连接和缓存，按 Prometheus 文本格式输出
+
+记录指标只修改本进程内存中的计数。每个线程固定使用若干分片中的一个，
+每个分片有自己的锁，线程之间基本不会争用。
+
+默认只输出本进程的指标，不写文件。开启共享（serve.py 的工作进程，或设置
+EDU_METRICS_SHARED=1）后，每个进程有一个后台线程，每隔
+METRICS_FLUSH_INTERVAL 秒把本进程的指标原子写入 METRICS_DIR/<pid>.json。
+抓取 /metrics 时汇总目录中所有进程的文件，所以多进程部署下
+看到的是全部工作进程的合计。已退出进程的计数器和直方图会并入
+retired.json，然后删除它的文件，这样总数不会因为进程重启而变小。
+仪表（当前连接数、缓存条目数等）只统计仍在运行的进程。
+"""
+import atexit
+import bisect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只有单进程的开发服务器，不需要文件锁
+    fcntl = None
+
+from .config import METRICS_DIR, METRICS_FLUSH_INTERVAL, METRICS_SHARED
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# 名称 -> (类型, 说明, 直方图分桶)
+METRICS = {
+    'edu_http_request_duration_seconds': ('histogram', '请求处理耗时（秒）', HTTP_BUCKETS),
+    'edu_http_responses_total': ('counter', '按路由和状态码统计的响应数', None),
+    'edu_db_statement_duration_seconds': ('histogram', '数据库语句耗时（秒），FETCH 为取结果的耗时', DB_BUCKETS),
+    'edu_db_connections_opened_total': ('counter', '打开过的数据库连接数', None),
+    'edu_db_connections_open': ('gauge', '当前打开的数据库连接数', None),
+    'edu_db_busy_events_total': ('counter', '数据库忙重试、重试失败和语句超时次数', None),
+    'edu_query_cache_requests_total': ('counter', '查询缓存命中(hit)和未命中(miss)次数', None),
+    'edu_query_cache_evictions_total': ('counter', '查询缓存淘汰的条目数', None),
+    'edu_query_cache_invalidations_total': ('counter', '查询缓存因写入失效的条目数', None),
+    'edu_query_cache_entries': ('gauge', '查询缓存条目数', None),
+    'edu_query_cache_bytes': ('gauge', '查询缓存估算占用字节数', None),
+    'edu_query_cache_hit_ratio': ('gauge', '查询缓存命中率', None),
+    'edu_authz_index_requests_total': ('counter', '权限索引命中(hit)和从数据库加载(load)次数', None),
+    'edu_authz_index_entries': ('gauge', '权限索引条目数', None),
+    'edu_authz_index_hit_ratio': ('gauge', '权限索引命中率', None),
+    'edu_writer_jobs_total': ('counter', '单写线程执行的写任务数', None),
+    'edu_writer_groups_total': ('counter', '单写线程合并提交的事务数', None),
+    'edu_writer_queued': ('gauge', '单写线程排队中的写任务数', None),
+    'edu_sqlite_file_bytes': ('gauge', 'SQLite 数据库文件大小（字节）', None),
+    'edu_metrics_processes': ('gauge', '上报指标的进程数', None),
+}
+
+# 命中率 -> (对应的计数器, 表示命中的 result 标签值)
+RATIOS = {
+    'edu_query_cache_hit_ratio': ('edu_query_cache_requests_total', 'hit'),
+    'edu_authz_index_hit_ratio': ('edu_authz_index_requests_total', 'hit'),
+}
+
+_STATEMENT_KINDS = {'SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'BEGIN', 'COMMIT',
+                    'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'CREATE', 'DROP', 'ALTER'}
+
+RETIRED_FILE = 'retired.json'
+
+def statement_kind(sql):
+    """语句的第一个关键字，作为指标标签（不认识的归为 OTHER）"""
+    parts = sql.split(None, 1)
+    kind = parts[0].upper() if parts else ''
+    return kind if kind in _STATEMENT_KINDS else 'OTHER'
+
+def pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # Windows 上 os.kill 会结束目标进程，不能用来探测
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class _Shard:
+    __slots__ = ('lock', 'values', 'histograms')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}        # (名称, 标签) -> 数值，计数器和仪表
+        self.histograms = {}    # (名称, 标签) -> [各分桶次数..., +Inf 次数, 总和]
+
+class Metrics:
+    """进程内指标，标签为 ((名, 值), ...) 元组"""
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL, shards=16,
+                 shared=METRICS_SHARED):
+        self.directory = directory
+        # 为False时不写指标文件，只汇总本进程
+        self.shared = shared
+        self.flush_interval = flush_interval
+        self.shard_count = shards
+        self._collectors = []
+        self.reset()
+
+    def reset(self):
+        """清空本进程的指标（fork 出的子进程不继承父进程的计数）"""
+        self._shards = [_Shard() for _ in range(self.shard_count)]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._shards[next(self._next_shard) % self.shard_count]
+        return shard
+
+    def add(self, name, value=1, labels=()):
+        """计数器加 value；仪表也用它增减"""
+        shard = self._shard()
+        key = (name, labels)
+        with shard.lock:
+            shard.values[key] = shard.values.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        """直方图记录一次观测值"""
+        index = bisect.bisect_left(METRICS[name][2], value)
+        shard = self._shard()
+        key = (name, labels)
+        with shard.lock:
+            counts = shard.histograms.get(key)
+            if counts is None:
+                counts = shard.histograms[key] = [0] * (len(METRICS[name][2]) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def record_request(self, method, route, status, seconds):
+        self.observe('edu_http_request_duration_seconds', seconds, (('method', method), ('route', route)))
+        self.add('edu_http_responses_total', 1,
+                 (('method', method), ('route', route), ('status', str(status))))
+
+    def record_statement(self, kind, seconds):
+        self.observe('edu_db_statement_duration_seconds', seconds, (('kind', kind),))
+
+    def add_collector(self, collector):
+        """collector() 返回 [(名称, 标签, 数值)]，在写入指标文件时调用
+
+        用于已有统计的组件（查询缓存、权限索引等），数值是该进程的累计值或当前值。
+        """
+        self._collectors.append(collector)
+
+    def local_snapshot(self):
+        values, histograms = {}, {}
+        for shard in self._shards:
+            with shard.lock:
+                shard_values = list(shard.values.items())
+                shard_histograms = [(key, list(counts)) for key, counts in shard.histograms.items()]
+            _merge_values(values, shard_values)
+            _merge_histograms(histograms, shard_histograms)
+        for collector in self._collectors:
+            _merge_values(values, (((name, labels), value) for name, labels, value in collector()))
+        return values, histograms
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def flush(self):
+        """把本进程的指标写入 <pid>.json（先写临时文件再替换），未开启共享时不写"""
+        if not self.shared:
+            return
+        values, histograms = self.local_snapshot()
+        path = self._path(f'{os.getpid()}.json')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_json(path, _dump(values, histograms))
+        except OSError as e:
+            print('写入指标文件失败:', e)
+
+    def start(self):
+        """启动本进程的定时写入线程（已启动或未开启共享时直接返回），请求处理时调用"""
+        if self._flusher is not None or not self.shared:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    @contextmanager
+    def _directory_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self._path('.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def collect(self):
+        """汇总所有进程的指标，返回 (数值, 直方图, 运行中的进程数)
+
+        已退出进程的文件并入 retired.json 后删除，这一步在目录锁内完成，
+        多个进程同时抓取时不会重复累加。未开启共享时只返回本进程的指标。
+        """
+        if not self.shared:
+            return (*self.local_snapshot(), 1)
+        self.flush()
+        with self._directory_lock():
+            retired = _load(_read_json(self._path(RETIRED_FILE)))
+            values, histograms = {}, {}
+            _merge_values(values, retired[0].items())
+            _merge_histograms(histograms, retired[1].items())
+            processes, changed = 0, False
+            for filename in os.listdir(self.directory):
+                stem, ext = os.path.splitext(filename)
+                if ext != '.json' or not stem.isdigit():
+                    continue
+                path = self._path(filename)
+                data = _read_json(path)
+                if data is None:
+                    continue
+                proc_values, proc_histograms = _load(data)
+                if pid_alive(int(stem)):
+                    processes += 1
+                else:
+                    # 进程已退出：只保留累计值，丢弃仪表
+                    proc_values = {key: value for key, value in proc_values.items()
+                                   if METRICS[key[0]][0] == 'counter'}
+                    _merge_values(retired[0], proc_values.items())
+                    _merge_histograms(retired[1], proc_histograms.items())
+                    changed = True
+                    os.remove(path)
+                _merge_values(values, proc_values.items())
+                _merge_histograms(histograms, proc_histograms.items())
+            if changed:
+                _write_json(self._path(RETIRED_FILE), _dump(*retired))
+        return values, histograms, processes
+
+    def exposition(self, gauges=()):
+        """返回 Prometheus 文本格式；gauges 为抓取时另外计算的 [(名称, 标签, 数值)]"""
+        values, histograms, processes = self.collect()
+        values[('edu_metrics_processes', ())] = processes
+        for ratio, (counter, hit) in RATIOS.items():
+            total = hits = 0
+            for (name, labels), value in values.items():
+                if name == counter:
+                    total += value
+                    hits += value if ('result', hit) in labels else 0
+            values[(ratio, ())] = round(hits / total, 4) if total else 0.0
+        for name, labels, value in gauges:
+            values[(name, labels)] = value
+        return render(values, histograms)
+
+def _merge_values(target, items):
+    for key, value in items:
+        target[key] = target.get(key, 0) + value
+
+def _merge_histograms(target, items):
+    for key, counts in items:
+        current = target.get(key)
+        if current is None:
+            target[key] = list(counts)
+        else:
+            for i, n in enumerate(counts):
+                current[i] += n
+
+def _dump(values, histograms):
+    return {
+        'values': [[name, [list(pair) for pair in labels], value] for (name, labels), value in values.items()],
+        'histograms': [[name, [list(pair) for pair in labels], counts]
+                       for (name, labels), counts in histograms.items()],
+    }
+
+def _load(data):
+    """_dump 的逆过程，返回 (数值, 直方图)；data 为 None 时返回空"""
+    values, histograms = {}, {}
+    for name, labels, value in (data or {}).get('values', []):
+        if name in METRICS:
+            values[(name, tuple(tuple(pair) for pair in labels))] = value
+    for name, labels, counts in (data or {}).get('histograms', []):
+        if name in METRICS and len(counts) == len(METRICS[name][2]) + 2:
+            histograms[(name, tuple(tuple(pair) for pair in labels))] = counts
+    return values, histograms
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(values, histograms):
+    """按 Prometheus 文本格式（0.0.4）输出"""
+    series = {}
+    for (name, labels), value in values.items():
+        series.setdefault(name, []).append((labels, value))
+    for (name, labels), counts in histograms.items():
+        series.setdefault(name, []).append((labels, counts))
+    lines = []
+    for name in sorted(series):
+        kind, description, buckets = METRICS[name]
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(series[name]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, n in zip(buckets + ('+Inf',), value[:-1]):
+                cumulative += n
+                lines.append(f'{name}_bucket{_labels(labels, (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+def sqlite_file_gauges(database_path):
+    """数据库主文件及 -wal/-shm 文件的大小"""
+    gauges = []
+    for file, suffix in (('db', ''), ('wal', '-wal'), ('shm', '-shm')):
+        try:
+            size = os.path.getsize(database_path + suffix)
+        except OSError:
+            size = 0
+        gauges.append(('edu_sqlite_file_bytes', (('file', file),), size))
+    return gauges
+
+metrics = Metrics()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics.reset)
+# 正常退出时写入最后的计数（只在开启共享时写；serve.py 的工作进程用 os._exit 退出，由它自己写入）
+atexit.register(metrics.flush)
@@ -0,0 +1,381 @@
+"""数据库结构迁移
+
+迁移版本记录在 PRAGMA user_version 中，每个迁移只执行一次。
+新增迁移时在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，版本号递增。
+"""
+
+def _create_core_tables(cursor):
+    """创建核心业务表（已存在的表保持不变）"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        student_id TEXT UNIQUE NOT NULL,
+        enrollment_year INTEGER NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS teachers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        teacher_id TEXT NOT NULL UNIQUE
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS courses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        learn_time TEXT NOT NULL,
+        credit REAL NOT NULL,
+        usual_score INTEGER NOT NULL,
+        midterm_score INTEGER NOT NULL,
+        final_score INTEGER NOT NULL,
+        times TEXT NOT NULL DEFAULT ''
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS student_courses (
+        student_id INTEGER,
+        course_id INTEGER,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
+        PRIMARY KEY (student_id, course_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS teacher_courses (
+        teacher_id INTEGER,
+        course_id INTEGER,
+        FOREIGN KEY (teacher_id) REFERENCES teachers (id) ON DELETE CASCADE,
+        FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
+        PRIMARY KEY (teacher_id, course_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS grades (
+        student_id INTEGER,
+        course_id INTEGER,
+        usual_grade REAL DEFAULT 0,
+        midterm_grade REAL DEFAULT 0,
+        final_grade REAL DEFAULT 0,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
+        PRIMARY KEY (student_id, course_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS assignments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE
+    )
+    ''')
+
+def _create_archived_terms(cursor):
+    """记录已归档到独立数据库文件的学期"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archived_terms (
+        term TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        student_courses INTEGER NOT NULL DEFAULT 0,
+        grades INTEGER NOT NULL DEFAULT 0,
+        assignments INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+
+def _add_course_capacity(cursor):
+    """课程容量与已选人数
+
+    capacity 为空表示不限人数；enrollment_count 由触发器随 student_courses
+    的插入和删除维护，插入前触发器保证任何写入路径都不会超出容量。
+    """
+    cursor.execute('ALTER TABLE courses ADD COLUMN capacity INTEGER')
+    cursor.execute('ALTER TABLE courses ADD COLUMN enrollment_count INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+    UPDATE courses SET enrollment_count = (
+        SELECT COUNT(*) FROM student_courses sc WHERE sc.course_id = courses.id
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS student_courses_capacity
+    BEFORE INSERT ON student_courses
+    WHEN (SELECT capacity IS NOT NULL AND enrollment_count >= capacity
+          FROM courses WHERE id = NEW.course_id)
+    BEGIN
+        SELECT RAISE(ABORT, 'course is full');
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS student_courses_count_insert
+    AFTER INSERT ON student_courses
+    BEGIN
+        UPDATE courses SET enrollment_count = enrollment_count + 1 WHERE id = NEW.course_id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS student_courses_count_delete
+    AFTER DELETE ON student_courses
+    BEGIN
+        UPDATE courses SET enrollment_count = enrollment_count - 1 WHERE id = OLD.course_id;
+    END
+    ''')
+
+def _create_course_waitlist(cursor):
+    """课程候补队列：按 id 先后顺序递补"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS course_waitlist (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        course_id INTEGER NOT NULL,
+        student_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE,
+        FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
+        UNIQUE (course_id, student_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_course_waitlist_course
+    ON course_waitlist (course_id, id)
+    ''')
+
+def _create_change_log(cursor):
+    """变更日志：核心表的每次插入、修改、删除由触发器追加一条记录
+
+    version 自增且不复用，客户端记住已同步到的版本，通过 /api/changes
+    只获取之后的变更。row_key 为行主键的 JSON 对象，键名即主键列名。
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+        row_key TEXT NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    tracked = {
+        'courses': ('id',),
+        'students': ('id',),
+        'teachers': ('id',),
+        'student_courses': ('student_id', 'course_id'),
+        'teacher_courses': ('teacher_id', 'course_id'),
+    }
+    for table, keys in tracked.items():
+        def row_key(ref):
+            return 'json_object(' + ', '.join(f"'{k}', {ref}.{k}" for k in keys) + ')'
+        key_changed = ' OR '.join(f'OLD.{k} IS NOT NEW.{k}' for k in keys)
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_insert
+        AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO changes (table_name, op, row_key) VALUES ('{table}', 'insert', {row_key('NEW')});
+        END
+        ''')
+        # 主键被修改时旧主键记为删除
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_update
+        AFTER UPDATE ON {table}
+        BEGIN
+            INSERT INTO changes (table_name, op, row_key)
+            SELECT '{table}', 'delete', {row_key('OLD')} WHERE {key_changed};
+            INSERT INTO changes (table_name, op, row_key) VALUES ('{table}', 'update', {row_key('NEW')});
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_delete
+        AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO changes (table_name, op, row_key) VALUES ('{table}', 'delete', {row_key('OLD')});
+        END
+        ''')
+
+def _add_row_versions(cursor):
+    """可编辑表的行版本号，用于乐观并发控制（见 mypy.versioning）
+
+    编辑接口在 UPDATE 中显式执行 version = version + 1；其他写入路径
+    修改了可编辑字段而没有改版本号时，由触发器补加1。课程的选课人数
+    由触发器维护，不算编辑，不改变版本号。
+    """
+    # admins 表由 init_db 创建，单独执行迁移时也需要存在
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS admins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        admin_id TEXT UNIQUE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    editable = {
+        'students': ('name', 'student_id', 'enrollment_year'),
+        'teachers': ('name', 'teacher_id'),
+        'admins': ('name', 'admin_id'),
+        'courses': ('name', 'learn_time', 'credit', 'usual_score', 'midterm_score',
+                    'final_score', 'times', 'capacity'),
+        'assignments': ('course_id', 'title', 'content'),
+    }
+    for table, columns in editable.items():
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_version
+        AFTER UPDATE OF {', '.join(columns)} ON {table}
+        WHEN NEW.version = OLD.version
+        BEGIN
+            UPDATE {table} SET version = OLD.version + 1 WHERE id = NEW.id;
+        END
+        ''')
+
+def _add_assignment_count(cursor):
+    """课程作业数由触发器维护，与 enrollment_count 一样供看板直接读取"""
+    cursor.execute('ALTER TABLE courses ADD COLUMN assignment_count INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+    UPDATE courses SET assignment_count = (
+        SELECT COUNT(*) FROM assignments a WHERE a.course_id = courses.id
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS assignments_count_insert
+    AFTER INSERT ON assignments
+    BEGIN
+        UPDATE courses SET assignment_count = assignment_count + 1 WHERE id = NEW.course_id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS assignments_count_delete
+    AFTER DELETE ON assignments
+    BEGIN
+        UPDATE courses SET assignment_count = assignment_count - 1 WHERE id = OLD.course_id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS assignments_count_move
+    AFTER UPDATE OF course_id ON assignments
+    WHEN OLD.course_id IS NOT NEW.course_id
+    BEGIN
+        UPDATE courses SET assignment_count = assignment_count - 1 WHERE id = OLD.course_id;
+        UPDATE courses SET assignment_count = assignment_count + 1 WHERE id = NEW.course_id;
+    END
+    ''')
+    # 按课程统计已录入成绩的人数
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_grades_course ON grades (course_id)')
+
+def _index_assignment_feed(cursor):
+    """学生作业流按课程取最新作业，索引末尾隐含 rowid(id)，分页游标可直接比较"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_assignments_course_time ON assignments (course_id, create_time)')
+
+def _add_terms(cursor):
+    """学期与结课标记，归档只处理已结课的学期
+
+    courses.learn_time 是年级（大一、大二……），不是学期，课程所属的学期
+    记在 courses.term。terms.archiving 只在归档事务内置为1，此时选课人数、
+    作业数触发器和选课的变更日志触发器跳过被移走的行：移到归档文件不是
+    退课，不释放名额，也不让同步客户端删除这些选课。
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS terms (
+        term TEXT PRIMARY KEY,
+        closed_at TIMESTAMP,
+        archiving INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute('ALTER TABLE courses ADD COLUMN term TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_courses_term ON courses (term)')
+    not_archiving = ('''(SELECT t.archiving FROM courses c JOIN terms t ON t.term = c.term
+          WHERE c.id = OLD.course_id) IS NOT 1''')
+    triggers = {
+        'student_courses_count_delete': (
+            'student_courses',
+            'UPDATE courses SET enrollment_count = enrollment_count - 1 WHERE id = OLD.course_id;'),
+        'student_courses_changes_delete': (
+            'student_courses',
+            "INSERT INTO changes (table_name, op, row_key) VALUES ('student_courses', 'delete', "
+            "json_object('student_id', OLD.student_id, 'course_id', OLD.course_id));"),
+        'assignments_count_delete': (
+            'assignments',
+            'UPDATE courses SET assignment_count = assignment_count - 1 WHERE id = OLD.course_id;'),
+    }
+    for name, (table, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'''
+        CREATE TRIGGER {name}
+        AFTER DELETE ON {table}
+        WHEN {not_archiving}
+        BEGIN
+            {body}
+        END
+        ''')
+
+def _skip_counter_changes(cursor):
+    """变更日志不记录只改了计数或版本号的更新
+
+    选课人数、作业数触发器和版本号触发器都会再 UPDATE 一次 courses 等表，
+    原来的更新触发器每次都追加一条 'update'，一次选课就让同步客户端多下载
+    几条同一课程的变更。现在只有业务字段（按迁移时的表结构，除去下面的
+    计数和版本列）有变化时才记录；计数的变化由对应的选课、作业变更体现。
+    以后给这些表增加业务字段时，需要在新的迁移中重建触发器。
+    """
+    derived = {'version', 'enrollment_count', 'assignment_count'}
+    tracked = {
+        'courses': ('id',),
+        'students': ('id',),
+        'teachers': ('id',),
+    }
+    for table, keys in tracked.items():
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()
+                   if row[1] not in derived]
+        def row_key(ref):
+            return 'json_object(' + ', '.join(f"'{k}', {ref}.{k}" for k in keys) + ')'
+        key_changed = ' OR '.join(f'OLD.{k} IS NOT NEW.{k}' for k in keys)
+        business_changed = ' OR '.join(f'OLD.{c} IS NOT NEW.{c}' for c in columns)
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_changes_update')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_changes_update
+        AFTER UPDATE ON {table}
+        WHEN {business_changed}
+        BEGIN
+            INSERT INTO changes (table_name, op, row_key)
+            SELECT '{table}', 'delete', {row_key('OLD')} WHERE {key_changed};
+            INSERT INTO changes (table_name, op, row_key) VALUES ('{table}', 'update', {row_key('NEW')});
+        END
+        ''')
+
+MIGRATIONS = [
+    (1, '创建核心业务表', _create_core_tables),
+    (2, '创建归档学期表', _create_archived_terms),
+    (3, '课程容量与选课人数计数', _add_course_capacity),
+    (4, '创建课程候补队列', _create_course_waitlist),
+    (5, '创建变更日志', _create_change_log),
+    (6, '可编辑表的行版本号', _add_row_versions),
+    (7, '课程作业数计数', _add_assignment_count),
+    (8, '作业按课程和发布时间索引', _index_assignment_feed),
+    (9, '学期与结课标记', _add_terms),
+    (10, '变更日志忽略计数和版本号更新', _skip_counter_changes),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """执行尚未应用的迁移，返回迁移后的版本号"""
+    current = get_schema_version(conn)
+    cursor = conn.cursor()
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"正在执行数据库迁移 {version}: {description}")
+        # 每个迁移在单独的事务中执行，失败时整体回滚
+        cursor.execute('BEGIN')
+        try:
+            apply(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+    return current
@@ -0,0 +1,212 @@
+"""按需性能分析：在生产环境中对单个请求运行 cProfile，可选记录内存分配
+
+触发方式（见 edu_sys_main 中的请求钩子）:
+    查询参数 _profile=cpu|mem     只对管理员会话生效
+    请求头 X-Edu-Profile: <令牌>   令牌由管理员为指定用户生成，带有效期和签名，
+                                    只对该用户（角色+用户名）的会话生效，
+                                    有效期不超过 PROFILE_TOKEN_MAX_TTL，只能做 cpu 分析
+    抽样                           PROFILE_SAMPLE_RATE 比例的 /api 请求做 cpu 分析
+mem 模式另外用 tracemalloc 比较请求前后的内存快照，开销较大且影响整个进程，
+只能由管理员用查询参数触发，不用于令牌和抽样。
+
+同一进程同时只分析一个请求（cProfile 和 tracemalloc 都会影响整个进程），
+其余请求照常处理、不分析。单写线程执行的写路由在请求线程上只能看到
+等待写线程的时间。
+
+每次结果保存为 <编号>.prof（pstats 格式，可用 snakeviz 等工具打开）、
+<编号>.mem.txt（mem 模式）和 <编号>.json（请求信息和耗时最多的函数），
+超过 PROFILE_KEEP 次后删除最早的。
+"""
+import cProfile
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from .config import PROFILE_DIR, PROFILE_KEEP, PROFILE_SAMPLE_RATE, PROFILE_TOKEN_MAX_TTL
+
+PROFILE_HEADER = 'X-Edu-Profile'
+PROFILE_MODES = ('cpu', 'mem')
+# 请求头令牌允许的模式
+TOKEN_MODES = ('cpu',)
+
+def token_subject(role, username):
+    """令牌绑定的用户"""
+    return f'{role}:{username}'
+
+def _signature(mode, expires, subject, secret):
+    message = f'{mode}:{expires}:{subject}'.encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+def make_token(mode, ttl, subject, secret, now=None):
+    """生成请求头令牌 <模式>:<过期时间戳>:<签名>
+
+    subject 只参与签名、不出现在令牌中，验证时用当前会话的用户计算。
+    """
+    if mode not in TOKEN_MODES:
+        raise ValueError(f'令牌不支持 {mode} 模式')
+    expires = int((now or time.time()) + min(ttl, PROFILE_TOKEN_MAX_TTL))
+    return f'{mode}:{expires}:{_signature(mode, expires, subject, secret)}'
+
+def verify_token(token, subject, secret, now=None):
+    """令牌对当前用户有效时返回模式，否则返回None"""
+    try:
+        mode, expires, signature = token.split(':')
+        expires = int(expires)
+    except ValueError:
+        return None
+    now = now or time.time()
+    # 有效期上限在验证时也检查，调低上限后已发出的长期令牌随之失效
+    if mode not in TOKEN_MODES or not now <= expires <= now + PROFILE_TOKEN_MAX_TTL:
+        return None
+    if not hmac.compare_digest(signature, _signature(mode, expires, subject, secret)):
+        return None
+    return mode
+
+class ProfileRun:
+    """一次正在进行的分析"""
+
+    def __init__(self, mode, trigger):
+        self.mode = mode
+        self.trigger = trigger
+        self.profile = cProfile.Profile()
+        self.started_tracing = False
+        self.memory_before = None
+        self.memory_after = None
+        self.started = None
+        self.duration = None
+
+    def start(self):
+        if self.mode == 'mem':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self.started_tracing = True
+            self.memory_before = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.duration = time.perf_counter() - self.started
+        if self.mode == 'mem':
+            self.memory_after = tracemalloc.take_snapshot()
+            if self.started_tracing:
+                tracemalloc.stop()
+
+    def top_functions(self, limit=10):
+        """自身耗时最多的函数"""
+        stats = pstats.Stats(self.profile).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        return [{
+            'function': f'{name} ({os.path.basename(filename)}:{line})',
+            'calls': calls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3)
+        } for (filename, line, name), (_, calls, tottime, cumtime, _) in rows]
+
+    def memory_diff(self, limit=50):
+        """请求期间按代码行统计的内存分配变化（文本）"""
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, __file__),
+                  tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'))
+        before = self.memory_before.filter_traces(ignore)
+        after = self.memory_after.filter_traces(ignore)
+        lines = [str(stat) for stat in after.compare_to(before, 'lineno')[:limit]]
+        return '\n'.join(lines) + '\n'
+
+class Profiler:
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP, sample_rate=PROFILE_SAMPLE_RATE):
+        self.directory = directory
+        self.keep = keep
+        self.sample_rate = sample_rate
+        self._active = threading.Lock()
+        self._sequence = itertools.count(1)
+
+    def begin(self, mode, trigger):
+        """开始分析，已有请求正在分析时返回None"""
+        if not self._active.acquire(blocking=False):
+            return None
+        run = ProfileRun(mode, trigger)
+        try:
+            run.start()
+        except Exception:
+            self._active.release()
+            raise
+        return run
+
+    def discard(self, run):
+        """请求异常结束：停止分析，不保存"""
+        try:
+            run.stop()
+        finally:
+            self._active.release()
+
+    def finish(self, run, request_info):
+        """停止分析并保存结果，返回编号"""
+        try:
+            run.stop()
+        finally:
+            self._active.release()
+        now = time.time()
+        run_id = (time.strftime('%Y%m%d-%H%M%S', time.localtime(now))
+                  + f'-{int(now * 1000) % 1000:03d}-{os.getpid()}-{next(self._sequence):06d}')
+        os.makedirs(self.directory, exist_ok=True)
+        run.profile.dump_stats(self._path(run_id, 'prof'))
+        if run.mode == 'mem':
+            with open(self._path(run_id, 'mem'), 'w', encoding='utf-8') as f:
+                f.write(run.memory_diff())
+        meta = dict(request_info, id=run_id, mode=run.mode, trigger=run.trigger,
+                    duration_ms=round(run.duration * 1000, 3),
+                    created_at=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)),
+                    top_functions=run.top_functions())
+        with open(self._path(run_id, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        self._rotate()
+        return run_id
+
+    def _path(self, run_id, kind):
+        suffix = {'prof': '.prof', 'mem': '.mem.txt', 'json': '.json'}[kind]
+        return os.path.join(self.directory, run_id + suffix)
+
+    def _run_ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def _rotate(self):
+        run_ids = self._run_ids()
+        for run_id in run_ids[:max(len(run_ids) - self.keep, 0)]:
+            for kind in ('prof', 'mem', 'json'):
+                try:
+                    os.remove(self._path(run_id, kind))
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit=100):
+        """最近的分析结果（新的在前）"""
+        runs = []
+        for run_id in reversed(self._run_ids()):
+            try:
+                with open(self._path(run_id, 'json'), encoding='utf-8') as f:
+                    runs.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # 刚被轮换删除
+            if len(runs) >= limit:
+                break
+        return runs
+
+    def file(self, run_id, kind):
+        """结果文件的 (目录, 文件名)，不存在时返回None"""
+        if kind not in ('prof', 'mem') or run_id not in self._run_ids():
+            return None
+        path = self._path(run_id, kind)
+        if not os.path.exists(path):
+            return None
+        return self.directory, os.path.basename(path)
+
+profiler = Profiler()
@@ -0,0 +1,146 @@
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+# 从SQL中提取涉及的表名
+_TABLE_PATTERN = re.compile(
+    r'\b(?:from|join|into|update)\s+["`\[]?(\w+)', re.IGNORECASE)
+_SELECT_PATTERN = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+
+def normalize_sql(query):
+    """折叠空白字符，使格式不同但内容相同的SQL共用一个缓存键"""
+    return ' '.join(query.split())
+
+def tables_in(query):
+    """返回SQL语句涉及的表名集合（小写）"""
+    return {name.lower() for name in _TABLE_PATTERN.findall(query)}
+
+def is_select(query):
+    return bool(_SELECT_PATTERN.match(query))
+
+def _estimate_size(result):
+    """粗略估算查询结果占用的内存字节数"""
+    if result is None:
+        return 64
+    rows = result if isinstance(result, (list, tuple)) else [result]
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+class QueryCache:
+    """按表失效的查询结果缓存
+
+    键为规范化后的SQL + 参数，LRU淘汰，同时限制条目数和估算内存。
+    每张表维护一个代数(generation)，写操作使相关表的代数加一并删除依赖
+    这些表的缓存；查询开始前记录代数，结果写回时若代数已变化则丢弃，
+    避免并发写入期间读到的旧数据被写进缓存。
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, enabled=False):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (tables, result, size)
+        self._by_table = {}             # table -> set(key)
+        self._generations = {}          # table -> int
+        self._epoch = 0                 # clear()时整体加一
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(query, params, options):
+        """options为影响结果形态的其他参数（如fetch_all、行类型）"""
+        return (normalize_sql(query), tuple(params), options)
+
+    def _token(self, tables):
+        return (self._epoch,) + tuple(self._generations.get(t, 0) for t in sorted(tables))
+
+    def generation(self, tables):
+        with self._lock:
+            return self._token(tables)
+
+    def get(self, key):
+        """命中时返回 (True, result)，未命中返回 (False, None)
+
+        缓存中的行列表以元组保存，命中时每个调用方拿到各自的新列表，
+        调用方修改（排序、追加等）不会影响缓存和其他请求。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = entry[1]
+        return True, list(result) if isinstance(result, tuple) else result
+
+    def put(self, key, tables, result, token):
+        size = _estimate_size(result)
+        if size > self.max_bytes:
+            return
+        if isinstance(result, list):
+            result = tuple(result)
+        with self._lock:
+            if self._token(tables) != token:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (tables, result, size)
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        tables, _, size = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def invalidate(self, *tables):
+        """使依赖这些表的缓存失效"""
+        with self._lock:
+            for table in tables:
+                table = table.lower()
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in list(self._by_table.get(table, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+            self._epoch += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,110 @@
+"""请求录制：按到达顺序记录 /api 请求，供 benchmarks.replay 在数据库副本上回放
+
+每个请求记录为一行 JSON 数组:
+    [到达时间(毫秒时间戳), 方法, 路由模板, 路径(含查询字符串), 角色, 身份编号,
+     请求体, 状态码, 处理耗时(毫秒)]
+身份编号是会话中的 student_id/teacher_id/admin_id，不记录用户名和密码；
+请求体中名称含 password/token/secret 的字段替换为 "***"，非 JSON 请求体
+记录为 null。登录、注册、登出不在 /api 下，不录制（回放工具自己登录）；
+批量请求只记录外层请求，子请求不单独记录。
+
+记录先放在内存中，后台线程每隔 flush_interval 秒把新记录作为一个 gzip
+片段追加到 requests-<开始时间>-<pid>.jsonl.gz；多片段的 gzip 文件可以
+直接用 gzip.open 读取，进程异常退出最多丢失最后一个间隔的记录。
+"""
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from .config import RECORD_ENABLED, RECORD_DIR, RECORD_FLUSH_INTERVAL
+
+_SECRET_WORDS = ('password', 'token', 'secret')
+_IDENTITY_KEYS = {'student': 'student_id', 'teacher': 'teacher_id', 'admin': 'admin_id'}
+
+def sanitize(value):
+    """去掉请求体中的密码等敏感字段"""
+    if isinstance(value, dict):
+        return {key: '***' if any(word in str(key).lower() for word in _SECRET_WORDS) else sanitize(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [sanitize(item) for item in value]
+    return value
+
+def identity(session):
+    """会话的 (角色, 身份编号)，未登录时为 (None, None)"""
+    role = session.get('role') if 'username' in session else None
+    return role, session.get(_IDENTITY_KEYS.get(role, ''))
+
+class Recorder:
+    def __init__(self, directory=RECORD_DIR, flush_interval=RECORD_FLUSH_INTERVAL, enabled=RECORD_ENABLED):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """清空待写入的记录（fork 出的子进程写自己的文件）"""
+        self._pending = deque()
+        self._path = None
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def should_record(self, path):
+        return self.enabled and path.startswith('/api/')
+
+    def record(self, arrived, method, route, path, role, actor, body, status, duration):
+        """arrived 为到达时间（秒，time.time()），duration 为处理耗时（秒）"""
+        self._pending.append([int(arrived * 1000), method, route, path, role, actor,
+                              sanitize(body), status, round(duration * 1000, 3)])
+        self._start()
+
+    def _start(self):
+        if self._flusher is not None:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='recorder-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """把内存中的记录追加到本进程的录制文件"""
+        with self._write_lock:
+            lines = []
+            while self._pending:
+                lines.append(json.dumps(self._pending.popleft(), ensure_ascii=False, separators=(',', ':')))
+            if not lines:
+                return
+            if self._path is None:
+                started = time.strftime('%Y%m%d-%H%M%S')
+                self._path = os.path.join(self.directory, f'requests-{started}-{os.getpid()}.jsonl.gz')
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with gzip.open(self._path, 'at', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+            except OSError as e:
+                print('写入请求录制文件失败:', e)
+
+def read_records(paths):
+    """读取一个或多个录制文件，按到达时间排序返回全部记录"""
+    records = []
+    for path in paths:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record[0])
+    return records
+
+recorder = Recorder()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=recorder.reset)
+atexit.register(recorder.flush)
@@ -0,0 +1,123 @@
+"""数据库忙重试与语句时间预算
+
+多个连接同时写入时 SQLite 返回 SQLITE_BUSY/SQLITE_LOCKED（database is
+locked）。只有在不破坏事务语义时才自动重试：语句执行前连接不在事务中
+（自动提交的语句或事务的第一条语句，包括 BEGIN IMMEDIATE），以及
+COMMIT。重试间隔按指数退避并加随机抖动，避免多个连接同时醒来再次冲突；
+重试用尽后抛出 DatabaseBusy。
+
+每条语句开始执行时设置截止时间，连接的进度回调每隔若干条虚拟机指令
+检查一次，超时即中断语句并抛出 QueryTimeout。
+
+重试、最终失败和超时按操作分类计数，见 db_metrics。
+
+路由里通用的 except Exception 会吞掉这两种异常并返回500，因此抛出时
+同时记在当前线程上（note_unavailable），请求结束时用 take_unavailable()
+取出，把这样的500改为503。
+"""
+import random
+import sqlite3
+import threading
+import time
+
+from .config import DB_BUSY_RETRIES, DB_RETRY_BASE_DELAY, DB_RETRY_MAX_DELAY
+
+_BUSY_CODES = {sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED}
+
+class DatabaseBusy(sqlite3.OperationalError):
+    """重试用尽后数据库仍然被锁"""
+
+class QueryTimeout(sqlite3.OperationalError):
+    """语句超出时间预算被中断"""
+
+# 当前线程最近一次抛出的数据库不可用错误：(异常类型, 消息)，不持有回溯
+_unavailable = threading.local()
+
+def note_unavailable(error):
+    """记录DatabaseBusy/QueryTimeout并原样返回"""
+    _unavailable.error = (type(error), str(error))
+    return error
+
+def take_unavailable():
+    """取出并清除当前线程记录的错误，没有时返回None"""
+    noted = getattr(_unavailable, 'error', None)
+    _unavailable.error = None
+    return noted[0](noted[1]) if noted else None
+
+def is_busy_error(error):
+    """判断异常是否为数据库忙/被锁"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in _BUSY_CODES
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+def backoff_delay(attempt, base=DB_RETRY_BASE_DELAY, max_delay=DB_RETRY_MAX_DELAY):
+    """第attempt次重试（从0开始）前的等待秒数：指数退避，保留一半并随机抖动另一半"""
+    delay = min(max_delay, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class DbMetrics:
+    """按 (事件, 操作) 分类的计数器
+
+    事件: busy_retry(忙后重试)、busy_recovered(重试后成功)、
+    busy_failure(重试用尽)、timeout(语句超时)
+    """
+
+    EVENTS = ('busy_retry', 'busy_recovered', 'busy_failure', 'timeout')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, event, operation):
+        key = (event, operation)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def count(self, event, operation=None):
+        with self._lock:
+            return sum(n for (e, op), n in self._counts.items()
+                       if e == event and (operation is None or op == operation))
+
+    def snapshot(self):
+        """{事件: {操作: 次数}}"""
+        result = {event: {} for event in self.EVENTS}
+        with self._lock:
+            for (event, operation), n in self._counts.items():
+                result.setdefault(event, {})[operation] = n
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+db_metrics = DbMetrics()
+
+def retry_busy(fn, operation, retries=DB_BUSY_RETRIES, reset=None):
+    """执行fn()，遇到数据库忙时退避重试，重试用尽后抛出DatabaseBusy
+
+    reset在每次遇到数据库忙后调用，用于回滚失败语句留下的空事务。
+    调用方负责保证fn可以安全重试。
+    """
+    attempt = 0
+    while True:
+        try:
+            result = fn()
+        except sqlite3.OperationalError as e:
+            if isinstance(e, (DatabaseBusy, QueryTimeout)) or not is_busy_error(e):
+                raise
+            if reset is not None:
+                reset()
+            if attempt >= retries:
+                db_metrics.record('busy_failure', operation)
+                raise note_unavailable(DatabaseBusy(f'数据库繁忙({operation})：{e}')) from e
+            db_metrics.record('busy_retry', operation)
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+        if attempt:
+            db_metrics.record('busy_recovered', operation)
+        return result
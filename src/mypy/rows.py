@@ -0,0 +1,119 @@
+import keyword
+import threading
+
+class Record:
+    """紧凑的行对象基类
+
+    每种字段组合生成一个带 __slots__ 的子类，实例不带 __dict__，
+    内存占用接近元组。支持 row.name、row['name']、row[0] 和 dict(row)，
+    可直接交给 jsonify 序列化。
+    """
+
+    __slots__ = ()
+    _keys = ()    # 原始列名（JSON键）
+    _slots = ()   # 对应的属性名
+
+    def keys(self):
+        return list(self._keys)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return getattr(self, self._slots[key])
+        try:
+            return getattr(self, self._slots[self._keys.index(key)])
+        except ValueError:
+            raise IndexError(f'没有名为 {key} 的列') from None
+
+    def __iter__(self):
+        for slot in self._slots:
+            yield getattr(self, slot)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self._keys == other._keys and tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __repr__(self):
+        fields = ', '.join(f'{k}={v!r}' for k, v in zip(self._keys, self))
+        return f'{type(self).__name__}({fields})'
+
+    def to_dict(self):
+        return {key: getattr(self, slot) for key, slot in zip(self._keys, self._slots)}
+
+_types = {}
+_types_lock = threading.Lock()
+
+# 与 Record 方法同名的列不能直接作为属性名
+_RESERVED = {'keys', 'to_dict'}
+
+def row_type(columns, name='Row'):
+    """返回指定列组合对应的行类型（按列组合缓存）
+
+    重名列只保留第一个（与 dict(sqlite3.Row) 的结果一致），
+    不是合法标识符的列名使用 _列序号 作为属性名。
+    """
+    key = (name, tuple(columns))
+    cls = _types.get(key)
+    if cls is not None:
+        return cls
+    with _types_lock:
+        cls = _types.get(key)
+        if cls is not None:
+            return cls
+        keys, slots, assigns, args = [], [], [], []
+        for i, column in enumerate(columns):
+            arg = f'_v{i}'
+            args.append(arg)
+            if column in keys:
+                continue
+            usable = (column.isidentifier() and not keyword.iskeyword(column)
+                      and not column.startswith('_') and column not in _RESERVED)
+            slot = column if usable else f'_{i}'
+            keys.append(column)
+            slots.append(slot)
+            assigns.append(f'    self.{slot} = {arg}')
+        # 与 namedtuple 相同的做法：生成 __init__ 以免逐字段 setattr
+        source = f"def __init__(self, {', '.join(args)}):\n" + ('\n'.join(assigns) or '    pass')
+        namespace = {}
+        exec(source, namespace)
+        cls = type(name, (Record,), {
+            '__slots__': tuple(slots),
+            '_keys': tuple(keys),
+            '_slots': tuple(slots),
+            '__init__': namespace['__init__'],
+        })
+        _types[key] = cls
+        return cls
+
+class RowFactory:
+    """游标行工厂：直接把结果行构造成紧凑的行对象
+
+    cursor.description 在同一条语句的所有行之间是同一个对象，
+    因此只在语句变化时查找一次行类型。
+    """
+
+    __slots__ = ('name', '_description', '_cls')
+
+    def __init__(self, name='Row'):
+        self.name = name
+        self._description = None
+        self._cls = None
+
+    def __call__(self, cursor, row):
+        description = cursor.description
+        if description is not self._description:
+            self._cls = row_type([d[0] for d in description], self.name)
+            self._description = description
+        return self._cls(*row)
+
+def use_typed_rows(cursor, name='Row'):
+    """让游标返回紧凑行对象，返回游标本身便于链式调用"""
+    cursor.row_factory = RowFactory(name)
+    return cursor
+
+def table_row_name(table):
+    """表名对应的行类型名，如 courses -> CoursesRow"""
+    return ''.join(part.capitalize() for part in table.split('_')) + 'Row'
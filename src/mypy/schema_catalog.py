@@ -0,0 +1,115 @@
+import threading
+
+class TableInfo:
+    """单张表的结构信息"""
+
+    __slots__ = ('name', 'columns', 'column_set', 'required')
+
+    def __init__(self, name, columns, required):
+        self.name = name
+        self.columns = columns
+        self.column_set = frozenset(columns)
+        self.required = required
+
+    def check_columns(self, names):
+        """检查字段名是否都属于该表，存在未知字段时抛出ValueError"""
+        unknown = [n for n in names if n not in self.column_set]
+        if unknown:
+            raise ValueError(f"表{self.name}中不存在字段: {', '.join(unknown)}")
+
+class SchemaCatalog:
+    """表结构目录
+
+    每个结构版本只加载一次所有表的 PRAGMA table_info，并为每组字段缓存
+    一条INSERT语句，避免每次插入都重新查询表结构。结构版本由
+    (PRAGMA user_version, PRAGMA schema_version) 组成：迁移执行后调用
+    invalidate()；其他进程修改了表结构时，调用方在语句执行失败后通过
+    refresh_if_changed() 检测并重新加载。
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._tables = None
+        self._version = None
+        self._insert_sql = {}
+        self.loads = 0
+
+    def _load(self, conn):
+        version = (conn.execute('PRAGMA user_version').fetchone()[0],
+                   conn.execute('PRAGMA schema_version').fetchone()[0])
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        tables = {}
+        for name in names:
+            columns = []
+            required = []
+            for field in conn.execute(f'PRAGMA table_info("{name}")'):
+                # table_info: cid, name, type, notnull, dflt_value, pk
+                columns.append(field[1])
+                # 必需字段：具有NOT NULL约束且没有默认值的字段
+                if field[3] == 1 and field[4] is None and field[1] != 'id':
+                    required.append(field[1])
+            tables[name] = TableInfo(name, tuple(columns), tuple(required))
+        self._tables = tables
+        self._version = version
+        self._insert_sql = {}
+        self.loads += 1
+
+    def _run(self, conn, fn):
+        """用给定连接执行fn，未提供连接时自行打开并关闭"""
+        if conn is not None:
+            return fn(conn)
+        own = self._connect()
+        try:
+            return fn(own)
+        finally:
+            own.close()
+
+    def table(self, name, conn=None, columns=()):
+        """返回表结构信息并校验字段名，表或字段不存在时抛出ValueError
+
+        目录尚未加载时使用conn加载，未提供conn则自行打开连接；
+        找不到表或字段时检查结构版本，版本变化则重新加载后再校验。
+        """
+        tables = self._tables
+        if tables is None:
+            with self._lock:
+                if self._tables is None:
+                    self._run(conn, self._load)
+                tables = self._tables
+        info = tables.get(name)
+        if info is None or not info.column_set.issuperset(columns):
+            if self._run(conn, self.refresh_if_changed):
+                info = self._tables.get(name)
+        if info is None:
+            raise ValueError(f"表不存在: {name}")
+        info.check_columns(columns)
+        return info
+
+    def insert_sql(self, table, columns):
+        """返回指定字段组合的INSERT语句（按字段组合缓存）"""
+        key = (table, columns)
+        sql = self._insert_sql.get(key)
+        if sql is None:
+            fields = ', '.join(columns)
+            placeholders = ', '.join(['?'] * len(columns))
+            sql = f"INSERT INTO {table} ({fields}) VALUES ({placeholders})"
+            self._insert_sql[key] = sql
+        return sql
+
+    def refresh_if_changed(self, conn):
+        """结构版本变化时重新加载，返回是否发生了重新加载"""
+        version = (conn.execute('PRAGMA user_version').fetchone()[0],
+                   conn.execute('PRAGMA schema_version').fetchone()[0])
+        with self._lock:
+            if version == self._version:
+                return False
+            self._load(conn)
+            return True
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+            self._version = None
+            self._insert_sql = {}
@@ -0,0 +1,179 @@
+"""只读分析快照
+
+报表和导出查询读取主库的一个只读副本，不与选课、录入成绩等写操作争用锁。
+副本使用 sqlite3 在线备份API分步复制：每步只复制若干页，步与步之间释放
+主库的读锁，写操作可以穿插执行。复制先写到临时文件，完成后原子替换快照
+文件，已打开的快照连接继续读取旧文件，不受影响。
+
+多进程部署时各进程共用同一个快照文件：快照年龄取文件的修改时间（设为开始
+复制的时刻），临时文件名带进程号，刷新在快照旁的 .lock 文件锁内进行，
+拿到锁后重新检查年龄，其他进程刚刷新过时不再重复复制。
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只有单进程的开发服务器，不需要文件锁
+    fcntl = None
+
+from .config import (
+    DATABASE_PATH, SNAPSHOT_PATH, SNAPSHOT_ENABLED, SNAPSHOT_MAX_AGE,
+    SNAPSHOT_PAGES_PER_STEP, SNAPSHOT_STEP_SLEEP
+)
+
+class SnapshotManager:
+    """维护只读快照，保证读到的快照不早于 max_age 秒之前"""
+
+    def __init__(self, source_path, snapshot_path, max_age,
+                 pages_per_step=SNAPSHOT_PAGES_PER_STEP, step_sleep=SNAPSHOT_STEP_SLEEP,
+                 enabled=True):
+        self.source_path = source_path
+        self.snapshot_path = snapshot_path
+        self.max_age = max_age
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_duration = None
+        self.last_pages = None
+        self.last_error = None
+        self.refreshes = 0
+
+    @property
+    def refreshed_at(self):
+        """快照内容对应的时刻（快照文件的修改时间），尚未生成快照时返回None"""
+        try:
+            return os.path.getmtime(self.snapshot_path)
+        except OSError:
+            return None
+
+    def age(self):
+        """快照距上次刷新的秒数，尚未生成快照时返回None"""
+        refreshed_at = self.refreshed_at
+        if refreshed_at is None:
+            return None
+        return time.time() - refreshed_at
+
+    def is_stale(self, max_age=None):
+        age = self.age()
+        return age is None or age > (self.max_age if max_age is None else max_age)
+
+    @contextmanager
+    def _file_lock(self):
+        """进程内的锁加上跨进程的文件锁"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.snapshot_path + '.lock', 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def refresh(self, max_age=None):
+        """用在线备份API分步复制主库并替换快照文件
+
+        指定 max_age 时只在快照超过该年龄时刷新（拿到锁后检查），返回是否刷新。
+        """
+        with self._file_lock():
+            if max_age is not None and not self.is_stale(max_age):
+                return False
+            self._refresh_locked()
+            return True
+
+    def _refresh_locked(self):
+        started = time.time()
+        tmp_path = f'{self.snapshot_path}.{os.getpid()}.tmp'
+        pages = [0]
+
+        def progress(status, remaining, total):
+            pages[0] = total
+
+        try:
+            source = sqlite3.connect(self.source_path)
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target, pages=self.pages_per_step,
+                              progress=progress, sleep=self.step_sleep)
+            finally:
+                target.close()
+                source.close()
+            # 以开始时间为准：快照内容不早于开始复制的时刻
+            os.utime(tmp_path, (started, started))
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            self.last_error = str(e)
+            print('刷新分析快照失败:', e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.last_duration = time.time() - started
+        self.last_pages = pages[0]
+        self.last_error = None
+        self.refreshes += 1
+
+    def connect(self):
+        """打开只读快照连接，快照超过 max_age 时先同步刷新"""
+        if self.is_stale():
+            # 多个请求（或进程）同时发现快照过期时只刷新一次：后到者拿到锁后重新检查
+            self.refresh(self.max_age)
+        conn = sqlite3.connect(f'file:{self.snapshot_path}?mode=ro', uri=True)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    def start(self, interval=None):
+        """启动后台刷新线程，默认每 max_age/2 秒刷新一次
+
+        多个进程都启动刷新线程时，快照在间隔内已被其他进程刷新的就跳过。
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        interval = interval or max(self.max_age / 2, 1)
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.refresh(interval)
+                except Exception:
+                    pass
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=run, name='snapshot-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def status(self):
+        refreshed_at = self.refreshed_at
+        age = time.time() - refreshed_at if refreshed_at is not None else None
+        return {
+            'enabled': self.enabled,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'refreshed_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(refreshed_at))
+                            if refreshed_at is not None else None,
+            'age_seconds': round(age, 3) if age is not None else None,
+            'max_age': self.max_age,
+            'stale': self.is_stale(),
+            'last_duration': round(self.last_duration, 3) if self.last_duration is not None else None,
+            'pages': self.last_pages,
+            'refreshes': self.refreshes,
+            'last_error': self.last_error
+        }
+
+snapshot_manager = SnapshotManager(
+    DATABASE_PATH, SNAPSHOT_PATH, SNAPSHOT_MAX_AGE, enabled=SNAPSHOT_ENABLED
+)
@@ -0,0 +1,29 @@
+"""行版本与乐观并发控制
+
+可编辑的表带有 version 列，每次修改加1（编辑接口在 UPDATE 中显式加1，
+其他写入路径由迁移 6 的触发器补上）。行的 ETag 由表名、主键和版本号
+组成；客户端修改时在 If-Match 中带上读取时拿到的 ETag，编辑接口用
+UPDATE ... WHERE version = ? 检查，期间被他人修改过则返回 412。
+"""
+
+VERSIONED_TABLES = ('students', 'teachers', 'admins', 'courses', 'assignments')
+
+def row_etag(table, row_id, version):
+    """行的ETag（不含引号）"""
+    return f'{table}-{row_id}-v{version}'
+
+def expected_version(if_match, table, row_id):
+    """从If-Match中取出客户端持有的该行版本号
+
+    if_match 为 werkzeug 的 ETags（request.if_match）。没有 If-Match 或
+    为 * 时返回None，表示不检查；If-Match 中没有该行的ETag时返回 -1，
+    必然与当前版本不符。
+    """
+    if not if_match or if_match.star_tag:
+        return None
+    prefix = row_etag(table, row_id, '')
+    for tag in if_match.as_set():
+        version = tag[len(prefix):]
+        if tag.startswith(prefix) and version.isdigit():
+            return int(version)
+    return -1
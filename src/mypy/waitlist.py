@@ -0,0 +1,218 @@
+"""课程候补队列
+
+课程满员时学生可以加入候补队列（按加入顺序先进先出）。有名额空出时
+（退课、扩容），后台线程按顺序递补：递补前重新检查时间冲突，有冲突的
+学生保留在队列中并跳过，轮到下一位。学生通过候补位置接口查询进度，
+不需要反复提交选课请求。
+"""
+import queue
+import sqlite3
+import threading
+
+from .authz import authz_index
+from .config import WAITLIST_SWEEP_INTERVAL
+from .db_operations import get_db_connection
+from .enrollment import EnrollmentError, enroll
+from .writer import run_write
+
+def _lookup(conn, student_id, course_id):
+    student = conn.execute('SELECT id FROM students WHERE student_id = ?',
+                           (student_id,)).fetchone()
+    if not student:
+        raise EnrollmentError('找不到学生信息', 404)
+    course = conn.execute(
+        'SELECT id, times, capacity, enrollment_count FROM courses WHERE id = ?',
+        (course_id,)).fetchone()
+    if not course:
+        raise EnrollmentError('找不到课程信息', 404)
+    return student[0], course
+
+def join_waitlist(conn, student_id, course_id):
+    """学生（学号）加入课程候补队列，返回候补位置"""
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        student_pk, course = _lookup(conn, student_id, course_id)
+        if conn.execute('SELECT 1 FROM student_courses WHERE student_id = ? AND course_id = ?',
+                        (student_pk, course_id)).fetchone():
+            raise EnrollmentError('您已经选择了这门课程')
+        if course['capacity'] is None or course['enrollment_count'] < course['capacity']:
+            raise EnrollmentError('课程还有名额，请直接选课')
+        try:
+            conn.execute('INSERT INTO course_waitlist (course_id, student_id) VALUES (?, ?)',
+                         (course_id, student_pk))
+        except sqlite3.IntegrityError:
+            raise EnrollmentError('您已在该课程的候补队列中') from None
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return waitlist_position(conn, student_id, course_id)
+
+def leave_waitlist(conn, student_id, course_id):
+    """退出候补队列，返回是否删除了记录"""
+    cursor = conn.execute('''
+        DELETE FROM course_waitlist
+        WHERE course_id = ? AND student_id = (SELECT id FROM students WHERE student_id = ?)
+    ''', (course_id, student_id))
+    conn.commit()
+    return cursor.rowcount > 0
+
+def waitlist_position(conn, student_id, course_id):
+    """查询学生在课程候补队列中的状态
+
+    status: enrolled(已选上)、waiting(候补中，position 从1开始)、none(不在队列中)
+    """
+    row = conn.execute('''
+        SELECT s.id,
+            EXISTS(SELECT 1 FROM student_courses sc
+                   WHERE sc.student_id = s.id AND sc.course_id = ?) AS enrolled,
+            (SELECT w.id FROM course_waitlist w
+             WHERE w.student_id = s.id AND w.course_id = ?) AS entry_id
+        FROM students s WHERE s.student_id = ?
+    ''', (course_id, course_id, student_id)).fetchone()
+    if not row:
+        raise EnrollmentError('找不到学生信息', 404)
+    waiting = conn.execute('SELECT COUNT(*) FROM course_waitlist WHERE course_id = ?',
+                           (course_id,)).fetchone()[0]
+    result = {'course_id': course_id, 'status': 'none', 'position': None, 'waiting': waiting}
+    if row['enrolled']:
+        result['status'] = 'enrolled'
+    elif row['entry_id'] is not None:
+        result['status'] = 'waiting'
+        result['position'] = conn.execute(
+            'SELECT COUNT(*) FROM course_waitlist WHERE course_id = ? AND id <= ?',
+            (course_id, row['entry_id'])).fetchone()[0]
+    return result
+
+def promote(conn, course_id):
+    """按候补顺序递补空出的名额，返回被递补学生的内部ID列表"""
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        course = conn.execute(
+            'SELECT id, times, capacity, enrollment_count FROM courses WHERE id = ?',
+            (course_id,)).fetchone()
+        promoted = []
+        if course:
+            seats = None if course['capacity'] is None \
+                else course['capacity'] - course['enrollment_count']
+            entries = conn.execute(
+                'SELECT id, student_id FROM course_waitlist WHERE course_id = ? ORDER BY id',
+                (course_id,)).fetchall()
+            for entry_id, student_pk in entries:
+                if seats is not None and seats <= 0:
+                    break
+                if conn.execute('SELECT 1 FROM student_courses WHERE student_id = ? AND course_id = ?',
+                                (student_pk, course_id)).fetchone():
+                    conn.execute('DELETE FROM course_waitlist WHERE id = ?', (entry_id,))
+                    continue
+                try:
+                    # 名额由 seats 计数，容量触发器兜底
+                    enroll(conn, student_pk, course, check_capacity=False)
+                except EnrollmentError as e:
+                    if e.status == 409:
+                        break
+                    # 时间冲突：保留在队列中，轮到下一位
+                    continue
+                conn.execute('DELETE FROM course_waitlist WHERE id = ?', (entry_id,))
+                promoted.append(student_pk)
+                if seats is not None:
+                    seats -= 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if promoted:
+        print(f"课程 {course_id} 候补递补:", promoted)
+    return promoted
+
+class WaitlistWorker:
+    """后台递补线程
+
+    notify(course_id) 在名额可能空出时调用（退课、修改容量），线程随后
+    对该课程执行递补；空闲时每隔 sweep_interval 秒检查一次所有有空位且
+    有候补的课程，弥补遗漏的通知。线程在第一次 notify 时启动。
+    """
+
+    def __init__(self, connect, sweep_interval=WAITLIST_SWEEP_INTERVAL):
+        self._connect = connect
+        self.sweep_interval = sweep_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._busy = threading.Lock()  # 递补或巡检进行中
+        self.promoted = 0
+
+    def notify(self, course_id):
+        self.start()
+        self._queue.put(course_id)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='waitlist-worker', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止线程，等待正在进行的递补或巡检结束；之后的 notify 会重新启动线程"""
+        with self._lock:
+            self._stop.set()
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def wait_idle(self):
+        """等待已通知的递补和正在进行的巡检全部处理完"""
+        self._queue.join()
+        with self._busy:
+            pass
+
+    def _promote(self, course_id):
+        try:
+            # 递补是写操作，交给单写线程执行
+            promoted = run_write(lambda conn: promote(conn, course_id))
+            if promoted:
+                # run_write 返回时已提交，递补的学生选课集合已变化
+                authz_index.invalidate_student()
+            self.promoted += len(promoted)
+        except Exception as e:
+            print(f'课程 {course_id} 候补递补失败:', e)
+
+    def sweep(self):
+        conn = self._connect()
+        try:
+            course_ids = [row[0] for row in conn.execute('''
+                SELECT DISTINCT w.course_id
+                FROM course_waitlist w
+                JOIN courses c ON c.id = w.course_id
+                WHERE c.capacity IS NULL OR c.enrollment_count < c.capacity
+            ''')]
+        finally:
+            conn.close()
+        for course_id in course_ids:
+            self._promote(course_id)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                course_id = self._queue.get(timeout=self.sweep_interval)
+            except queue.Empty:
+                with self._busy:
+                    try:
+                        self.sweep()
+                    except Exception as e:
+                        print('候补队列巡检失败:', e)
+                continue
+            try:
+                if course_id is not None:
+                    with self._busy:
+                        self._promote(course_id)
+            finally:
+                self._queue.task_done()
+
+waitlist_worker = WaitlistWorker(lambda: get_db_connection())
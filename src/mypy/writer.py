@@ -0,0 +1,292 @@
+"""单写线程与合并提交
+
+SQLite 同一时间只允许一个写事务，多个请求各自开连接写入时只会互相等待
+写锁甚至返回 database is locked。这里由一个专用线程持有唯一的写连接，
+从队列中取写任务执行：在很短的等待窗口内把排队的多个任务合并到同一个
+事务里，每个任务包在自己的 SAVEPOINT 中，失败的任务只回滚自己的修改，
+整个事务只提交（落盘）一次。调用方通过 Future 拿到结果，结果在事务
+提交之后才返回。
+
+写线程把写连接绑定为本线程的共享连接，任务中通过 get_db_connection()
+拿到的都是这个连接；任务调用 commit() 不生效，调用 rollback() 只回滚
+本任务的修改。任务中需要在数据提交后才能做的事（如使缓存失效）通过
+after_commit() 登记。
+
+需要自己管理事务的写操作（如要在事务外 ATTACH 归档文件的学期归档）用
+run_exclusive() 提交：仍由写线程执行，但不与其他任务合并，拿到的是一个
+普通连接，不会与写线程的其他写事务争用写锁。
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from .config import (
+    DATABASE_PATH, WRITER_ENABLED, WRITER_GROUP_WINDOW, WRITER_MAX_GROUP, DB_BUSY_TIMEOUT
+)
+from .db_operations import SharedConnection, Connection, bound_connection, bind_connection
+from .resilience import DatabaseBusy, QueryTimeout, note_unavailable
+
+class WriterConnection(SharedConnection):
+    """写任务使用的连接：commit()由写线程统一执行，rollback()只回滚当前任务"""
+
+    deferred = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 当前任务登记的提交后回调
+        self.job_callbacks = None
+        # 当前任务开始前本事务已写过的表
+        self.job_tables = set()
+
+    def rollback(self):
+        if self.in_transaction:
+            self.execute('ROLLBACK TO write_job')
+            self.written_tables = set(self.job_tables)
+
+class _Job:
+    __slots__ = ('fn', 'failed', 'future', 'exclusive')
+
+    def __init__(self, fn, failed, exclusive=False):
+        self.fn = fn
+        self.failed = failed
+        self.future = Future()
+        self.exclusive = exclusive
+
+class WriteQueue:
+    """写任务队列
+
+    run(fn) 把 fn(conn) 交给写线程执行并等待结果；failed(result) 返回
+    True 时视为失败并回滚该任务（例如返回了错误状态码的响应）。
+    未启用时 run() 在调用线程上用独立连接执行，事务语义相同。
+    """
+
+    def __init__(self, path, window=WRITER_GROUP_WINDOW, max_group=WRITER_MAX_GROUP,
+                 enabled=True, timeout=DB_BUSY_TIMEOUT):
+        self.path = path
+        self.window = window
+        self.max_group = max_group
+        self.enabled = enabled
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._file_id = None
+        self._pending = None  # 合并时遇到的独占任务，留到下一轮单独执行
+        self.groups = 0
+        self.jobs = 0
+        self.largest_group = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=WriterConnection,
+                               timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _file_identity(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_dev, st.st_ino)
+        except FileNotFoundError:
+            return None
+
+    def _writer_connection(self):
+        """写线程的连接；数据库文件被替换（如恢复备份）后重新打开"""
+        identity = self._file_identity()
+        if self._conn is None or identity != self._file_id:
+            if self._conn is not None:
+                self._conn.really_close()
+            self._conn = self._connect()
+            self._file_id = self._file_identity()
+            bind_connection(self._conn)
+        return self._conn
+
+    def run(self, fn, failed=None):
+        """执行写任务并返回fn的结果（或抛出fn的异常）"""
+        job = _Job(fn, failed)
+        shared = bound_connection()
+        if shared is not None:
+            # 已在写线程或批量请求的共享连接上：直接加入当前事务
+            return fn(shared)
+        if not self.enabled:
+            conn = self._connect()
+            bind_connection(conn)
+            try:
+                self._execute_group(conn, [job])
+            finally:
+                bind_connection(None)
+                conn.really_close()
+            return job.future.result()
+        self.start()
+        self._queue.put(job)
+        return self._wait(job)
+
+    def run_exclusive(self, fn):
+        """在写线程上单独执行fn(conn)并返回结果
+
+        conn 是不在事务中的普通连接，fn 自己开始、提交或回滚事务，
+        执行期间写线程不处理其他任务。未启用时在调用线程上执行。
+        """
+        if bound_connection() is not None:
+            raise RuntimeError('独占写任务不能在写任务或批量请求中执行')
+        job = _Job(fn, None, exclusive=True)
+        if not self.enabled:
+            self._execute_exclusive(job)
+            return job.future.result()
+        self.start()
+        self._queue.put(job)
+        return self._wait(job)
+
+    def _wait(self, job):
+        try:
+            return job.future.result()
+        except (DatabaseBusy, QueryTimeout) as e:
+            # 异常在写线程上抛出，在调用线程上再记一次，见 resilience.note_unavailable
+            note_unavailable(e)
+            raise
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'groups': self.groups,
+            'jobs': self.jobs,
+            'largest_group': self.largest_group,
+            'average_group': round(self.jobs / self.groups, 2) if self.groups else 0,
+            'queued': self._queue.qsize()
+        }
+
+    def _collect(self, first):
+        """在等待窗口内收集排队的任务，返回 (任务列表, 是否收到停止信号)"""
+        jobs = [first]
+        deadline = time.monotonic() + self.window
+        while len(jobs) < self.max_group:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return jobs, True
+            if job.exclusive:
+                self._pending = job
+                break
+            jobs.append(job)
+        return jobs, False
+
+    def _run(self):
+        while True:
+            first, self._pending = self._pending or self._queue.get(), None
+            if first is None:
+                break
+            if first.exclusive:
+                self._execute_exclusive(first)
+                continue
+            jobs, stop = self._collect(first)
+            try:
+                conn = self._writer_connection()
+                self._execute_group(conn, jobs)
+            except Exception as e:
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            if stop:
+                break
+        if self._conn is not None:
+            bind_connection(None)
+            self._conn.really_close()
+            self._conn = None
+
+    def _execute_exclusive(self, job):
+        conn = sqlite3.connect(self.path, factory=Connection, timeout=self.timeout)
+        conn.row_factory = sqlite3.Row
+        try:
+            job.future.set_result(job.fn(conn))
+        except BaseException as e:
+            job.future.set_exception(e)
+        finally:
+            conn.close()
+
+    def _execute_group(self, conn, jobs):
+        """在一个事务中依次执行任务，提交后再把结果交给调用方
+
+        BEGIN IMMEDIATE 和 COMMIT 遇到其他进程持有锁时由连接自动退避重试，
+        重试用尽时整组任务得到 DatabaseBusy。
+        """
+        outcomes = []
+        callbacks = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for job in jobs:
+                conn.execute('SAVEPOINT write_job')
+                conn.job_callbacks = []
+                conn.job_tables = set(conn.written_tables)
+                try:
+                    result = job.fn(conn)
+                    ok = not (job.failed and job.failed(result))
+                    outcomes.append((job, True, result))
+                except BaseException as e:
+                    ok = False
+                    outcomes.append((job, False, e))
+                if ok:
+                    callbacks.extend(conn.job_callbacks)
+                conn.job_callbacks = None
+                if not conn.in_transaction:
+                    raise sqlite3.OperationalError('写事务被意外终止')
+                if not ok:
+                    conn.execute('ROLLBACK TO write_job')
+                    conn.written_tables = set(conn.job_tables)
+                conn.execute('RELEASE write_job')
+            Connection.commit(conn)
+        except BaseException:
+            conn.job_callbacks = None
+            if conn.in_transaction:
+                Connection.rollback(conn)
+            raise
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print('提交后回调失败:', e)
+
+        self.groups += 1
+        self.jobs += len(jobs)
+        self.largest_group = max(self.largest_group, len(jobs))
+        for job, ok, value in outcomes:
+            if ok:
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(value)
+
+write_queue = WriteQueue(DATABASE_PATH, enabled=WRITER_ENABLED)
+
+def run_write(fn, failed=None):
+    return write_queue.run(fn, failed)
+
+def after_commit(fn):
+    """在当前写任务（或批量请求事务）提交后调用fn
+
+    任务被回滚时不调用；不在写任务或批量事务中时立即调用。
+    """
+    conn = bound_connection()
+    callbacks = getattr(conn, 'job_callbacks', None)
+    if callbacks is None:
+        fn()
+    else:
+        callbacks.append(fn)
@@ -0,0 +1,284 @@
+"""生产环境启动入口：预先创建多个工作进程共享同一个监听端口
+
+主进程创建监听套接字后 fork 出若干工作进程，每个工作进程用固定大小的
+线程池处理请求。应用（edu_sys_main）在工作进程 fork 之后才导入；--preload
+时改为在主进程中导入一次，启动更快，但 SIGHUP 不会加载新代码。工作进程
+依次启动，前一个导入完成（数据库迁移执行完）后才启动下一个。
+
+数据库连接和进程内缓存（权限索引等）属于各自的进程。工作进程启动时
+另外做的事情只有：启动本进程的单写线程（因此各进程的写事务仍会争用
+数据库写锁），开启指标文件汇总，以及在第 0 号工作进程中启动快照后台刷新
+（EDU_SNAPSHOT=1）和变更日志清理线程。候补队列线程在进程内第一次有
+名额变化时才启动。
+
+信号（发给主进程）:
+    SIGHUP   平滑重启：启动新一批工作进程，就绪后让旧进程处理完手上的请求再退出
+    SIGTERM  平滑退出；SIGINT 同 SIGTERM
+工作进程处理 max_requests（加少量随机抖动）个请求后平滑退出，由主进程补上。
+每个工作进程同时处理的请求不超过 --threads 个，线程都在忙时不再 accept，
+连接留给其他工作进程。
+快照年龄取快照文件的修改时间，各进程看到的一致，过期时由文件锁保证只有
+一个进程复制。
+查询缓存（EDU_QUERY_CACHE=1）只在写入的进程内失效，多个工作进程时会被关闭。
+只支持类 Unix 系统。
+
+用法（在 src 目录下）:
+    python serve.py --bind 0.0.0.0:5000 --workers 4 --threads 8 --max-requests 10000
+"""
+import argparse
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+from mypy.config import (
+    SERVER_BIND, SERVER_WORKERS, SERVER_THREADS, SERVER_MAX_REQUESTS, SERVER_GRACEFUL_TIMEOUT
+)
+
+class PooledWSGIServer(BaseWSGIServer):
+    """在已有的监听套接字上接受连接，交给线程池处理；达到 max_requests 后停止接受"""
+
+    multithread = True
+
+    def __init__(self, host, fd, app, threads, max_requests=0):
+        super().__init__(host, 0, app, fd=fd)
+        # 多个进程同时等待同一个套接字，没抢到连接的进程 accept 时不能阻塞
+        self.socket.setblocking(False)
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='http')
+        # 处理中的请求数上限：线程都在忙时不再接受连接，而不是在线程池队列里无限堆积
+        self._slots = threading.BoundedSemaphore(threads)
+        self.max_requests = max_requests
+        self.handled = 0
+        self._count_lock = threading.Lock()
+        self._stopping = False
+
+    def get_request(self):
+        # 先等到有空闲线程再 accept；等待期间连接留在监听队列中，可被其他进程接受
+        self._slots.acquire()
+        try:
+            conn, address = self.socket.accept()
+        except BaseException:
+            self._slots.release()
+            raise
+        conn.setblocking(True)
+        return conn, address
+
+    def process_request(self, request, client_address):
+        try:
+            self.pool.submit(self._process, request, client_address)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+        with self._count_lock:
+            self.handled += 1
+            recycle = self.max_requests and self.handled >= self.max_requests
+        if recycle:
+            self.stop()
+
+    def stop(self):
+        """停止接受新连接（可在任意线程调用），serve_forever 随后返回"""
+        with self._count_lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+def load_app():
+    from edu_sys_main import app
+    return app
+
+def worker_main(index, sock, args, ready_fd, app):
+    """工作进程：导入应用、通知主进程就绪，然后处理请求直到收到 SIGTERM 或达到请求上限"""
+    # 不继承主进程的信号处理；Ctrl+C 发给整个进程组，由主进程统一停止
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    if app is None:
+        app = load_app()
+
+    from mypy.writer import write_queue
+    from mypy.snapshot import snapshot_manager
+    from mypy.changes import change_log_pruner
+    from mypy.metrics import metrics
+    from mypy.db_operations import query_cache
+    # 各工作进程的指标通过文件汇总，进程重启后累计值不丢失
+    metrics.shared = True
+    if query_cache.enabled and args.workers > 1:
+        # 其他进程的写入不会使本进程的缓存失效，会读到旧数据
+        print(f'[worker {index}] 多进程部署不支持查询缓存，已关闭 EDU_QUERY_CACHE', flush=True)
+        query_cache.enabled = False
+    # 本进程的单写连接和后台线程在 fork 之后建立
+    write_queue.start()
+    if index == 0 and snapshot_manager.enabled:
+        snapshot_manager.start()
+    if index == 0:
+        change_log_pruner.start()
+
+    max_requests = args.max_requests
+    if max_requests:
+        # 加抖动，避免所有工作进程同时重启
+        max_requests += random.randint(0, max(max_requests // 10, 1))
+    server = PooledWSGIServer(sock.getsockname()[0], sock.fileno(), app, args.threads, max_requests)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    os.write(ready_fd, b'1')
+    os.close(ready_fd)
+
+    server.serve_forever(poll_interval=0.5)
+    # 等待线程池中的请求处理完
+    server.pool.shutdown(wait=True)
+    write_queue.stop()
+    # os._exit 不执行 atexit，退出前写入本进程最后的指标
+    metrics.flush()
+    if server.max_requests and server.handled >= server.max_requests:
+        print(f'[worker {index}] 已处理 {server.handled} 个请求，退出后由主进程重启', flush=True)
+
+class Master:
+    def __init__(self, args):
+        self.args = args
+        host, port = parse_bind(args.bind)
+        self.sock = socket.create_server((host, port), backlog=2048)
+        self.sock.set_inheritable(True)
+        self.address = self.sock.getsockname()
+        self.app = load_app() if args.preload else None
+        self.generation = 0
+        self.workers = {}  # pid -> (generation, index)
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def spawn(self, index):
+        """fork 一个工作进程并等待它就绪，返回是否就绪"""
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            code = 0
+            try:
+                worker_main(index, self.sock, self.args, ready_w, self.app)
+            except BaseException as e:
+                print(f'[worker {index}] 异常退出: {e!r}', flush=True)
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        os.close(ready_w)
+        self.workers[pid] = (self.generation, index)
+        ready, _, _ = select.select([ready_r], [], [], 60)
+        ok = bool(ready) and os.read(ready_r, 1) == b'1'
+        os.close(ready_r)
+        return ok
+
+    def reap(self):
+        """回收已退出的工作进程，返回它们的 (generation, index)"""
+        exited = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            info = self.workers.pop(pid, None)
+            if info:
+                exited.append(info)
+        return exited
+
+    def signal_workers(self, sig, generation=None):
+        for pid, (gen, _) in list(self.workers.items()):
+            if generation is None or gen == generation:
+                try:
+                    os.kill(pid, sig)
+                except ProcessLookupError:
+                    pass
+
+    def reload(self):
+        old = self.generation
+        self.generation += 1
+        print(f'[master] 平滑重启：启动第 {self.generation} 批工作进程', flush=True)
+        for index in range(self.args.workers):
+            if not self.spawn(index):
+                print(f'[master] 新工作进程 {index} 未能就绪，保留旧进程', flush=True)
+                self.signal_workers(signal.SIGTERM, self.generation)
+                self.generation = old
+                return
+        self.signal_workers(signal.SIGTERM, old)
+
+    def stop(self):
+        print('[master] 正在停止工作进程', flush=True)
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.signal_workers(signal.SIGKILL)
+        while self.workers:
+            self.reap()
+            time.sleep(0.05)
+        self.sock.close()
+
+    def run(self):
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        def request_stop(signum, frame):
+            self.stop_requested = True
+
+        signal.signal(signal.SIGHUP, request_reload)
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        host, port = self.address[:2]
+        print(f'[master] pid {os.getpid()} 监听 http://{host}:{port}，'
+              f'{self.args.workers} 个工作进程 x {self.args.threads} 个线程', flush=True)
+        for index in range(self.args.workers):
+            self.spawn(index)
+
+        while not self.stop_requested:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self.reap()
+            # 补上因请求上限或异常退出的当前批次工作进程
+            running = {index for gen, index in self.workers.values() if gen == self.generation}
+            for index in range(self.args.workers):
+                if index not in running and not self.stop_requested:
+                    if not self.spawn(index):
+                        # 启动即失败（如导入出错）时放慢重试
+                        time.sleep(1)
+            time.sleep(0.2)
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bind', default=SERVER_BIND, help='监听地址，如 0.0.0.0:5000（端口0表示随机端口）')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='工作进程数')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='每个工作进程的线程数')
+    parser.add_argument('--max-requests', type=int, default=SERVER_MAX_REQUESTS,
+                        help='工作进程处理多少请求后重启，0表示不重启')
+    parser.add_argument('--graceful-timeout', type=float, default=SERVER_GRACEFUL_TIMEOUT,
+                        help='停止时等待工作进程处理完请求的秒数')
+    parser.add_argument('--preload', action='store_true', help='在主进程中导入应用后再 fork')
+    args = parser.parse_args()
+    Master(args).run()
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,251 @@
 var API_BASE_URL = `http://${window.location.host}/api`;
 
+// 客户端数据层：并发请求去重 + ETag内存缓存 + stale-while-revalidate
+var API_CACHE_FRESH_MS = 5000;    // 新鲜期内直接使用缓存，不发请求
+var API_CACHE_STALE_MS = 60000;   // 过期但在此时间内：先返回旧数据，后台重新验证
+var apiCache = new Map();         // url -> { etag, result, time }
+var apiInflight = new Map();      // url -> Promise
+
+function cloneResult(result) {
+    // 返回副本，避免页面修改数据污染缓存
+    return typeof structuredClone === 'function'
+        ? structuredClone(result)
+        : JSON.parse(JSON.stringify(result));
+}
+
+function revalidate(url) {
+    // 同一URL同时只允许一个请求在途
+    if (apiInflight.has(url)) {
+        return apiInflight.get(url);
+    }
+    const entry = apiCache.get(url);
+    const headers = {};
+    if (entry && entry.etag) {
+        headers['If-None-Match'] = entry.etag;
+    }
+    const request = fetch(url, { credentials: 'include', cache: 'no-store', headers })
+        .then(async response => {
+            // 请求期间缓存被失效时，结果只返回给调用方，不再写回缓存
+            const stillValid = apiInflight.get(url) === request;
+            if (response.status === 304 && entry) {
+                if (stillValid) {
+                    entry.time = Date.now();
+                }
+                return entry.result;
+            }
+            const result = await handleResponse(response);
+            if (stillValid) {
+                apiCache.set(url, {
+                    etag: response.headers.get('ETag'),
+                    result: result,
+                    time: Date.now()
+                });
+            }
+            return result;
+        })
+        .finally(() => {
+            if (apiInflight.get(url) === request) {
+                apiInflight.delete(url);
+            }
+        });
+    apiInflight.set(url, request);
+    return request;
+}
+
+async function cachedGet(url) {
+    const entry = apiCache.get(url);
+    const age = entry ? Date.now() - entry.time : Infinity;
+    if (age < API_CACHE_FRESH_MS) {
+        return cloneResult(entry.result);
+    }
+    if (age < API_CACHE_STALE_MS) {
+        revalidate(url).catch(error => console.error('后台刷新缓存失败:', url, error));
+        return cloneResult(entry.result);
+    }
+    return cloneResult(await revalidate(url));
+}
+
+// 按路径片段使缓存失效，不传参数时清空全部缓存
+window.invalidateApiCache = function (...patterns) {
+    const matches = url => patterns.length === 0 || patterns.some(p => url.includes(p));
+    for (const url of Array.from(apiCache.keys())) {
+        if (matches(url)) {
+            apiCache.delete(url);
+        }
+    }
+    expireSyncTables();
+    for (const url of Array.from(apiInflight.keys())) {
+        if (matches(url)) {
+            apiInflight.delete(url);
+        }
+    }
+}
+
+// 增量同步：管理员页面的课程/学生/教师列表首次完整加载，之后只通过
+// /api/changes 获取变更并应用到本地副本；无权限或出错时退回普通请求
+var syncTables = new Map();       // table -> { version, rows: Map(id -> row), time }
+var syncInflight = new Map();     // table -> Promise
+var syncDisabled = false;
+
+// 本地写操作后让同步状态过期，下次读取时立即拉取变更
+function expireSyncTables() {
+    for (const state of syncTables.values()) {
+        state.time = 0;
+    }
+}
+
+async function fetchChanges(table, since) {
+    const query = since === null ? '' : `?since=${since}&tables=${table}`;
+    const response = await fetch(`${API_BASE_URL}/changes${query}`, {
+        credentials: 'include',
+        cache: 'no-store'
+    });
+    if (response.status === 401 || response.status === 403) {
+        syncDisabled = true;
+        return null;
+    }
+    return (await handleResponse(response)).data;
+}
+
+async function loadSyncTable(url, table) {
+    let state = syncTables.get(table);
+    if (!state) {
+        // 先取版本号再取完整列表，期间的变更会在下次同步时重复应用（幂等）
+        const head = await fetchChanges(table, null);
+        if (!head) {
+            return null;
+        }
+        const result = await revalidate(url);
+        if (!result.success) {
+            return null;
+        }
+        state = {
+            version: head.version,
+            rows: new Map(result.data.map(row => [String(row.id), row])),
+            time: Date.now()
+        };
+        syncTables.set(table, state);
+        return state;
+    }
+    if (Date.now() - state.time < API_CACHE_FRESH_MS) {
+        return state;
+    }
+    let delta;
+    do {
+        delta = await fetchChanges(table, state.version);
+        if (!delta) {
+            return null;
+        }
+        if (delta.reset) {
+            syncTables.delete(table);
+            return loadSyncTable(url, table);
+        }
+        for (const change of delta.changes) {
+            const id = String(change.key.id);
+            if (change.op === 'delete') {
+                state.rows.delete(id);
+            } else {
+                state.rows.set(id, change.data);
+            }
+        }
+        state.version = delta.version;
+    } while (delta.has_more);
+    state.time = Date.now();
+    return state;
+}
+
+async function syncedList(path, table, compare) {
+    const url = `${API_BASE_URL}${path}`;
+    if (syncDisabled) {
+        return cachedGet(url);
+    }
+    if (!syncInflight.has(table)) {
+        syncInflight.set(table, loadSyncTable(url, table)
+            .catch(error => {
+                console.error('增量同步失败，改为完整加载:', table, error);
+                syncTables.delete(table);
+                return null;
+            })
+            .finally(() => syncInflight.delete(table)));
+    }
+    const state = await syncInflight.get(table);
+    if (!state) {
+        return cachedGet(url);
+    }
+    const data = Array.from(state.rows.values()).sort(compare);
+    return cloneResult({ success: true, data: data, message: '获取列表成功' });
+}
+
+const byId = (a, b) => a.id - b.id;
+const byName = (a, b) => (a.name < b.name ? -1 : a.name > b.name ? 1 : 0);
+
+// 批量请求：requests为 [{method, path, body}]，path不含 /api 前缀
+window.apiBatch = async function (requests, transaction = false) {
+    const response = await fetch(`${API_BASE_URL}/batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        credentials: 'include',
+        body: JSON.stringify({
+            transaction: transaction,
+            requests: requests.map(r => ({
+                method: r.method || 'GET',
+                path: `/api${r.path}`,
+                body: r.body,
+                headers: r.headers
+            }))
+        })
+    });
+    const result = await handleResponse(response);
+    if (requests.some(r => (r.method || 'GET').toUpperCase() !== 'GET')) {
+        invalidateApiCache();
+    }
+    return result;
+}
+
+// 用一次批量请求预取多个GET接口并写入缓存，之后的get*调用直接命中缓存
+window.prefetchApi = async function (paths) {
+    const now = Date.now();
+    const pending = paths.filter(path => {
+        const url = `${API_BASE_URL}${path}`;
+        const entry = apiCache.get(url);
+        return !apiInflight.has(url) && (!entry || now - entry.time >= API_CACHE_FRESH_MS);
+    });
+    if (pending.length === 0) {
+        return;
+    }
+    try {
+        const result = await apiBatch(pending.map(path => {
+            const entry = apiCache.get(`${API_BASE_URL}${path}`);
+            return {
+                path: path,
+                headers: entry && entry.etag ? { 'If-None-Match': entry.etag } : {}
+            };
+        }));
+        result.data.forEach((item, i) => {
+            const url = `${API_BASE_URL}${pending[i]}`;
+            const entry = apiCache.get(url);
+            if (item.status === 304 && entry) {
+                entry.time = Date.now();
+            } else if (item.status === 200 && item.body && item.body.success) {
+                apiCache.set(url, { etag: item.etag, result: item.body, time: Date.now() });
+            }
+        });
+    } catch (error) {
+        // 预取失败不影响页面，后续get*调用会单独请求
+        console.error('批量预取失败:', error);
+    }
+}
+
+// 乐观并发：数据中带有读取时的version时，用If-Match让服务端检查该行
+// 是否已被他人修改（已修改时返回412）
+function versionedHeaders(table, id, data) {
+    const headers = { 'Content-Type': 'application/json' };
+    if (data && data.version != null) {
+        headers['If-Match'] = `"${table}-${id}-v${data.version}"`;
+    }
+    return headers;
+}
+
 // 课程相关API
 window.addCourse = async function (courseData) {
     try {
@@ -13,6 +259,8 @@ window.addCourse = async function (courseData) {
         return handleResponse(response);
     } catch (error) {
         handleError('添加课程失败', error);
+    } finally {
+        invalidateApiCache('/courses');
     }
 }
 
@@ -20,13 +268,15 @@ window.updateCourse = async function (courseId, courseData) {
     try {
         const response = await fetch(`${API_BASE_URL}/courses/${courseId}`, {
             method: 'PUT',
-            headers: { 'Content-Type': 'application/json' },
+            headers: versionedHeaders('courses', courseId, courseData),
             credentials: 'include',
             body: JSON.stringify(courseData)
         });
         return handleResponse(response);
     } catch (error) {
         handleError('更新课程失败', error);
+    } finally {
+        invalidateApiCache('/courses');
     }
 }
 
@@ -43,6 +293,8 @@ window.addStudent = async function (studentData) {
         return handleResponse(response);
     } catch (error) {
         handleError('添加学生失败', error);
+    } finally {
+        invalidateApiCache('/students');
     }
 }
 
@@ -60,6 +312,8 @@ window.updateStudent = async function (studentId, studentData) {
         return handleResponse(response);
     } catch (error) {
         handleError('更新学生信息失败', error);
+    } finally {
+        invalidateApiCache('/students');
     }
 }
 
@@ -74,6 +328,8 @@ window.deleteStudent = async function (studentId) {
     } catch (error) {
         console.error('删除学生失败:', error);
         throw error;
+    } finally {
+        invalidateApiCache('/students', '/course-grades');
     }
 }
 
@@ -91,6 +347,8 @@ window.addStudentCourse = async function (studentId, courseId) {
         return handleResponse(response);
     } catch (error) {
         handleError('选课失败', error);
+    } finally {
+        invalidateApiCache('/courses', '/students');
     }
 }
 
@@ -108,16 +366,15 @@ window.dropStudentCourse = async function (studentId, courseId) {
         return handleResponse(response);
     } catch (error) {
         handleError('退课失败', error);
+    } finally {
+        invalidateApiCache('/courses', '/students');
     }
 }
 
 window.getStudentCourses = async function (studentId) {
     try {
         console.log('获取学生课程:', studentId);
-        const response = await fetch(`${API_BASE_URL}/students/${studentId}/courses`, {
-            credentials: 'include'
-        });
-        return handleResponse(response);
+        return await cachedGet(`${API_BASE_URL}/students/${studentId}/courses`);
     } catch (error) {
         handleError('获取学生课程失败', error);
     }
@@ -126,10 +383,7 @@ window.getStudentCourses = async function (studentId) {
 // 获取当前学生的个人资料
 window.getStudentProfile = async function (studentId) {
     try {
-        const response = await fetch(`${API_BASE_URL}/students/${studentId}/profile`, {
-            credentials: 'include'
-        });
-        return handleResponse(response);
+        return await cachedGet(`${API_BASE_URL}/students/${studentId}/profile`);
     } catch (error) {
         handleError('获取学生个人资料失败', error);
     }
@@ -149,6 +403,8 @@ window.updateStudentProfile = async function (studentId, profileData) {
         return handleResponse(response);
     } catch (error) {
         handleError('更新学生个人资料失败', error);
+    } finally {
+        invalidateApiCache('/students', '/current-user');
     }
 }
 
@@ -156,10 +412,7 @@ window.updateStudentProfile = async function (studentId, profileData) {
 window.getCurrentStudentId = async function () {
     try {
         // 获取当前用户信息
-        const userResponse = await fetch(`${API_BASE_URL}/current-user`, {
-            credentials: 'include'
-        });
-        const userData = await handleResponse(userResponse);
+        const userData = await cachedGet(`${API_BASE_URL}/current-user`);
 
         console.log('当前用户信息:', userData); // 添加调试信息
 
@@ -208,6 +461,8 @@ window.addTeacher = async function (teacherData) {
         return handleResponse(response);
     } catch (error) {
         handleError('添加教师失败', error);
+    } finally {
+        invalidateApiCache('/teachers');
     }
 }
 
@@ -222,6 +477,7 @@ window.updateTeacher = async function (teacherId, teacherData) {
             credentials: 'include',
             body: JSON.stringify(teacherData)
         });
+        invalidateApiCache('/teachers');
         const result = await handleResponse(response);
         if (result.success) {
             // 更新成功后刷新所有相关数据
@@ -240,10 +496,7 @@ window.updateTeacher = async function (teacherId, teacherData) {
 // 获取当前教师的个人资料
 window.getTeacherProfile = async function (teacherId) {
     try {
-        const response = await fetch(`${API_BASE_URL}/teachers/${teacherId}/profile`, {
-            credentials: 'include'
-        });
-        return handleResponse(response);
+        return await cachedGet(`${API_BASE_URL}/teachers/${teacherId}/profile`);
     } catch (error) {
         handleError('获取教师个人资料失败', error);
     }
@@ -263,6 +516,8 @@ window.updateTeacherProfile = async function (teacherId, profileData) {
         return handleResponse(response);
     } catch (error) {
         handleError('更新教师个人资料失败', error);
+    } finally {
+        invalidateApiCache('/teachers', '/current-user');
     }
 }
 
@@ -280,16 +535,15 @@ window.addTeacherCourse = async function (teacherId, courseId) {
         return handleResponse(response);
     } catch (error) {
         handleError('安排课程失败', error);
+    } finally {
+        invalidateApiCache('/teachers', '/teacher-courses');
     }
 }
 
 window.getTeacherCourses = async function (teacherId) {
     try {
         console.log('获取教师课程:', teacherId);
-        const response = await fetch(`${API_BASE_URL}/teachers/${teacherId}/courses`, {
-            credentials: 'include'
-        });
-        return handleResponse(response);
+        return await cachedGet(`${API_BASE_URL}/teachers/${teacherId}/courses`);
     } catch (error) {
         handleError('获取教师课程失败', error);
     }
@@ -299,12 +553,21 @@ window.getTeacherCourses = async function (teacherId) {
 window.getCurrentTeacherCourses = async function () {
     try {
         console.log('获取当前教师的课程...');
-        const response = await fetch(`${API_BASE_URL}/teacher-courses/current`, {
+        return await cachedGet(`${API_BASE_URL}/teacher-courses/current`);
+    } catch (error) {
+        handleError('获取当前教师课程失败', error);
+    }
+}
+
+// 获取教师看板：课程计数、最近作业和成绩录入进度（不缓存，计数随作业和成绩变化）
+window.getTeacherDashboard = async function (recent = 3) {
+    try {
+        const response = await fetch(`${API_BASE_URL}/teacher/dashboard?recent=${recent}`, {
             credentials: 'include'
         });
-        return handleResponse(response);
+        return await handleResponse(response);
     } catch (error) {
-        handleError('获取当前教师课程失败', error);
+        handleError('获取教师看板失败', error);
     }
 }
 
@@ -312,10 +575,7 @@ window.getCurrentTeacherCourses = async function () {
 window.getCourseStudents = async function (courseId) {
     try {
         console.log('获取课程学生:', courseId);
-        const response = await fetch(`${API_BASE_URL}/courses/${courseId}/students`, {
-            credentials: 'include'
-        });
-        return handleResponse(response);
+        return await cachedGet(`${API_BASE_URL}/courses/${courseId}/students`);
     } catch (error) {
         handleError('获取课程学生失败', error);
     }
@@ -325,17 +585,7 @@ window.getCourseStudents = async function (courseId) {
 window.getCourses = async function () {
     try {
         console.log('正在获取课程列表...');
-        const response = await fetch(`${API_BASE_URL}/courses`, {
-            method: 'GET',
-            headers: { 'Content-Type': 'application/json' },
-            credentials: 'include'
-        });
-
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-
-        const result = await response.json();
+        const result = await syncedList('/courses', 'courses', byName);
         console.log('获取到的课程数据:', result);
 
         if (!result.success) {
@@ -352,10 +602,7 @@ window.getCourses = async function () {
 window.getStudents = async function () {
     try {
         console.log('正在获取学生列表...');
-        const response = await fetch(`${API_BASE_URL}/students`, {
-            credentials: 'include'
-        });
-        const result = await handleResponse(response);
+        const result = await syncedList('/students', 'students', byId);
         console.log('获取到的学生数据:', result.data);
         return result;
     } catch (error) {
@@ -366,10 +613,7 @@ window.getStudents = async function () {
 window.getTeachers = async function () {
     try {
         console.log('正在获取教师列表...');
-        const response = await fetch(`${API_BASE_URL}/teachers`, {
-            credentials: 'include'
-        });
-        const result = await handleResponse(response);
+        const result = await syncedList('/teachers', 'teachers', byId);
         console.log('获取到的教师数据:', result.data);
         return result;
     } catch (error) {
@@ -438,6 +682,16 @@ window.updateCourseSelectors = async function () {
 // 修改刷新数据的函数
 window.refreshAllData = async function () {
     try {
+        const paths = ['/teachers', '/courses', '/students'];
+        const teacherId = $('#teacherSelect').val();
+        const studentId = $('#studentSelect').val();
+        if (teacherId) {
+            paths.push(`/teachers/${teacherId}/courses`);
+        }
+        if (studentId) {
+            paths.push(`/students/${studentId}/courses`);
+        }
+        await prefetchApi(paths);
         await Promise.all([
             updateTeacherSelectors(),
             updateTeacherLists(),
@@ -631,10 +885,7 @@ window.updateStudentCourses = async function () {
 window.getStudentGrades = async function (studentId) {
     try {
         console.log('获取学生成绩:', studentId);
-        const response = await fetch(`${API_BASE_URL}/students/${studentId}/grades`, {
-            credentials: 'include'
-        });
-        return handleResponse(response);
+        return await cachedGet(`${API_BASE_URL}/students/${studentId}/grades`);
     } catch (error) {
         handleError('获取成绩失败', error);
     }
@@ -654,6 +905,8 @@ window.saveGrades = async function (studentId, grades) {
         return handleResponse(response);
     } catch (error) {
         handleError('保存成绩失败', error);
+    } finally {
+        invalidateApiCache('/grades');
     }
 }
 
@@ -675,16 +928,15 @@ window.addAssignment = async function (courseId, assignmentData) {
     } catch (error) {
         console.error('添加作业失败:', error);
         throw error;
+    } finally {
+        invalidateApiCache('/assignments');
     }
 }
 
 window.getAssignments = async function (courseId) {
     try {
         console.log('获取作业列表:', courseId);
-        const response = await fetch(`${API_BASE_URL}/courses/${courseId}/assignments`, {
-            credentials: 'include'
-        });
-        const result = await handleResponse(response);
+        const result = await cachedGet(`${API_BASE_URL}/courses/${courseId}/assignments`);
         console.log('获取作业列表响应:', result);
         return result;
     } catch (error) {
@@ -693,6 +945,17 @@ window.getAssignments = async function (courseId) {
     }
 }
 
+// 学生作业流：所选全部课程的作业按发布时间倒序，cursor 为上一页的 next_cursor
+window.getAssignmentFeed = async function (studentId, cursor = null) {
+    try {
+        const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        return await cachedGet(`${API_BASE_URL}/students/${studentId}/assignment-feed${params}`);
+    } catch (error) {
+        console.error('获取作业流失败:', error);
+        throw error;
+    }
+}
+
 window.deleteAssignment = async function (assignmentId) {
     try {
         console.log('发送删除作业请求:', assignmentId);
@@ -704,6 +967,8 @@ window.deleteAssignment = async function (assignmentId) {
     } catch (error) {
         console.error('删除作业失败:', error);
         throw error;
+    } finally {
+        invalidateApiCache('/assignments');
     }
 }
 
@@ -712,9 +977,7 @@ window.updateAssignment = async function (assignmentId, assignmentData) {
         console.log('发送更新作业请求:', { assignmentId, assignmentData });
         const response = await fetch(`${API_BASE_URL}/assignments/${assignmentId}`, {
             method: 'PUT',
-            headers: {
-                'Content-Type': 'application/json',
-            },
+            headers: versionedHeaders('assignments', assignmentId, assignmentData),
             credentials: 'include',
             body: JSON.stringify(assignmentData)
         });
@@ -722,6 +985,8 @@ window.updateAssignment = async function (assignmentId, assignmentData) {
     } catch (error) {
         console.error('更新作业失败:', error);
         throw error;
+    } finally {
+        invalidateApiCache('/assignments');
     }
 }
 
@@ -757,10 +1022,7 @@ function filterDataWithLimit(dataList, searchText, limit = 25) {
 // 获取当前管理员的个人资料
 window.getAdminProfile = async function (adminId) {
     try {
-        const response = await fetch(`${API_BASE_URL}/admins/${adminId}/profile`, {
-            credentials: 'include'
-        });
-        return handleResponse(response);
+        return await cachedGet(`${API_BASE_URL}/admins/${adminId}/profile`);
     } catch (error) {
         handleError('获取管理员个人资料失败', error);
     }
@@ -780,5 +1042,7 @@ window.updateAdminProfile = async function (adminId, profileData) {
         return handleResponse(response);
     } catch (error) {
         handleError('更新管理员个人资料失败', error);
+    } finally {
+        invalidateApiCache('/admins', '/current-user');
     }
 }
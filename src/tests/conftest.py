@@ -1,12 +1,25 @@
 import os, sys
+import atexit
+import shutil
 import sqlite3
+import tempfile
 # __file__ => src/tests/conftest.py，
 # os.path.dirname(__file__) => src/tests，
 # os.path.join(..., '..') => src
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# 每个测试进程（pytest-xdist 的每个 worker）使用自己的数据库目录，
+# 必须在导入应用之前设置，mypy.config 按它确定数据库、快照和归档路径
+_worker = os.environ.get('PYTEST_XDIST_WORKER', 'main')
+_database_dir = tempfile.mkdtemp(prefix=f'edu_test_{_worker}_')
+os.environ['EDU_DATABASE_DIR'] = _database_dir
+atexit.register(shutil.rmtree, _database_dir, ignore_errors=True)
+
 import pytest
-from edu_sys_main import app as flask_app
+from edu_sys_main import app as flask_app, init_db
+from mypy.authz import authz_index
+from mypy.config import DATABASE_PATH
+from mypy.waitlist import waitlist_worker
 
 @pytest.fixture
 def app():
@@ -21,17 +34,12 @@ def app():
 def client(app):
     return app.test_client()
 
-@pytest.fixture(scope="function", autouse=True)
-def reset_database():
-    """每次测试后删除测试数据库文件并重新初始化"""
-    db_path = os.path.join(os.path.dirname(__file__), '../database/edu_system.db')
-    if os.path.exists(db_path):
-        os.remove(db_path)
-
-    # 初始化数据库
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
+def _build_schema():
+    """从空库建立完整表结构，与原来每个测试前的初始化步骤相同"""
+    if os.path.exists(DATABASE_PATH):
+        os.remove(DATABASE_PATH)
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
@@ -41,9 +49,30 @@ def reset_database():
     ''')
     conn.commit()
     conn.close()
+    # 补齐其余表结构（role列、admins表及迁移创建的业务表）
+    init_db()
 
-    yield  # 测试运行在此处
+@pytest.fixture(scope="session")
+def template_database():
+    """整个测试进程只建一次表结构，保存为内存中的模板库"""
+    _build_schema()
+    template = sqlite3.connect(':memory:', check_same_thread=False)
+    source = sqlite3.connect(DATABASE_PATH)
+    source.backup(template)
+    source.close()
+    yield template
+    template.close()
 
-    # 测试完成后删除数据库文件
-    if os.path.exists(db_path):
-        os.remove(db_path)
+@pytest.fixture(scope="function", autouse=True)
+def reset_database(template_database):
+    """每个测试前用备份API把模板库整体复制到本进程的数据库文件"""
+    target = sqlite3.connect(DATABASE_PATH)
+    template_database.backup(target)
+    target.close()
+    # 数据库重建后编号会被复用，清空上一个测试留下的权限索引
+    authz_index.clear()
+
+    yield  # 测试运行在此处
+    # 递补线程是进程内共用的，停掉后下一个测试的 notify 会重新启动，
+    # 不会在下一个测试的数据库上执行上一个测试遗留的递补或巡检
+    waitlist_worker.stop()
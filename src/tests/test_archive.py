@@ -0,0 +1,109 @@
+import sqlite3
+
+import pytest
+
+import mypy.archive
+from mypy.config import DATABASE_PATH
+
+
+@pytest.fixture
+def admin_client(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(mypy.archive, 'ARCHIVE_DIR', str(tmp_path))
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def two_terms():
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO courses (id, name, learn_time, term, credit, usual_score, midterm_score, final_score) "
+                 "VALUES (1, '数据库', '大一', '2023-2024-2', 3, 20, 30, 50), "
+                 "(2, '操作系统', '大二', '2024-2025-1', 4, 10, 10, 80)")
+    conn.execute("INSERT INTO students (id, name, student_id) VALUES (1, '张三', '2023001')")
+    conn.execute("INSERT INTO student_courses VALUES (1, 1), (1, 2)")
+    conn.execute("INSERT INTO grades (student_id, course_id, usual_grade, midterm_grade, final_grade) "
+                 "VALUES (1, 1, 90, 80, 70), (1, 2, 60, 60, 60)")
+    conn.execute("INSERT INTO assignments (course_id, title, content) VALUES (1, '作业1', '内容')")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def closed_term(admin_client, two_terms):
+    assert admin_client.post('/api/terms/2023-2024-2/close').status_code == 200
+    return '2023-2024-2'
+
+
+def hot_count(table):
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_archive_moves_term_out_of_hot_tables(admin_client, closed_term, tmp_path):
+    response = admin_client.post('/api/archive/terms', json={'term': closed_term})
+    assert response.status_code == 200
+    assert response.json['data'] == {'student_courses': 1, 'grades': 1, 'assignments': 1}
+    assert hot_count('student_courses') == 1
+    assert hot_count('grades') == 1
+    assert hot_count('assignments') == 0
+    assert (tmp_path / 'term_2023-2024-2.db').exists()
+
+    terms = admin_client.get('/api/archive/terms').json['data']
+    assert [t['term'] for t in terms] == [closed_term]
+
+
+def test_archive_keeps_counters_and_change_log(admin_client, closed_term):
+    conn = sqlite3.connect(DATABASE_PATH)
+    version = conn.execute('SELECT MAX(version) FROM changes').fetchone()[0]
+    admin_client.post('/api/archive/terms', json={'term': closed_term})
+    # 移到归档不是退课：不释放名额，也不产生删除记录
+    assert conn.execute('SELECT enrollment_count, assignment_count FROM courses WHERE id = 1').fetchone() == (1, 1)
+    assert conn.execute('SELECT COUNT(*) FROM changes WHERE version > ?', (version,)).fetchone()[0] == 0
+    assert conn.execute('SELECT archiving FROM terms').fetchone()[0] == 0
+    conn.close()
+
+
+def test_archived_history_is_still_queryable(admin_client, closed_term):
+    admin_client.post('/api/archive/terms', json={'term': closed_term})
+
+    courses = admin_client.get('/api/students/2023001/courses').json['data']
+    assert sorted(c['name'] for c in courses) == sorted(['数据库', '操作系统'])
+
+    students = admin_client.get('/api/courses/1/students').json['data']
+    assert [s['student_id'] for s in students] == ['2023001']
+
+    assignments = admin_client.get('/api/courses/1/assignments').json['data']
+    assert [a['title'] for a in assignments] == ['作业1']
+
+    grades = admin_client.get('/api/course-grades').json['data']
+    by_name = {c['name']: c['students'] for c in grades}
+    assert by_name['数据库'][0]['usual_grade'] == 90
+
+    export = admin_client.get(f'/api/exports/grades?term={closed_term}').data.decode('utf-8-sig')
+    assert '2023001' in export and '77.0' in export
+
+
+def test_history_prefers_hot_rows_over_archive(admin_client, closed_term):
+    admin_client.post('/api/archive/terms', json={'term': closed_term})
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO student_courses VALUES (1, 1)")
+    conn.commit()
+    conn.close()
+    students = admin_client.get('/api/courses/1/students').json['data']
+    assert [s['student_id'] for s in students] == ['2023001']
+
+
+def test_archive_refuses_open_term(admin_client, two_terms):
+    response = admin_client.post('/api/archive/terms', json={'term': '2024-2025-1'})
+    assert response.status_code == 409
+    assert hot_count('student_courses') == 2
+
+
+def test_archive_unknown_term(admin_client, two_terms):
+    assert admin_client.post('/api/archive/terms', json={'term': '大一'}).status_code == 404
+    assert admin_client.post('/api/terms/大一/close').status_code == 404
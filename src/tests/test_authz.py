@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+from mypy.authz import AuthzIndex, authz_index
+from mypy.config import DATABASE_PATH
+from mypy.migrations import migrate
+from mypy.writer import WriteQueue, after_commit
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / 'authz.db')
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("INSERT INTO teachers (id, name, teacher_id) VALUES (1, '王老师', 'T1')")
+    conn.execute("INSERT INTO students (id, name, student_id) VALUES (1, '张三', 'S1')")
+    conn.executemany("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score) "
+                     "VALUES (?, ?, '大一', 3, 20, 30, 50)", [(1, '数据库'), (2, '操作系统')])
+    conn.execute('INSERT INTO teacher_courses VALUES (1, 1)')
+    conn.execute('INSERT INTO student_courses VALUES (1, 2)')
+    conn.commit()
+    conn.close()
+    return AuthzIndex(lambda: sqlite3.connect(path)), path
+
+
+def test_lookups_are_cached_until_invalidated(index):
+    index, path = index
+    assert index.teaches('T1', 1) and not index.teaches('T1', 2)
+    assert index.enrolled('S1', 2) and not index.enrolled('S1', 1)
+    assert not index.teaches(None, 1)
+
+    conn = sqlite3.connect(path)
+    conn.execute('INSERT INTO teacher_courses VALUES (1, 2)')
+    conn.commit()
+    conn.close()
+    assert not index.teaches('T1', 2)  # 仍是缓存的集合
+    index.invalidate_teacher('T1')
+    assert index.teaches('T1', 2)
+    assert index.stats()['loads'] == 3
+
+    index.invalidate_course(2)
+    assert index.stats()['teachers'] == 0 and index.stats()['students'] == 0
+
+
+def test_entries_expire_after_ttl(index):
+    index, path = index
+    index.ttl = 0
+    index.teacher_courses('T1')
+    index.teacher_courses('T1')
+    assert index.stats()['loads'] == 2
+
+
+def test_after_commit_runs_only_for_committed_jobs(tmp_path):
+    path = str(tmp_path / 'writer.db')
+    sqlite3.connect(path).close()
+    queue = WriteQueue(path)
+    calls = []
+
+    def job(name, fail):
+        def fn(conn):
+            after_commit(lambda: calls.append(name))
+            return fail
+        return fn
+
+    try:
+        queue.run(job('ok', False), failed=lambda fail: fail)
+        queue.run(job('failed', True), failed=lambda fail: fail)
+    finally:
+        queue.stop()
+    assert calls == ['ok']
+
+
+def test_course_students_permission_follows_assignment(client):
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO teachers (id, name, teacher_id) VALUES (1, '王老师', 'T1')")
+    conn.execute("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score) "
+                 "VALUES (1, '数据库', '大一', 3, 20, 30, 50)")
+    conn.commit()
+    conn.close()
+
+    with client.session_transaction() as sess:
+        sess.update(username='王老师', role='teacher', teacher_id='T1')
+    assert client.get('/api/courses/1/students').status_code == 403
+
+    client.post('/api/teacher-courses', json={'teacher_id': 'T1', 'course_id': 1})
+    assert client.get('/api/courses/1/students').status_code == 200
+
+    client.delete('/api/courses/1')
+    assert not authz_index.teaches('T1', 1)
@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+
+from mypy.config import DATABASE_PATH
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return client
+
+
+def course(name):
+    return {'name': name, 'learn_time': '大一', 'credit': 2,
+            'usual_score': 10, 'midterm_score': 10, 'final_score': 80}
+
+
+def count_courses():
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM courses').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_batch_returns_per_item_status(admin_client):
+    response = admin_client.post('/api/batch', json={'requests': [
+        {'method': 'POST', 'path': '/api/courses', 'body': course('数据库')},
+        {'method': 'POST', 'path': '/api/courses', 'body': course('数据库')},
+        {'path': '/api/courses'},
+    ]})
+    assert response.status_code == 200
+    statuses = [item['status'] for item in response.json['data']]
+    assert statuses == [200, 400, 200]
+    assert len(response.json['data'][2]['body']['data']) == 1
+    assert count_courses() == 1
+
+
+def test_batch_transaction_rolls_back_on_failure(admin_client):
+    response = admin_client.post('/api/batch', json={'transaction': True, 'requests': [
+        {'method': 'POST', 'path': '/api/courses', 'body': course('数据库')},
+        {'method': 'POST', 'path': '/api/courses', 'body': course('数据库')},
+        {'path': '/api/courses'},
+    ]})
+    assert response.json['success'] is False
+    assert [item['status'] for item in response.json['data']] == [200, 400, 424]
+    assert count_courses() == 0
+
+
+def test_batch_rejects_nested_batch(admin_client):
+    response = admin_client.post('/api/batch', json={'requests': [
+        {'method': 'POST', 'path': '/api/batch', 'body': {}},
+    ]})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('method, path', [
+    ('POST', '/api/batch/'),
+    ('POST', '/api/batch?transaction=1'),
+    ('DELETE', '/api/courses'),
+    ('GET', '/metrics'),
+    ('GET', '/static/app.js'),
+    ('GET', '/api/no-such-route'),
+])
+def test_batch_rejects_invalid_sub_requests(admin_client, method, path):
+    response = admin_client.post('/api/batch', json={'requests': [
+        {'method': method, 'path': path},
+    ]})
+    assert response.status_code == 400
+
+
+def test_failed_sub_request_is_rolled_back_without_transaction(admin_client, app, monkeypatch):
+    from flask import jsonify
+    from mypy.db_operations import get_db_connection
+
+    def commit_then_fail():
+        conn = get_db_connection()
+        conn.execute("INSERT INTO courses (name, learn_time, credit, usual_score, midterm_score, final_score) "
+                     "VALUES ('半途', '大一', 1, 10, 10, 80)")
+        conn.commit()
+        conn.close()
+        return jsonify({'success': False, 'message': '失败'}), 400
+
+    monkeypatch.setitem(app.view_functions, 'add_course', commit_then_fail)
+    response = admin_client.post('/api/batch', json={'requests': [
+        {'method': 'POST', 'path': '/api/courses', 'body': {}},
+        {'path': '/api/courses'},
+    ]})
+    assert [item['status'] for item in response.json['data']] == [400, 200]
+    assert response.json['data'][1]['body']['data'] == []
+    assert count_courses() == 0
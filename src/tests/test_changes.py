@@ -0,0 +1,105 @@
+import sqlite3
+
+import pytest
+
+from mypy.changes import changes_since, current_version, prune_changes
+from mypy.config import DATABASE_PATH
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return client
+
+
+def execute(*statements):
+    conn = sqlite3.connect(DATABASE_PATH)
+    for sql in statements:
+        conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_changes_are_collapsed_per_row():
+    execute("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score) "
+            "VALUES (1, '数据库', '大一', 3, 20, 30, 50)")
+    conn = sqlite3.connect(DATABASE_PATH)
+    base = current_version(conn)
+    execute("INSERT INTO students (id, name, student_id) VALUES (1, '张三', 'S1'), (2, '李四', 'S2')",
+            "UPDATE students SET name = '张三丰' WHERE id = 1",
+            "DELETE FROM students WHERE id = 2",
+            "INSERT INTO student_courses VALUES (1, 1)")
+
+    result = changes_since(conn, base)
+    conn.close()
+    by_key = {(c['table'], tuple(c['key'].values())): c for c in result['changes']}
+    assert by_key[('students', (1,))]['op'] == 'upsert'
+    assert by_key[('students', (1,))]['data']['name'] == '张三丰'
+    assert by_key[('students', (2,))] == {'table': 'students', 'op': 'delete', 'key': {'id': 2}, 'data': None}
+    assert by_key[('student_courses', (1, 1))]['data'] == {'student_id': 1, 'course_id': 1}
+    # 选课触发器只改了课程人数，不记为课程的变更
+    assert ('courses', (1,)) not in by_key
+    assert result['version'] == result['current_version'] > base
+    assert not result['has_more'] and not result['reset']
+
+
+def test_counter_and_version_updates_are_not_logged():
+    execute("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score) "
+            "VALUES (1, '数据库', '大一', 3, 20, 30, 50)",
+            "INSERT INTO students (id, name, student_id) VALUES (1, '张三', 'S1')")
+    conn = sqlite3.connect(DATABASE_PATH)
+    base = current_version(conn)
+    execute("INSERT INTO student_courses VALUES (1, 1)",
+            "UPDATE courses SET credit = 4 WHERE id = 1")
+    rows = conn.execute('SELECT table_name, op FROM changes WHERE version > ? ORDER BY version',
+                        (base,)).fetchall()
+    conn.close()
+    # 编辑学分触发的版本号补加也不再多记一条
+    assert rows == [('student_courses', 'insert'), ('courses', 'update')]
+
+
+def test_paging_and_reset():
+    execute("INSERT INTO teachers (name, teacher_id) VALUES ('王老师', 'T1'), ('赵老师', 'T2'), ('钱老师', 'T3')")
+    conn = sqlite3.connect(DATABASE_PATH)
+    first = changes_since(conn, 0, limit=2, tables=['teachers'])
+    assert first['has_more'] and len(first['changes']) == 2
+    second = changes_since(conn, first['version'], limit=2, tables=['teachers'])
+    assert not second['has_more'] and [c['key'] for c in second['changes']] == [{'id': 3}]
+    assert changes_since(conn, second['version'] + 100)['reset']
+    conn.close()
+
+
+def test_pruned_log_resets_stale_clients(admin_client):
+    execute("INSERT INTO teachers (name, teacher_id) VALUES ('王老师', 'T1'), ('赵老师', 'T2'), ('钱老师', 'T3')")
+    conn = sqlite3.connect(DATABASE_PATH)
+    current = current_version(conn)
+    assert prune_changes(conn, keep_versions=1, keep_days=0) == current - 1
+    conn.commit()
+    assert not changes_since(conn, current - 1)['reset']
+    assert changes_since(conn, current - 2)['reset']
+
+    # 按天数清理掉全部日志后，落后的客户端同样需要重新加载
+    conn.execute("UPDATE changes SET changed_at = datetime('now', '-2 days')")
+    assert prune_changes(conn, keep_versions=0, keep_days=1) == 1
+    conn.commit()
+    conn.close()
+    data = admin_client.get(f'/api/changes?since={current - 1}').json['data']
+    assert data['reset'] and data['version'] == current
+    assert not admin_client.get(f'/api/changes?since={current}').json['data']['reset']
+
+
+def test_changes_endpoint(admin_client):
+    version = admin_client.get('/api/changes').json['data']['version']
+    admin_client.post('/api/teachers', json={'name': '王老师', 'teacher_id': 'T1'})
+    data = admin_client.get(f'/api/changes?since={version}&tables=teachers').json['data']
+    assert [(c['op'], c['data']['teacher_id']) for c in data['changes']] == [('upsert', 'T1')]
+    assert admin_client.get(f"/api/changes?since={data['version']}").json['data']['changes'] == []
+
+
+def test_changes_endpoint_requires_admin(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 's1'
+        sess['role'] = 'student'
+    assert client.get('/api/changes?since=0').status_code == 403
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from mypy.config import DATABASE_PATH
+
+
+@pytest.fixture
+def teacher_client(client):
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO teachers (id, name, teacher_id) VALUES (1, '王老师', 'T1')")
+    conn.executemany("INSERT INTO students (id, name, student_id) VALUES (?, ?, ?)",
+                     [(1, '张三', 'S1'), (2, '李四', 'S2')])
+    conn.executemany("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score) "
+                     "VALUES (?, ?, '大一', 3, 20, 30, 50)", [(1, '数据库'), (2, '操作系统'), (3, '编译原理')])
+    conn.executemany('INSERT INTO teacher_courses VALUES (1, ?)', [(1,), (2,)])
+    conn.executemany('INSERT INTO student_courses VALUES (?, 1)', [(1,), (2,)])
+    conn.execute('INSERT INTO grades (student_id, course_id, usual_grade, midterm_grade, final_grade) '
+                 'VALUES (1, 1, 90, 80, 85)')
+    conn.executemany("INSERT INTO assignments (course_id, title, content, create_time) VALUES (1, ?, '', ?)",
+                     [(f'作业{i}', f'2024-03-0{i} 08:00:00') for i in range(1, 5)])
+    conn.commit()
+    conn.close()
+    with client.session_transaction() as sess:
+        sess.update(username='王老师', role='teacher', teacher_id='T1')
+    return client
+
+
+def test_assignment_count_follows_writes(teacher_client):
+    conn = sqlite3.connect(DATABASE_PATH)
+    count = lambda cid: conn.execute('SELECT assignment_count FROM courses WHERE id = ?', (cid,)).fetchone()[0]
+    assert count(1) == 4
+    conn.execute("UPDATE assignments SET course_id = 2 WHERE title = '作业1'")
+    conn.execute("DELETE FROM assignments WHERE title = '作业2'")
+    assert (count(1), count(2)) == (2, 1)
+    conn.close()
+
+
+def test_dashboard_summarizes_teacher_courses(teacher_client):
+    response = teacher_client.get('/api/teacher/dashboard?recent=2')
+    assert response.status_code == 200
+    courses = {c['name']: c for c in response.json['data']}
+    assert set(courses) == {'数据库', '操作系统'}
+
+    db = courses['数据库']
+    assert (db['enrollment_count'], db['assignment_count'], db['graded_count']) == (2, 4, 1)
+    assert db['grade_completeness'] == 0.5
+    assert [a['title'] for a in db['recent_assignments']] == ['作业4', '作业3']
+
+    empty = courses['操作系统']
+    assert empty['recent_assignments'] == [] and empty['grade_completeness'] is None
+
+
+def test_admin_dashboard_needs_teacher_id(client):
+    with client.session_transaction() as sess:
+        sess.update(username='admin', role='admin')
+    assert client.get('/api/teacher/dashboard').status_code == 404
@@ -0,0 +1,37 @@
+import sqlite3
+
+from benchmarks.dataset import generate
+
+
+def dump(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2').fetchall()
+                for table in ('students', 'courses', 'student_courses', 'grades', 'assignments')]
+    finally:
+        conn.close()
+
+
+def test_generator_is_deterministic_and_consistent(tmp_path):
+    first, second = str(tmp_path / 'a.db'), str(tmp_path / 'b.db')
+    counts = generate(first, students=300, teachers=20, courses=40, seed=7)
+    generate(second, students=300, teachers=20, courses=40, seed=7)
+    assert dump(first) == dump(second)
+
+    conn = sqlite3.connect(first)
+    assert conn.execute('SELECT COUNT(*) FROM student_courses').fetchone()[0] == counts['student_courses']
+    # 计数列与明细一致，且没有超出容量
+    assert conn.execute('''
+        SELECT COUNT(*) FROM courses c
+        WHERE enrollment_count != (SELECT COUNT(*) FROM student_courses sc WHERE sc.course_id = c.id)
+           OR enrollment_count > capacity
+    ''').fetchone()[0] == 0
+    # 触发器已恢复，且导入没有写入变更日志
+    conn.execute('''
+        INSERT INTO student_courses
+        SELECT 1, id FROM courses WHERE capacity IS NULL
+            AND id NOT IN (SELECT course_id FROM student_courses WHERE student_id = 1)
+        LIMIT 1
+    ''')
+    assert conn.execute("SELECT COUNT(*) FROM changes WHERE table_name = 'student_courses'").fetchone()[0] == 1
+    conn.close()
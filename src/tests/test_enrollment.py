@@ -0,0 +1,96 @@
+import sqlite3
+import threading
+
+import pytest
+
+from mypy.config import DATABASE_PATH
+from mypy.enrollment import reserve_seat, EnrollmentError
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def seeded():
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score, times, capacity) "
+                 "VALUES (1, '数据库', '大一', 3, 20, 30, 50, '星期一 08:00-09:40', 2), "
+                 "(2, '操作系统', '大一', 3, 20, 30, 50, '星期一 08:00-09:40', NULL)")
+    conn.executemany("INSERT INTO students (name, student_id) VALUES (?, ?)",
+                     [(f'学生{i}', f'S{i}') for i in range(20)])
+    conn.commit()
+    conn.close()
+
+
+def course_counts(course_id):
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return conn.execute('''
+            SELECT enrollment_count, (SELECT COUNT(*) FROM student_courses WHERE course_id = ?)
+            FROM courses WHERE id = ?
+        ''', (course_id, course_id)).fetchone()
+    finally:
+        conn.close()
+
+
+def enroll(client, student_id, course_id):
+    return client.post('/api/student-courses', json={'student_id': student_id, 'course_id': course_id})
+
+
+def test_capacity_and_conflicts(admin_client, seeded):
+    assert enroll(admin_client, 'S0', 1).status_code == 200
+    assert enroll(admin_client, 'S0', 1).status_code == 400
+    assert enroll(admin_client, 'S1', 1).status_code == 200
+    response = enroll(admin_client, 'S2', 1)
+    assert response.status_code == 409 and response.json['message'] == '课程已满'
+    # 与已选课程同一时间段
+    assert '时间冲突' in enroll(admin_client, 'S0', 2).json['message']
+    assert enroll(admin_client, 'S9', 99).status_code == 404
+    assert course_counts(1) == (2, 2)
+
+    admin_client.delete('/api/student-courses', json={'student_id': 'S0', 'course_id': 1})
+    assert course_counts(1) == (1, 1)
+    assert enroll(admin_client, 'S2', 1).status_code == 200
+
+
+def test_trigger_rejects_overbooking_from_any_path(seeded):
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.executemany('INSERT INTO student_courses VALUES (?, 1)', [(1,), (2,)])
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('INSERT INTO student_courses VALUES (3, 1)')
+    conn.close()
+
+
+def test_concurrent_reservations_do_not_overbook(seeded):
+    errors = []
+
+    def attempt(i):
+        conn = sqlite3.connect(DATABASE_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            reserve_seat(conn, f'S{i}', 1)
+        except EnrollmentError as e:
+            errors.append(e.status)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=attempt, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert course_counts(1) == (2, 2)
+    assert errors == [409] * 18
+
+
+def test_course_capacity_is_editable(admin_client, seeded):
+    response = admin_client.get('/api/courses')
+    course = next(c for c in response.json['data'] if c['id'] == 1)
+    assert course['capacity'] == 2 and course['enrollment_count'] == 0
+    course.update(capacity='')
+    assert admin_client.put('/api/courses/1', json=course).json['data']['capacity'] is None
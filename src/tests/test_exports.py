@@ -0,0 +1,123 @@
+import csv
+import io
+import sqlite3
+import zipfile
+
+import pytest
+
+from mypy.authz import authz_index
+from mypy.config import DATABASE_PATH
+from mypy.resilience import DatabaseBusy
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def gradebook():
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO courses (id, name, learn_time, term, credit, usual_score, midterm_score, final_score) "
+                 "VALUES (1, '数据库', '大二', '2024-2025-1', 3, 20, 30, 50), "
+                 "(2, '操作系统', '大三', '2024-2025-2', 4, 10, 10, 80)")
+    conn.execute("INSERT INTO students (id, name, student_id) VALUES (1, '张三', '2023001'), (2, '李四', '2023002')")
+    conn.execute("INSERT INTO student_courses VALUES (1, 1), (2, 1), (1, 2)")
+    conn.execute("INSERT INTO grades (student_id, course_id, usual_grade, midterm_grade, final_grade) "
+                 "VALUES (1, 1, 90, 80, 70)")
+    conn.commit()
+    conn.close()
+
+
+def read_csv(response):
+    return list(csv.reader(io.StringIO(response.data.decode('utf-8-sig'))))
+
+
+def test_gradebook_csv_has_weighted_totals(admin_client, gradebook):
+    response = admin_client.get('/api/exports/grades?course_id=1')
+    assert response.status_code == 200
+    assert response.is_streamed
+    rows = read_csv(response)
+    assert rows[0][-1] == '总评'
+    assert [r[4] for r in rows[1:]] == ['2023001', '2023002']
+    # 90*20% + 80*30% + 70*50% = 77
+    assert float(rows[1][-1]) == 77
+    # 未录入成绩按0计算
+    assert float(rows[2][-1]) == 0
+
+
+def test_term_filters_exports(admin_client, gradebook):
+    rows = read_csv(admin_client.get('/api/exports/enrollments?term=2024-2025-2'))
+    assert len(rows) == 2 and rows[1][3] == '操作系统'
+    # 学期列是 courses.term，不是年级 learn_time
+    assert rows[1][4] == '2024-2025-2'
+    rows = read_csv(admin_client.get('/api/exports/grades?term=2024-2025-1'))
+    assert [r[2] for r in rows[1:]] == ['2024-2025-1', '2024-2025-1']
+    rows = read_csv(admin_client.get('/api/exports/roster'))
+    assert [r[0] for r in rows[1:]] == ['2023001', '2023002']
+
+
+def test_gradebook_xlsx_is_valid_workbook(admin_client, gradebook):
+    response = admin_client.get('/api/exports/grades?format=xlsx')
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert zf.testzip() is None
+        sheet = zf.read('xl/worksheets/sheet1.xml').decode('utf-8')
+    assert sheet.count('<row>') == 4
+    assert '数据库' in sheet and '<v>77.0</v>' in sheet
+
+
+def test_export_rejects_unknown_kind(admin_client):
+    assert admin_client.get('/api/exports/unknown').status_code == 400
+    assert admin_client.get('/api/exports/grades?format=pdf').status_code == 400
+
+
+def test_csv_stream_is_chunked():
+    from mypy.exports import stream_csv
+    chunks = list(stream_csv(['a'], ([i] for i in range(10)), chunk_size=3))
+    assert len(chunks) == 4
+
+
+def test_teacher_exports_only_own_course(client, gradebook):
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO teachers (id, name, teacher_id) VALUES (1, '王老师', 'T1')")
+    conn.execute("INSERT INTO teacher_courses VALUES (1, 1)")
+    conn.commit()
+    conn.close()
+    authz_index.invalidate_teacher('T1')
+
+    with client.session_transaction() as sess:
+        sess.update(username='王老师', role='teacher', teacher_id='T1')
+    assert client.get('/api/exports/roster').status_code == 400
+    assert client.get('/api/exports/roster?course_id=2').status_code == 403
+    response = client.get('/api/exports/roster?course_id=1')
+    assert response.status_code == 200
+    assert len(read_csv(response)) == 3
+
+
+@pytest.mark.parametrize('error, status', [
+    (sqlite3.OperationalError('unable to open database'), 500),
+    (DatabaseBusy('数据库繁忙'), 503),
+])
+def test_export_setup_failure_closes_connection(admin_client, monkeypatch, error, status):
+    import edu_sys_main
+    import mypy.exports
+    opened = []
+    connect = edu_sys_main.get_analytics_db
+
+    def tracked():
+        conn = connect()
+        opened.append(conn)
+        return conn
+
+    def fail(*args):
+        raise error
+
+    monkeypatch.setattr(edu_sys_main, 'get_analytics_db', tracked)
+    monkeypatch.setattr(mypy.exports, 'history_sources', fail)
+    assert admin_client.get('/api/exports/grades').status_code == status
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute('SELECT 1')
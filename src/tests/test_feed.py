@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+from mypy.config import DATABASE_PATH
+
+
+@pytest.fixture
+def student_client(client):
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.executemany("INSERT INTO students (id, name, student_id) VALUES (?, ?, ?)",
+                     [(1, '张三', 'S1'), (2, '李四', 'S2')])
+    conn.executemany("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score) "
+                     "VALUES (?, ?, '大一', 3, 20, 30, 50)", [(1, '数据库'), (2, '操作系统'), (3, '编译原理')])
+    conn.executemany('INSERT INTO student_courses VALUES (1, ?)', [(1,), (2,)])
+    # 同一时间发布的作业按 id 倒序，分页边界上不能重复或遗漏
+    conn.executemany("INSERT INTO assignments (id, course_id, title, content, create_time) VALUES (?, ?, ?, '', ?)",
+                     [(1, 1, '作业1', '2024-03-01 08:00:00'), (2, 2, '作业2', '2024-03-02 08:00:00'),
+                      (3, 1, '作业3', '2024-03-02 08:00:00'), (4, 3, '作业4', '2024-03-03 08:00:00'),
+                      (5, 2, '作业5', '2024-03-04 08:00:00')])
+    conn.commit()
+    conn.close()
+    with client.session_transaction() as sess:
+        sess.update(username='张三', role='student', student_id='S1')
+    return client
+
+
+def test_feed_pages_through_enrolled_courses(student_client):
+    titles, cursor = [], None
+    while True:
+        url = '/api/students/S1/assignment-feed?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        page = student_client.get(url).json['data']
+        titles.extend(a['title'] for a in page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert titles == ['作业5', '作业3', '作业2', '作业1']
+
+
+def test_feed_rejects_other_students_and_bad_cursor(student_client):
+    assert student_client.get('/api/students/S2/assignment-feed').status_code == 403
+    assert student_client.get('/api/students/S1/assignment-feed?cursor=xyz').status_code == 400
+
+
+def test_feed_query_uses_course_time_index(student_client):
+    conn = sqlite3.connect(DATABASE_PATH)
+    plan = ' '.join(row[3] for row in conn.execute(
+        'EXPLAIN QUERY PLAN SELECT id FROM assignments WHERE course_id = ? ORDER BY create_time DESC', (1,)))
+    conn.close()
+    assert 'idx_assignments_course_time' in plan
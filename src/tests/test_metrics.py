@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from mypy.metrics import Metrics, render, statement_kind
+
+
+def sample(text, line_prefix):
+    """返回以 line_prefix 开头的指标行的数值"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def test_statement_kind():
+    assert statement_kind('  select * from courses') == 'SELECT'
+    assert statement_kind('INSERT INTO t VALUES (1)') == 'INSERT'
+    assert statement_kind('VACUUM') == 'OTHER'
+
+
+def test_render_histogram_is_cumulative():
+    m = Metrics(directory='unused')
+    m.observe('edu_db_statement_duration_seconds', 0.0002, (('kind', 'SELECT'),))
+    m.observe('edu_db_statement_duration_seconds', 0.003, (('kind', 'SELECT'),))
+    text = render(*m.local_snapshot())
+    assert '# TYPE edu_db_statement_duration_seconds histogram' in text
+    prefix = 'edu_db_statement_duration_seconds_bucket{kind="SELECT",'
+    assert sample(text, prefix + 'le="0.0001"}') == 0
+    assert sample(text, prefix + 'le="0.0005"}') == 1
+    assert sample(text, prefix + 'le="+Inf"}') == 2
+    assert sample(text, 'edu_db_statement_duration_seconds_count{kind="SELECT"}') == 2
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess.update(username='admin', role='admin', admin_id='A1')
+    return client
+
+
+def test_endpoint_reports_requests_and_db(admin_client):
+    client = admin_client
+    with client.session_transaction() as sess:
+        sess.clear()
+    client.get('/api/current-user')
+    client.get('/no-such-page')
+    with client.session_transaction() as sess:
+        sess.update(username='admin', role='admin', admin_id='A1')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert sample(text, 'edu_http_responses_total{method="GET",route="/api/current-user",status="401"}') >= 1
+    assert sample(text, 'edu_http_responses_total{method="GET",route="<unmatched>",status="404"}') >= 1
+    assert 'edu_http_request_duration_seconds_bucket{method="GET",route="/api/current-user",le="+Inf"}' in text
+    assert 'edu_query_cache_hit_ratio' in text
+    assert sample(text, 'edu_sqlite_file_bytes{file="db"}') > 0
+    assert sample(text, 'edu_metrics_processes') >= 1
+
+
+def test_endpoint_requires_token_when_configured(client, monkeypatch):
+    import edu_sys_main
+    monkeypatch.setattr(edu_sys_main, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+
+
+def test_endpoint_requires_admin_without_token(client, monkeypatch):
+    import edu_sys_main
+    assert client.get('/metrics').status_code == 403
+    with client.session_transaction() as sess:
+        sess.update(username='张三', role='student', student_id='S1')
+    assert client.get('/metrics').status_code == 403
+    monkeypatch.setattr(edu_sys_main, 'METRICS_PUBLIC', True)
+    assert client.get('/metrics').status_code == 200
+
+
+def test_metrics_files_only_written_when_shared(tmp_path):
+    local = Metrics(directory=str(tmp_path / 'local'))
+    local.add('edu_db_connections_opened_total', 1)
+    local.flush()
+    local.start()
+    values, _, processes = local.collect()
+    assert values[('edu_db_connections_opened_total', ())] == 1 and processes == 1
+    assert not (tmp_path / 'local').exists()
+
+    shared = Metrics(directory=str(tmp_path / 'shared'), shared=True)
+    shared.flush()
+    assert os.listdir(tmp_path / 'shared') == [f'{os.getpid()}.json']
+
+
+def test_exited_processes_are_retired_once(tmp_path):
+    m = Metrics(directory=str(tmp_path), shared=True)
+    pid = dead_pid()
+    (tmp_path / f'{pid}.json').write_text(json.dumps({
+        'values': [['edu_db_connections_opened_total', [], 5], ['edu_db_connections_open', [], 2]],
+        'histograms': [],
+    }))
+    m.add('edu_db_connections_opened_total', 1)
+    for _ in range(2):
+        values, _, processes = m.collect()
+        assert values[('edu_db_connections_opened_total', ())] == 6
+        # 已退出进程的仪表不计入
+        assert ('edu_db_connections_open', ()) not in values
+        assert processes == 1
+    assert sorted(os.listdir(tmp_path)) == sorted(['.lock', f'{os.getpid()}.json', 'retired.json'])
@@ -0,0 +1,102 @@
+import pstats
+
+import pytest
+
+from mypy.config import PROFILE_TOKEN_MAX_TTL
+from mypy.profiling import _signature, make_token, profiler, token_subject, verify_token
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, 'directory', str(tmp_path / 'profiles'))
+    monkeypatch.setattr(profiler, 'sample_rate', 0)
+    return tmp_path / 'profiles'
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess.update(username='admin', role='admin', admin_id='A1')
+    return client
+
+
+def test_token_signature_and_expiry():
+    subject = token_subject('student', '张三')
+    token = make_token('cpu', 60, subject, 'secret', now=1000)
+    assert verify_token(token, subject, 'secret', now=1030) == 'cpu'
+    assert verify_token(token, subject, 'secret', now=1061) is None
+    assert verify_token(token, subject, 'other', now=1030) is None
+    assert verify_token(token, token_subject('student', '李四'), 'secret', now=1030) is None
+    assert verify_token(token.replace('cpu', 'mem', 1), subject, 'secret', now=1030) is None
+    assert verify_token('garbage', subject, 'secret') is None
+    with pytest.raises(ValueError):
+        make_token('mem', 60, subject, 'secret')
+
+
+def test_token_lifetime_is_capped():
+    subject = token_subject('student', '张三')
+    token = make_token('cpu', 86400, subject, 'secret', now=1000)
+    assert verify_token(token, subject, 'secret', now=1000 + PROFILE_TOKEN_MAX_TTL + 1) is None
+    # 按旧上限签发的长期令牌也不接受
+    expires = 1000 + 86400
+    signature = _signature('cpu', expires, subject, 'secret')
+    assert verify_token(f'cpu:{expires}:{signature}', subject, 'secret', now=1000) is None
+
+
+def test_admin_query_flag_profiles_request(admin_client, profile_dir):
+    response = admin_client.get('/api/current-user?_profile=mem')
+    run_id = response.headers['X-Profile-Id']
+    stats = pstats.Stats(str(profile_dir / f'{run_id}.prof'))
+    assert stats.total_calls > 0
+
+    runs = admin_client.get('/api/profiling/runs').get_json()['data']['runs']
+    assert [run['id'] for run in runs] == [run_id]
+    assert runs[0]['route'] == '/api/current-user'
+    assert runs[0]['trigger'] == 'query' and runs[0]['top_functions']
+    assert admin_client.get(f'/api/profiling/runs/{run_id}/mem').status_code == 200
+    assert admin_client.get('/api/profiling/runs/../secret/prof').status_code == 404
+
+
+def test_query_flag_ignored_for_other_users(client):
+    with client.session_transaction() as sess:
+        sess.update(username='张三', role='student', student_id='S1')
+    assert 'X-Profile-Id' not in client.get('/api/current-user?_profile=cpu').headers
+
+
+def test_signed_header_profiles_only_bound_user(admin_client, client):
+    response = admin_client.post('/api/profiling/token',
+                                 json={'username': '张三', 'role': 'student', 'ttl': 86400})
+    data = response.get_json()['data']
+    assert data['ttl'] == PROFILE_TOKEN_MAX_TTL
+    headers = {data['header']: data['value']}
+    with client.session_transaction() as sess:
+        sess.clear()
+        sess.update(username='张三', role='student', student_id='S1')
+    assert 'X-Profile-Id' in client.get('/api/current-user', headers=headers).headers
+    response = client.get('/api/current-user', headers={data['header']: data['value'][:-1] + 'x'})
+    assert 'X-Profile-Id' not in response.headers
+
+    with client.session_transaction() as sess:
+        sess.clear()
+        sess.update(username='李四', role='student', student_id='S2')
+    assert 'X-Profile-Id' not in client.get('/api/current-user', headers=headers).headers
+    with client.session_transaction() as sess:
+        sess.clear()
+    assert 'X-Profile-Id' not in client.get('/api/current-user', headers=headers).headers
+
+
+def test_token_route_rejects_mem_and_unbound_tokens(admin_client):
+    response = admin_client.post('/api/profiling/token',
+                                 json={'mode': 'mem', 'username': '张三', 'role': 'student'})
+    assert response.status_code == 400
+    assert admin_client.post('/api/profiling/token', json={'mode': 'cpu'}).status_code == 400
+
+
+def test_sampling_and_rotation(admin_client, monkeypatch):
+    monkeypatch.setattr(profiler, 'sample_rate', 1)
+    monkeypatch.setattr(profiler, 'keep', 2)
+    ids = [admin_client.get('/api/current-user').headers['X-Profile-Id'] for _ in range(3)]
+    monkeypatch.setattr(profiler, 'sample_rate', 0)
+    runs = admin_client.get('/api/profiling/runs').get_json()['data']['runs']
+    assert [run['id'] for run in runs] == ids[:0:-1]
+    assert all(run['trigger'] == 'sample' for run in runs)
@@ -0,0 +1,113 @@
+import sqlite3
+
+import pytest
+
+from mypy import db_operations
+from mypy.config import DATABASE_PATH
+from mypy.query_cache import QueryCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(db_operations.query_cache, 'enabled', True)
+    db_operations.query_cache.clear()
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO teachers (name, teacher_id) VALUES ('张三', 'T1')")
+    conn.commit()
+    conn.close()
+    yield db_operations.query_cache
+    db_operations.query_cache.clear()
+
+
+def test_repeated_reads_hit_cache(cache):
+    before = cache.stats()
+    first = db_operations.get_records('teachers')
+    second = db_operations.execute_query('SELECT  *  FROM teachers')
+    assert first == second
+    assert first is not second
+    stats = cache.stats()
+    assert stats['misses'] == before['misses'] + 1
+    assert stats['hits'] == before['hits'] + 1
+
+
+def test_hit_returns_independent_list(cache):
+    first = db_operations.get_records('teachers')
+    first.clear()
+    assert len(db_operations.get_records('teachers')) == 1
+
+
+def test_bypass_flag_skips_cache(cache):
+    db_operations.get_records('teachers')
+    hits = cache.stats()['hits']
+    db_operations.get_records('teachers', use_cache=False)
+    assert cache.stats()['hits'] == hits
+
+
+def test_writes_invalidate_table(cache):
+    assert len(db_operations.get_records('teachers')) == 1
+    db_operations.add_record('teachers', {'name': '李四', 'teacher_id': 'T2'})
+    assert len(db_operations.get_records('teachers')) == 2
+    db_operations.update_record('teachers', {'name': '王五'}, {'teacher_id': 'T2'})
+    assert db_operations.get_records('teachers', {'teacher_id': 'T2'})[0]['name'] == '王五'
+    db_operations.delete_record('teachers', {'teacher_id': 'T2'})
+    assert len(db_operations.get_records('teachers')) == 1
+
+
+def test_raw_cursor_commit_invalidates(cache):
+    db_operations.get_records('teachers')
+    conn = db_operations.get_db_connection()
+    conn.execute("INSERT INTO teachers (name, teacher_id) VALUES ('赵六', 'T3')")
+    conn.commit()
+    conn.close()
+    assert len(db_operations.get_records('teachers')) == 2
+
+
+def test_long_lived_connection_invalidates_only_current_writes(cache):
+    conn = db_operations.get_db_connection()
+    insert_teacher = "INSERT INTO teachers (name, teacher_id) VALUES (?, ?)"
+    conn.execute(insert_teacher, ('赵六', 'T3'))
+    conn.commit()
+    db_operations.get_records('teachers')
+    conn.execute("INSERT INTO students (name, student_id) VALUES ('钱七', 'S9')")
+    conn.commit()
+    hits = cache.stats()['hits']
+    db_operations.get_records('teachers')
+    assert cache.stats()['hits'] == hits + 1
+
+    # 回滚的写入不再使缓存失效
+    conn.execute(insert_teacher, ('孙八', 'T4'))
+    conn.rollback()
+    conn.execute("INSERT INTO students (name, student_id) VALUES ('周九', 'S10')")
+    conn.commit()
+    db_operations.get_records('teachers')
+    assert cache.stats()['hits'] == hits + 2
+
+    # 被语句缓存复用的写语句仍然使缓存失效
+    conn.execute(insert_teacher, ('吴十', 'T5'))
+    conn.commit()
+    conn.close()
+    assert len(db_operations.get_records('teachers')) == 3
+
+
+def test_lru_eviction_and_memory_cap():
+    cache = QueryCache(max_entries=2, enabled=True)
+    for i in range(3):
+        key = cache.make_key('SELECT ?', (i,), True)
+        cache.put(key, {'t'}, [(i,)], cache.generation({'t'}))
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['evictions'] == 1
+    assert cache.get(cache.make_key('SELECT ?', (0,), True)) == (False, None)
+
+    small = QueryCache(max_bytes=10, enabled=True)
+    key = small.make_key('SELECT 1', (), True)
+    small.put(key, {'t'}, [('x' * 100,)], small.generation({'t'}))
+    assert small.stats()['entries'] == 0
+
+
+def test_stale_result_not_stored_after_invalidation():
+    cache = QueryCache(enabled=True)
+    key = cache.make_key('SELECT * FROM t', (), True)
+    token = cache.generation({'t'})
+    cache.invalidate('t')
+    cache.put(key, {'t'}, [], token)
+    assert cache.get(key) == (False, None)
@@ -0,0 +1,72 @@
+import glob
+import os
+import sqlite3
+
+import pytest
+
+from benchmarks.dataset import PASSWORD
+from benchmarks.load_test import serve
+from benchmarks.replay import replay
+from mypy.config import DATABASE_PATH
+from mypy.recorder import read_records, recorder, sanitize
+
+
+@pytest.fixture
+def recording(tmp_path, monkeypatch):
+    monkeypatch.setattr(recorder, 'enabled', True)
+    monkeypatch.setattr(recorder, 'directory', str(tmp_path))
+    monkeypatch.setattr(recorder, '_path', None)
+    yield lambda: (recorder.flush(), read_records(glob.glob(os.path.join(str(tmp_path), '*.jsonl.gz'))))[1]
+
+
+@pytest.fixture
+def student(client):
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO users (username, password, role) VALUES ('张三', 'secret', 'student')")
+    conn.execute("INSERT INTO students (id, name, student_id) VALUES (1, '张三', 'S1')")
+    conn.commit()
+    conn.close()
+    with client.session_transaction() as sess:
+        sess.update(username='张三', role='student', student_id='S1')
+    return client
+
+
+def test_sanitize_masks_secrets():
+    body = {'name': 'a', 'password': 'x', 'items': [{'api_token': 'y', 'n': 1}]}
+    assert sanitize(body) == {'name': 'a', 'password': '***', 'items': [{'api_token': '***', 'n': 1}]}
+
+
+def test_records_api_requests_without_batch_items(student, recording):
+    student.get('/api/students/S1/courses?page=1')
+    student.post('/api/batch', json={'requests': [{'method': 'GET', 'path': '/api/current-user'}],
+                                     'password': 'x'})
+    student.get('/')
+    records = recording()
+    assert [(r[1], r[2], r[3], r[4], r[5], r[7]) for r in records] == [
+        ('GET', '/api/students/<student_id>/courses', '/api/students/S1/courses?page=1', 'student', 'S1', 200),
+        ('POST', '/api/batch', '/api/batch', 'student', 'S1', 200),
+    ]
+    assert records[1][6]['password'] == '***'
+    assert records[0][0] <= records[1][0]
+
+
+def test_replay_logs_in_and_reproduces_statuses(student, recording):
+    student.get('/api/students/S1/courses')
+    student.get('/api/students/S1/assignment-feed?cursor=bad')
+    records = recording()
+    # 回放工具在数据库副本上统一设置密码，这里直接修改测试库
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute('UPDATE users SET password = ?', (PASSWORD,))
+    conn.commit()
+    conn.close()
+    from edu_sys_main import app
+    server = serve(app)
+    try:
+        samples, skipped, _ = replay(f'http://127.0.0.1:{server.server_port}', records,
+                                     {('student', 'S1'): '张三'}, speed=0, workers=2)
+    finally:
+        server.shutdown()
+    assert skipped == 0
+    statuses = {name: [(status, recorded) for _, status, recorded in values] for name, values in samples.items()}
+    assert statuses == {'GET /api/students/<student_id>/courses': [(200, 200)],
+                        'GET /api/students/<student_id>/assignment-feed': [(400, 400)]}
@@ -0,0 +1,178 @@
+import sqlite3
+import threading
+
+import pytest
+
+from mypy.db_operations import Connection
+from mypy.resilience import (
+    DatabaseBusy, QueryTimeout, backoff_delay, db_metrics, is_busy_error, retry_busy, take_unavailable
+)
+from mypy.writer import WriteQueue
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    db_metrics.reset()
+    yield
+    db_metrics.reset()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'busy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (name TEXT)')
+    conn.close()
+    return path
+
+
+def connect(path, **kwargs):
+    return sqlite3.connect(path, factory=Connection, timeout=0, **kwargs)
+
+
+def hold_write_lock(path, seconds):
+    """另一个连接持有写锁seconds秒"""
+    holder = sqlite3.connect(path, check_same_thread=False)
+    holder.execute('BEGIN IMMEDIATE')
+    timer = threading.Timer(seconds, holder.rollback)
+    timer.start()
+    return holder, timer
+
+
+def test_backoff_grows_with_jitter_and_is_capped():
+    for attempt in range(8):
+        delay = backoff_delay(attempt, base=0.01, max_delay=0.1)
+        full = min(0.1, 0.01 * 2 ** attempt)
+        assert full / 2 <= delay <= full
+
+
+def test_retry_busy_recovers_and_counts():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        return 'ok'
+
+    assert retry_busy(flaky, 'test') == 'ok'
+    assert db_metrics.count('busy_retry', 'test') == 2
+    assert db_metrics.count('busy_recovered', 'test') == 1
+
+
+def test_retry_busy_ignores_other_errors():
+    def broken():
+        raise sqlite3.OperationalError('no such table: nothing')
+
+    with pytest.raises(sqlite3.OperationalError) as info:
+        retry_busy(broken, 'test')
+    assert not is_busy_error(info.value)
+    assert db_metrics.count('busy_retry') == 0
+
+
+def test_statement_waits_for_lock_release(db_path):
+    holder, timer = hold_write_lock(db_path, 0.05)
+    conn = connect(db_path)
+    try:
+        conn.execute("INSERT INTO items VALUES ('a')")
+        conn.commit()
+        assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 1
+    finally:
+        timer.join()
+        conn.close()
+        holder.close()
+    assert db_metrics.count('busy_retry', 'statement') >= 1
+    assert db_metrics.count('busy_recovered', 'statement') == 1
+
+
+def test_busy_failure_after_retries(db_path):
+    holder, timer = hold_write_lock(db_path, 5)
+    conn = connect(db_path)
+    try:
+        with pytest.raises(DatabaseBusy):
+            conn.execute("INSERT INTO items VALUES ('a')")
+        assert not conn.in_transaction
+    finally:
+        timer.cancel()
+        holder.rollback()
+        holder.close()
+        conn.close()
+    assert db_metrics.count('busy_failure', 'statement') == 1
+
+
+def test_statement_inside_transaction_is_not_retried(db_path):
+    conn = connect(db_path)
+    conn.execute('BEGIN')
+    conn.execute('SELECT COUNT(*) FROM items').fetchone()
+    holder, timer = hold_write_lock(db_path, 5)
+    try:
+        with pytest.raises(sqlite3.OperationalError) as info:
+            conn.execute("INSERT INTO items VALUES ('a')")
+        assert not isinstance(info.value, DatabaseBusy)
+    finally:
+        timer.cancel()
+        holder.rollback()
+        holder.close()
+        conn.close()
+    assert db_metrics.count('busy_retry') == 0
+
+
+def test_statement_budget_interrupts_runaway_query(db_path):
+    conn = connect(db_path)
+    conn.statement_budget = 0.05
+    try:
+        with pytest.raises(QueryTimeout):
+            conn.execute('''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n)
+                SELECT COUNT(*) FROM n
+            ''').fetchone()
+        # 超时不影响连接后续使用
+        assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+    finally:
+        conn.close()
+    assert db_metrics.count('timeout', 'statement') == 1
+
+
+def test_writer_retries_begin_while_locked(db_path):
+    queue = WriteQueue(db_path, timeout=0)
+    holder, timer = hold_write_lock(db_path, 0.05)
+    try:
+        assert queue.run(lambda conn: conn.execute("INSERT INTO items VALUES ('w')").rowcount) == 1
+    finally:
+        timer.join()
+        holder.close()
+        queue.stop()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT name FROM items').fetchall() == [('w',)]
+    conn.close()
+
+
+def test_writer_busy_failure_is_noted_on_caller_thread(db_path):
+    queue = WriteQueue(db_path, timeout=0)
+    holder, timer = hold_write_lock(db_path, 5)
+    take_unavailable()
+    try:
+        with pytest.raises(DatabaseBusy):
+            queue.run(lambda conn: conn.execute("INSERT INTO items VALUES ('w')"))
+        # 路由吞掉异常后，请求钩子据此返回503
+        assert isinstance(take_unavailable(), DatabaseBusy)
+        assert take_unavailable() is None
+    finally:
+        timer.cancel()
+        holder.rollback()
+        holder.close()
+        queue.stop()
+
+
+@pytest.mark.parametrize('path', ['/api/courses', '/api/course-grades'])
+def test_read_route_returns_503_on_timeout(client, monkeypatch, path):
+    import mypy.db_operations
+    monkeypatch.setattr(mypy.db_operations, 'DB_PROGRESS_STEPS', 1)
+    monkeypatch.setattr(Connection, 'statement_budget', 1e-9)
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    response = client.get(path)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert db_metrics.count('timeout') >= 1
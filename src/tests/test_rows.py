@@ -0,0 +1,35 @@
+import json
+import sqlite3
+
+from mypy.rows import row_type, use_typed_rows
+
+
+def test_row_type_matches_dict_row():
+    conn = sqlite3.connect(':memory:')
+    cursor = use_typed_rows(conn.cursor(), 'TestRow')
+    cursor.execute("SELECT 1 AS id, '数据库' AS name, 2 AS id, 'x' AS keys, 3 AS \"count(*)\"")
+    row = cursor.fetchone()
+    assert row.id == 1 and row['name'] == '数据库' and row[1] == '数据库'
+    # 重名列保留第一个，与 dict(sqlite3.Row) 一致
+    assert dict(row) == {'id': 1, 'name': '数据库', 'keys': 'x', 'count(*)': 3}
+    assert row['keys'] == 'x'
+    assert not hasattr(row, '__dict__')
+    conn.close()
+
+
+def test_row_type_is_cached_per_columns():
+    assert row_type(['id', 'name'], 'A') is row_type(('id', 'name'), 'A')
+    assert row_type(['id', 'name'], 'A') is not row_type(['id'], 'A')
+
+
+def test_students_endpoint_serializes_typed_rows(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    client.post('/api/students', json={'name': '张三', 'student_id': '2023001'})
+    response = client.get('/api/students')
+    assert response.status_code == 200
+    students = json.loads(response.data)['data']
+    assert len(students) == 1
+    assert students[0]['name'] == '张三'
+    assert students[0]['student_id'] == '2023001'
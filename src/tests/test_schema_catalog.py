@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+from mypy import db_operations
+from mypy.config import DATABASE_PATH
+
+
+def test_catalog_loaded_once_for_many_inserts():
+    catalog = db_operations.schema_catalog
+    catalog.invalidate()
+    loads = catalog.loads
+    for i in range(20):
+        db_operations.add_record('teachers', {'name': f'教师{i}', 'teacher_id': f'T{i}'})
+    assert catalog.loads == loads + 1
+    assert len(db_operations.get_records('teachers')) == 20
+
+
+def test_required_fields_and_unknown_columns():
+    with pytest.raises(ValueError, match='缺少必要字段'):
+        db_operations.add_record('courses', {'name': '数据库'})
+    with pytest.raises(ValueError, match='不存在字段'):
+        db_operations.add_record('teachers', {'name': '张三', 'teacher_id': 'T1', 'age': 30})
+    with pytest.raises(ValueError, match='不存在字段'):
+        db_operations.update_record('teachers', {'age': 30}, {'teacher_id': 'T1'})
+    with pytest.raises(ValueError, match='不存在字段'):
+        db_operations.get_records('teachers', {'age': 30})
+    with pytest.raises(ValueError, match='表不存在'):
+        db_operations.get_records('nonexistent')
+
+
+def test_student_enrollment_year_default():
+    new_id = db_operations.add_record('students', {'name': '张三', 'student_id': 'S1'})
+    assert db_operations.get_records('students', {'id': new_id})[0]['student_id'] == 'S1'
+
+
+def test_schema_change_reloads_catalog():
+    db_operations.add_record('teachers', {'name': '张三', 'teacher_id': 'T1'})
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute('ALTER TABLE teachers ADD COLUMN title TEXT')
+    conn.close()
+    db_operations.add_record('teachers', {'name': '李四', 'teacher_id': 'T2', 'title': '教授'})
+    assert db_operations.get_records('teachers', {'title': '教授'})[0]['name'] == '李四'
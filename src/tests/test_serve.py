@@ -0,0 +1,77 @@
+import os
+import socket
+import threading
+import urllib.request
+
+import pytest
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='serve.py 只支持类 Unix 系统')
+
+from serve import PooledWSGIServer
+
+
+def hello(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'ok']
+
+
+@pytest.fixture
+def listener():
+    sock = socket.create_server(('127.0.0.1', 0))
+    yield sock
+    sock.close()
+
+
+def start(server):
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    return thread
+
+
+def get(server):
+    port = server.socket.getsockname()[1]
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5) as response:
+        return response.read()
+
+
+def test_max_requests_stops_serve_forever(listener):
+    server = PooledWSGIServer('127.0.0.1', listener.fileno(), hello, threads=2, max_requests=3)
+    thread = start(server)
+    try:
+        assert [get(server) for _ in range(3)] == [b'ok'] * 3
+        thread.join(5)
+        assert not thread.is_alive()
+        assert server.handled == 3
+    finally:
+        server.pool.shutdown(wait=True)
+        server.server_close()
+
+
+def test_slots_released_when_finish_request_raises(listener, monkeypatch):
+    server = PooledWSGIServer('127.0.0.1', listener.fileno(), hello, threads=2)
+    failures = []
+
+    def broken(request, client_address):
+        failures.append(client_address)
+        raise RuntimeError('处理失败')
+
+    monkeypatch.setattr(server, 'finish_request', broken)
+    monkeypatch.setattr(server, 'handle_error', lambda request, client_address: None)
+    thread = start(server)
+    try:
+        # 比线程数多的失败请求：槽位没有释放的话后面的连接不会被接受
+        for _ in range(5):
+            with socket.create_connection(server.socket.getsockname(), timeout=5) as conn:
+                assert conn.recv(1) == b''
+        monkeypatch.undo()
+        assert get(server) == b'ok'
+        assert len(failures) == 5
+    finally:
+        server.stop()
+        thread.join(5)
+        server.pool.shutdown(wait=True)
+        server.server_close()
+    # 所有槽位都已归还
+    for _ in range(2):
+        assert server._slots.acquire(blocking=False)
+    assert not server._slots.acquire(blocking=False)
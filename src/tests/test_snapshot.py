@@ -0,0 +1,83 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from mypy.config import DATABASE_PATH
+from mypy.snapshot import SnapshotManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return SnapshotManager(DATABASE_PATH, str(tmp_path / 'snapshot.db'), max_age=60, pages_per_step=1)
+
+
+def add_course(name):
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO courses (name, learn_time, credit, usual_score, midterm_score, final_score) "
+                 "VALUES (?, '大一', 2, 10, 10, 80)", (name,))
+    conn.commit()
+    conn.close()
+
+
+def count_courses(conn):
+    return conn.execute('SELECT COUNT(*) FROM courses').fetchone()[0]
+
+
+def test_snapshot_is_read_only_copy(manager):
+    add_course('数据库')
+    conn = manager.connect()
+    assert count_courses(conn) == 1
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute('DELETE FROM courses')
+    conn.close()
+    assert manager.refreshes == 1 and manager.last_pages > 1
+
+
+def test_snapshot_refreshes_only_when_stale(manager):
+    conn = manager.connect()
+    conn.close()
+    add_course('数据库')
+    conn = manager.connect()
+    assert count_courses(conn) == 0  # 未超过陈旧上限，继续使用旧快照
+    conn.close()
+
+    expired = time.time() - 61
+    os.utime(manager.snapshot_path, (expired, expired))
+    conn = manager.connect()
+    assert count_courses(conn) == 1
+    conn.close()
+    assert manager.refreshes == 2
+
+
+def test_snapshot_age_is_shared_between_processes(manager):
+    # 另一个进程的管理器使用同一个快照文件，看到已刷新的快照时不再复制
+    other = SnapshotManager(DATABASE_PATH, manager.snapshot_path, max_age=60, pages_per_step=1)
+    manager.connect().close()
+    other.connect().close()
+    assert other.refreshes == 0 and other.age() is not None
+    assert not other.refresh(max_age=60)
+    assert not any(name.endswith('.tmp') for name in os.listdir(os.path.dirname(manager.snapshot_path)))
+
+
+def test_snapshot_status_endpoint(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    response = client.get('/api/snapshot')
+    assert response.status_code == 200
+    assert 'age_seconds' in response.json['data']
+
+
+def test_reports_read_snapshot_when_enabled(client, monkeypatch, tmp_path):
+    from mypy.snapshot import snapshot_manager
+    monkeypatch.setattr(snapshot_manager, 'enabled', True)
+    monkeypatch.setattr(snapshot_manager, 'snapshot_path', str(tmp_path / 'snapshot.db'))
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    add_course('数据库')
+    response = client.get('/api/course-grades')
+    assert [c['name'] for c in response.json['data']] == ['数据库']
+    assert snapshot_manager.status()['age_seconds'] is not None
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+from mypy.config import DATABASE_PATH
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def course():
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score, times) "
+                 "VALUES (1, '数据库', '大一', 3, 20, 30, 50, '星期一 08:00-09:40')")
+    conn.execute("INSERT INTO students (id, name, student_id) VALUES (1, '张三', 'S1')")
+    conn.commit()
+    conn.close()
+
+
+def course_data(name):
+    return {'name': name, 'learn_time': '大一', 'credit': 3, 'usual_score': 20,
+            'midterm_score': 30, 'final_score': 50, 'times': '星期一 08:00-09:40'}
+
+
+def version_of(table, row_id):
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return conn.execute(f'SELECT version FROM {table} WHERE id = ?', (row_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_conditional_course_update(admin_client, course):
+    response = admin_client.put('/api/courses/1', json=course_data('数据库系统'),
+                                headers={'If-Match': '"courses-1-v1"'})
+    assert response.status_code == 200
+    assert response.json['data']['version'] == 2
+    assert response.headers['ETag'] == '"courses-1-v2"'
+
+    # 另一个编辑者仍持有旧版本
+    stale = admin_client.put('/api/courses/1', json=course_data('数据库原理'),
+                             headers={'If-Match': '"courses-1-v1"'})
+    assert stale.status_code == 412
+    assert version_of('courses', 1) == 2
+
+    # 不带If-Match时照常更新
+    assert admin_client.put('/api/courses/1', json=course_data('数据库原理')).status_code == 200
+    assert admin_client.put('/api/courses/9', json=course_data('不存在')).status_code == 404
+
+
+def test_profile_etag_round_trip(client, course):
+    with client.session_transaction() as sess:
+        sess['username'] = '张三'
+        sess['role'] = 'student'
+        sess['student_id'] = 'S1'
+    etag = client.get('/api/students/S1/profile').headers['ETag']
+    assert etag == '"students-1-v1"'
+
+    update = {'name': '张三', 'student_id': 'S1', 'enrollment_year': 2024}
+    response = client.put('/api/students/S1/profile', json=update, headers={'If-Match': etag})
+    assert response.status_code == 200
+    assert response.json['data']['enrollment_year'] == 2024
+    assert client.put('/api/students/S1/profile', json=update,
+                      headers={'If-Match': etag}).status_code == 412
+
+
+def test_other_write_paths_bump_version(course):
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("UPDATE students SET name = '张三丰' WHERE id = 1")
+    conn.execute('INSERT INTO student_courses VALUES (1, 1)')
+    conn.commit()
+    conn.close()
+    assert version_of('students', 1) == 2
+    # 选课人数由触发器维护，不算编辑
+    assert version_of('courses', 1) == 1
@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from mypy.config import DATABASE_PATH
+from mypy.waitlist import waitlist_worker
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+        sess['role'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def full_course():
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO courses (id, name, learn_time, credit, usual_score, midterm_score, final_score, times, capacity) "
+                 "VALUES (1, '数据库', '大一', 3, 20, 30, 50, '星期一 08:00-09:40', 1), "
+                 "(2, '操作系统', '大一', 3, 20, 30, 50, '星期一 08:00-09:40', NULL)")
+    conn.executemany("INSERT INTO students (id, name, student_id) VALUES (?, ?, ?)",
+                     [(i, f'学生{i}', f'S{i}') for i in range(1, 5)])
+    conn.execute("INSERT INTO student_courses VALUES (1, 1)")
+    conn.commit()
+    conn.close()
+
+
+def join(client, student_id):
+    return client.post('/api/waitlist', json={'student_id': student_id, 'course_id': 1})
+
+
+def position(client, student_id):
+    return client.get(f'/api/waitlist/1/position?student_id={student_id}').json['data']
+
+
+def test_waitlist_positions_are_fifo(admin_client, full_course):
+    assert join(admin_client, 'S2').json['data']['position'] == 1
+    assert join(admin_client, 'S3').json['data']['position'] == 2
+    assert join(admin_client, 'S3').status_code == 400
+    assert join(admin_client, 'S1').status_code == 400  # 已选上
+    assert position(admin_client, 'S1')['status'] == 'enrolled'
+    assert position(admin_client, 'S4') == {'course_id': 1, 'status': 'none', 'position': None, 'waiting': 2}
+
+    admin_client.delete('/api/waitlist', json={'student_id': 'S2', 'course_id': 1})
+    assert position(admin_client, 'S3')['position'] == 1
+
+
+def test_drop_promotes_next_eligible_student(admin_client, full_course):
+    join(admin_client, 'S2')
+    join(admin_client, 'S3')
+    # S2 在同一时间段已有其他课程，递补时跳过
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("INSERT INTO student_courses VALUES (2, 2)")
+    conn.commit()
+    conn.close()
+
+    admin_client.delete('/api/student-courses', json={'student_id': 'S1', 'course_id': 1})
+    waitlist_worker.wait_idle()
+
+    assert position(admin_client, 'S3')['status'] == 'enrolled'
+    assert position(admin_client, 'S2') == {'course_id': 1, 'status': 'waiting', 'position': 1, 'waiting': 1}
+
+
+def test_capacity_increase_promotes(admin_client, full_course):
+    join(admin_client, 'S2')
+    course = next(c for c in admin_client.get('/api/courses').json['data'] if c['id'] == 1)
+    course['capacity'] = 2
+    admin_client.put('/api/courses/1', json=course)
+    waitlist_worker.wait_idle()
+    assert position(admin_client, 'S2')['status'] == 'enrolled'
@@ -0,0 +1,128 @@
+import sqlite3
+import threading
+
+import pytest
+
+from mypy.config import DATABASE_PATH
+from mypy.writer import WriteQueue
+
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / 'writer.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (name TEXT UNIQUE)')
+    conn.close()
+    queue = WriteQueue(path, window=0.05)
+    yield queue
+    queue.stop()
+
+
+def names(queue):
+    conn = sqlite3.connect(queue.path)
+    try:
+        return sorted(row[0] for row in conn.execute('SELECT name FROM items'))
+    finally:
+        conn.close()
+
+
+def insert(name):
+    def job(conn):
+        conn.execute('INSERT INTO items VALUES (?)', (name,))
+        conn.commit()  # 由写线程统一提交，这里不生效
+        return name
+    return job
+
+
+def test_concurrent_jobs_share_one_commit(writer):
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(writer.run(insert(f'n{i}'))))
+               for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == sorted(f'n{i}' for i in range(20))
+    assert len(names(writer)) == 20
+    assert writer.groups < 20 and writer.jobs == 20
+
+
+def test_failed_job_only_rolls_back_itself(writer):
+    writer.run(insert('a'))
+    with pytest.raises(sqlite3.IntegrityError):
+        writer.run(insert('a'))
+
+    def rolled_back(conn):
+        conn.execute("INSERT INTO items VALUES ('b')")
+        conn.rollback()
+        conn.execute("INSERT INTO items VALUES ('c')")
+
+    writer.run(rolled_back)
+    assert writer.run(insert('d'), failed=lambda result: True) == 'd'
+    assert names(writer) == ['a', 'c']
+
+
+def test_rolled_back_job_does_not_invalidate_its_tables(writer, monkeypatch):
+    from mypy import db_operations
+    monkeypatch.setattr(db_operations.query_cache, 'enabled', True)
+    invalidated = []
+    monkeypatch.setattr(db_operations.query_cache, 'invalidate', lambda *tables: invalidated.append(set(tables)))
+    queue = WriteQueue(writer.path, window=0.05)
+    try:
+        queue.run(lambda conn: conn.execute('CREATE TABLE other (name TEXT)'))
+        queue.run(insert('a'))
+        invalidated.clear()
+
+        def other(conn):
+            conn.execute("INSERT INTO other VALUES ('x')")
+        queue.run(other, failed=lambda result: True)
+        queue.run(insert('b'))
+    finally:
+        queue.stop()
+    assert invalidated and all(tables == {'items'} for tables in invalidated)
+
+
+def test_disabled_queue_runs_inline(tmp_path, writer):
+    inline = WriteQueue(writer.path, enabled=False)
+    inline.run(insert('x'))
+    assert names(writer) == ['x'] and inline.groups == 1
+
+
+def test_exclusive_job_runs_alone_with_own_transaction(writer):
+    def exclusive(conn):
+        assert not conn.in_transaction
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute("INSERT INTO items VALUES ('x')")
+        conn.commit()
+        return 'x'
+
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(writer.run(insert(f'n{i}'))))
+               for i in range(10)]
+    threads.append(threading.Thread(target=lambda: results.append(writer.run_exclusive(exclusive))))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 11
+    assert len(names(writer)) == 11
+
+
+def test_login_only_writes_when_creating_profile(client, monkeypatch):
+    from mypy.writer import write_queue
+    account = {'username': '王五', 'password': 'pw', 'role': 'teacher'}
+    assert client.post('/register', json=account).json['success']
+    assert client.post('/register', json=account).status_code == 400
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.execute("DELETE FROM teachers WHERE name = '王五'")
+    conn.commit()
+    conn.close()
+
+    writes = []
+    original = write_queue.run
+    monkeypatch.setattr(write_queue, 'run', lambda *args, **kwargs: writes.append(1) or original(*args, **kwargs))
+    assert client.post('/login', json=account).json['success']
+    assert len(writes) == 1  # 补建教师档案
+    assert client.post('/login', json=account).json['success']
+    assert len(writes) == 1